@@ -0,0 +1,118 @@
+# NumPy-backed batch evaluation of candidate placements.
+#
+# Instead of scoring candidate boards one at a time, every candidate board for
+# a piece is built as one (numCandidates, BOARDWIDTH, BOARDHEIGHT) boolean
+# array (indexed [candidate, x, y] like the board[x][y] lists) and the four
+# heuristics are computed for all of them with array operations. The weighted
+# features are added up with broadcasting array operations, one feature at a
+# time in the order the scalar search adds them, so one candidate tensor can
+# be scored against a whole population of weight vectors at once.
+#
+# Candidates are generated in the same order as getAllMoves/getBestMove in
+# engine.py and ties keep the first candidate, so the best move
+# matches the scalar path.
+
+import numpy as np
+
+from bitboard import BOARDWIDTH, BOARDHEIGHT
+
+COLUMNBITS = np.arange(BOARDWIDTH)
+
+
+def boardToArray(board):
+	# (BOARDWIDTH, BOARDHEIGHT) boolean array of a bitboard.Board
+	rows = np.array(board.rows)
+	return (rows[None, :] >> COLUMNBITS[:, None] & 1).astype(bool)
+
+
+def getLandingRows(heights, placement):
+	# landing y of the placement in every one of its legal columns at once
+	columns = np.array(placement[2])
+	profile = np.array(placement[3])
+	stackTops = BOARDHEIGHT - 1 - heights[columns[:, None] + profile[None, :, 0]]
+	return columns, (stackTops - profile[None, :, 1]).min(axis=1)
+
+
+def getAllMoves(board, piece, placements, orientations):
+	# Build every candidate board for the piece, trying the rotations of
+	# orientations[shape] in order. Returns (boards, moves) where boards is a
+	# (numCandidates, BOARDWIDTH, BOARDHEIGHT) boolean array and moves the
+	# matching list of (rotation, x, y) placements.
+	heights = np.array(board.heights)
+	rotations = placements[piece['shape']]
+
+	moves = []
+	cellXs = []
+	cellYs = []
+	for rotation in orientations[piece['shape']]:
+		placement = rotations[rotation]
+		columns, ys = getLandingRows(heights, placement)
+		valid = ys + placement[4] >= 0 # drop placements sticking out of the top
+		columns = columns[valid]
+		ys = ys[valid]
+		cells = np.array(placement[1])
+		cellXs.append(columns[:, None] + cells[None, :, 0])
+		cellYs.append(ys[:, None] + cells[None, :, 1])
+		moves.extend(zip([rotation] * len(columns), columns.tolist(), ys.tolist()))
+
+	boards = np.repeat(boardToArray(board)[None], len(moves), axis=0)
+	if moves:
+		cellXs = np.concatenate(cellXs)
+		cellYs = np.concatenate(cellYs)
+		candidates = np.repeat(np.arange(len(moves)), cellXs.shape[1])
+		boards[candidates, cellXs.ravel(), cellYs.ravel()] = True
+	return boards, moves
+
+
+def getFeatures(boards):
+	# (numBoards, 4) array of (aggregate height, complete lines, holes,
+	# bumpiness) for a (numBoards, BOARDWIDTH, BOARDHEIGHT) boolean array
+	filled = boards.any(axis=2)
+	heights = np.where(filled, BOARDHEIGHT - boards.argmax(axis=2), 0)
+	covered = np.logical_or.accumulate(boards, axis=2)
+
+	aggHeight = heights.sum(axis=1)
+	completeLines = boards.all(axis=1).sum(axis=1)
+	holes = (covered & ~boards).sum(axis=(1, 2))
+	bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+	return np.stack([aggHeight, completeLines, holes, bumpiness], axis=1)
+
+
+def evaluateBoards(boards, weights):
+	# Score every board. weights is either one weight vector, giving
+	# numBoards scores, or a (numIndividuals, 4) array, giving a
+	# (numIndividuals, numBoards) array of scores.
+	return scoreFeatures(getFeatures(boards), weights)
+
+
+def scoreFeatures(features, weights):
+	# The weighted features are added up from the left like evaluateBoard
+	# does. A BLAS matrix product may add them in another order, and the
+	# different rounding then breaks exact ties unlike the scalar search.
+	weights = np.asarray(weights, dtype=float)
+	features = features.T.astype(float)
+	scores = weights[..., 0, None] * features[0]
+	for i in range(1, len(features)):
+		scores = scores + weights[..., i, None] * features[i]
+	return scores
+
+
+def getBestMove(board, piece, weights, placements, orientations, phaseStats=None):
+	# Vectorized counterpart of getBestMove in engine.py.
+	# Returns the (rotation, x, y) of the best placement for one weight
+	# vector, or a list with the best placement for every row of a
+	# (numIndividuals, 4) weights array. None means the piece can't be placed.
+	# The candidates scored are added to phaseStats if it is given.
+	boards, moves = getAllMoves(board, piece, placements, orientations)
+	if phaseStats is not None:
+		phaseStats.addCandidates(len(moves))
+	weights = np.asarray(weights, dtype=float)
+	if not moves:
+		return None if weights.ndim == 1 else [None] * len(weights)
+
+	scores = evaluateBoards(boards, weights)
+	best = scores.argmax(axis=-1) # argmax keeps the first of equal scores
+	if weights.ndim == 1:
+		return moves[best]
+	return [moves[i] for i in best]
@@ -0,0 +1,215 @@
+# Lockstep batched simulation of many independent games.
+#
+# runGames advances every game of a whole population together, one piece per
+# step, instead of playing thousands of games one after another in Python.
+# The games are kept as a struct of arrays: all boards live in one
+# (numGames, BOARDWIDTH, BOARDHEIGHT) boolean array, with matching arrays for
+# the column heights, row fill counts, feature totals, scores and piece
+# counts. Each step scores every candidate of all games holding the same
+# shape at once: as in bitboard.Board.getPlacementFeatures, the features of a
+# candidate are worked out from the column heights and row counts, so no
+# candidate board is ever built. Winners are applied and lines cleared for the
+# whole batch, and finished games are dropped from the active batch.
+#
+# Games replay pre-generated piece sequences (see sequences.py) and every game
+# plays exactly as engine.playGame would with the same sequence: candidates
+# are ranked in the same order and ties keep the first one.
+#
+# BatchedEvaluator evaluates a population with runGames for the trainer.
+# It is a parallel.Evaluator, so the games and pieces it plays are counted
+# in the trainer's metrics like those of a worker pool.
+
+import os, time
+import numpy as np
+
+import parallel
+from bitboard import BOARDWIDTH, BOARDHEIGHT
+
+
+def buildShapeTables(placements, orientations):
+	# For every shape, flatten all (rotation, x) candidates of the placement
+	# table into arrays, in the order the rotations of orientations[shape] and
+	# then x are searched in. Profiles and rows of narrower rotations are
+	# padded to four entries, with a weight of 0 for the padding.
+	tables = {}
+	for shape in placements:
+		columns = {'x': [], 'top': [],
+				   'cellX': [], 'cellY': [],
+				   'profileX': [], 'profileBottom': [], 'profileTop': [], 'profileWeight': [],
+				   'rowY': [], 'rowCells': []}
+		for rotation in orientations[shape]:
+			mask, cells, xs, profile, top = placements[shape][rotation]
+			pieceRows = [(ty, len([cy for cx, cy in cells if cy == ty])) for ty, rowMask in mask[0]]
+			padding = 4 - len(profile)
+			rowPadding = 4 - len(pieceRows)
+			for x in xs:
+				columns['x'].append(x)
+				columns['top'].append(top)
+				columns['cellX'].append([x + tx for tx, ty in cells])
+				columns['cellY'].append([ty for tx, ty in cells])
+				columns['profileX'].append([x + tx for tx, bottomY, topY in profile] + [x + profile[0][0]] * padding)
+				columns['profileBottom'].append([bottomY for tx, bottomY, topY in profile] + [profile[0][1]] * padding)
+				columns['profileTop'].append([topY for tx, bottomY, topY in profile] + [profile[0][2]] * padding)
+				columns['profileWeight'].append([1] * len(profile) + [0] * padding)
+				columns['rowY'].append([ty for ty, count in pieceRows] + [pieceRows[0][0]] * rowPadding)
+				columns['rowCells'].append([count for ty, count in pieceRows] + [0] * rowPadding)
+		tables[shape] = dict((name, np.array(values)) for name, values in columns.items())
+	return tables
+
+
+def getColumnHeights(boards):
+	return np.where(boards.any(axis=2), BOARDHEIGHT - boards.argmax(axis=2), 0)
+
+
+def removeCompleteLines(boards):
+	# Clear the full rows of every board at once: a stable sort moves the
+	# full rows to the top (keeping the order of the others), then they are
+	# blanked. Returns the number of lines removed from each board.
+	full = boards.all(axis=1)
+	numLinesRemoved = full.sum(axis=1)
+	if numLinesRemoved.any():
+		order = np.argsort(~full, axis=1, kind='stable')
+		boards[:] = np.take_along_axis(boards, order[:, None, :], axis=2)
+		boards &= (np.arange(BOARDHEIGHT)[None, :] >= numLinesRemoved[:, None])[:, None, :]
+	return numLinesRemoved
+
+
+def playShape(heights, rowCounts, totals, table, weights):
+	# Find the best move of every game in a group holding the same shape.
+	# totals holds each game's (aggregate height, holes, bumpiness). Returns
+	# the index of each game's best candidate and whether it had a legal move.
+	numGames = len(heights)
+	numCandidates = len(table['x'])
+	games = np.arange(numGames)[:, None, None]
+
+	columnHeights = heights[:, table['profileX']]
+	ys = (BOARDHEIGHT - 1 - columnHeights - table['profileBottom']).min(axis=2)
+	valid = ys + table['top'] >= 0
+	pieceYs = ys[:, :, None]
+
+	# every covered column grows to the top of the piece and gains a hole for
+	# each empty cell between the piece and its old top
+	weight = table['profileWeight']
+	newHeights = BOARDHEIGHT - pieceYs - table['profileTop']
+	aggHeight = totals[:, 0, None] + ((newHeights - columnHeights) * weight).sum(axis=2)
+	holes = totals[:, 1, None] + ((BOARDHEIGHT - columnHeights - pieceYs - table['profileBottom'] - 1) * weight).sum(axis=2)
+
+	allHeights = np.repeat(heights[:, None], numCandidates, axis=1)
+	allHeights[games, np.arange(numCandidates)[None, :, None], table['profileX'][None]] = newHeights
+	bumpiness = np.abs(np.diff(allHeights, axis=2)).sum(axis=2)
+
+	rowYs = np.clip(pieceYs + table['rowY'], 0, BOARDHEIGHT - 1)
+	completeLines = ((rowCounts[games, rowYs] + table['rowCells'] == BOARDWIDTH) & (table['rowCells'] > 0)).sum(axis=2)
+
+	# the weighted features are added up from the left like evaluateBoard,
+	# so exact ties round the same way as in the scalar search
+	scores = weights[:, None, 0] * aggHeight
+	for weight, values in zip(weights.T[1:], (completeLines, holes, bumpiness)):
+		scores = scores + weight[:, None] * values
+	scores[~valid] = -np.inf
+
+	# candidates are in the order getBestMove tries them and argmax keeps the
+	# first of equal scores, like getBestMove does
+	best = scores.argmax(axis=1)
+
+	return best, ys[np.arange(numGames), best], valid.any(axis=1)
+
+
+def runGames(weights, sequences, pieceCodes, placements, orientations, spawnX, spawnY, maxPieces):
+	# Play every sequence of piece codes (see sequences.py) with every weight
+	# vector in lockstep, stopping after maxPieces pieces like runGame.
+	# pieceCodes maps codes to (shape, rotation), pieces spawn at
+	# (spawnX, spawnY) and their moves are searched in the order of
+	# orientations (see bitboard.buildOrientationTable). Returns two
+	# (numWeights, numSequences) arrays: the lines every game cleared and
+	# the pieces it played.
+	weights = np.asarray(weights, dtype=float)
+	numSequences = len(sequences)
+	numGames = len(weights) * numSequences
+	gameWeights = np.repeat(weights, numSequences, axis=0)
+	gameSequences = np.tile(np.arange(numSequences), len(weights))
+
+	length = min([maxPieces] + [len(sequence) for sequence in sequences])
+	codes = np.array([bytearray(sequence[:length]) for sequence in sequences], dtype=np.uint8).reshape(numSequences, length)
+
+	tables = buildShapeTables(placements, orientations)
+	shapes = sorted(tables)
+	codeShapes = np.array([shapes.index(piece[0]) if piece else -1 for piece in pieceCodes])
+	spawnCells = [placements[piece[0]][piece[1]][1] if piece else ((0, 0),) * 4 for piece in pieceCodes]
+	spawnXs = spawnX + np.array([[tx for tx, ty in cells] for cells in spawnCells])
+	spawnYs = spawnY + np.array([[ty for tx, ty in cells] for cells in spawnCells])
+
+	boards = np.zeros((numGames, BOARDWIDTH, BOARDHEIGHT), dtype=bool)
+	scores = np.zeros(numGames, dtype=int)
+	pieces = np.zeros(numGames, dtype=int) # index of each game's current piece
+
+	active = np.arange(numGames)
+	while len(active):
+		# the game is over when the new piece doesn't fit at its spawn position
+		activeCodes = codes[gameSequences[active], pieces[active]]
+		ys = spawnYs[activeCodes]
+		blocked = (boards[active[:, None], spawnXs[activeCodes], np.maximum(ys, 0)] & (ys >= 0)).any(axis=1)
+		active = active[~blocked]
+		activeCodes = activeCodes[~blocked]
+		if not len(active):
+			break
+
+		activeBoards = boards[active]
+		heights = getColumnHeights(activeBoards)
+		rowCounts = activeBoards.sum(axis=1)
+		covered = np.logical_or.accumulate(activeBoards, axis=2)
+		totals = np.stack([heights.sum(axis=1),
+						   (covered & ~activeBoards).sum(axis=(1, 2)),
+						   np.abs(np.diff(heights, axis=1)).sum(axis=1)], axis=1)
+		shapeCodes = codeShapes[activeCodes]
+
+		for code, shape in enumerate(shapes):
+			group = np.flatnonzero(shapeCodes == code)
+			if not len(group):
+				continue
+			table = tables[shape]
+			best, ys, moved = playShape(heights[group], rowCounts[group], totals[group], table, gameWeights[active[group]])
+			# games without a legal move keep their board, like runGame
+			group = group[moved]
+			activeBoards[group[:, None], table['cellX'][best[moved]], ys[moved, None] + table['cellY'][best[moved]]] = True
+
+		scores[active] += removeCompleteLines(activeBoards)
+		boards[active] = activeBoards
+
+		pieces[active] += 1
+		active = active[pieces[active] < length]
+
+	return scores.reshape(len(weights), numSequences), pieces.reshape(len(weights), numSequences)
+
+
+class BatchedEvaluator(parallel.Evaluator):
+
+	# Plays the games of evaluate in this process with runGames, getting the
+	# piece codes of every seed's game from getSequence(seed). The other
+	# arguments are passed on to runGames. There are no workers to start or
+	# stop, and no playGames: every evaluation is one batched simulation.
+	def __init__(self, getSequence, pieceCodes, placements, orientations, spawnX, spawnY, maxPieces):
+		parallel.Evaluator.__init__(self)
+		self.getSequence = getSequence
+		self.gameArgs = (pieceCodes, placements, orientations, spawnX, spawnY, maxPieces)
+
+	def start(self):
+		return self
+
+	def close(self):
+		pass
+
+	def terminate(self):
+		pass
+
+	def evaluate(self, individuals, seeds):
+		# Return the fitness tuple (average score over one game per seed) of
+		# every individual, counting the games, the pieces played and the
+		# seconds this process spent playing them
+		start = time.time()
+		scores, pieces = runGames(individuals, [self.getSequence(seed) for seed in seeds], *self.gameArgs)
+		self.addCounters({'games': pieces.size, 'pieces': int(pieces.sum())})
+		pid = os.getpid()
+		self.busy[pid] = self.busy.get(pid, 0.0) + time.time() - start
+
+		return [(float(sum(gameScores)) / len(seeds),) for gameScores in scores]
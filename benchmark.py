@@ -0,0 +1,276 @@
+# Benchmarks for the game engine.
+#
+# lookahead plays the same seeded games at search depth 1 and 2 and reports
+# pieces per second and lines per game for both, so the price of the
+# depth-2 search can be weighed against how much better it plays.
+#
+# suite times the hot paths: getAllMoves, scoring a placement and
+# removeCompleteLines on fixed board fixtures, full games at fixed seeds and
+# one GA generation of a small population (needs DEAP). Every result is a
+# throughput (operations per second, higher is better). Results can be saved
+# as JSON and compared against a saved baseline, which flags every benchmark
+# that got slower by more than a tolerance.
+
+import random, time, argparse, json, sys, platform
+import engine, sequences, bitboard
+
+WEIGHTS = (-.516, .76, -.356, -.1844) # tetris.py's weight vector
+
+# Board fixtures, bottom rows only ('#' filled, '.' empty), from a fresh game
+# to a stack about to top out
+FIXTURES = {
+	'empty': [],
+	'midGame': [
+		'......#...',
+		'.#...###..',
+		'####.####.',
+		'####.#####',
+		'#####.####',
+		'####.#####',
+	],
+	'nearDeath': [
+		'...#......',
+		'..###.....',
+		'.####.#...',
+		'.######..#',
+		'########.#',
+		'###.####.#',
+		'#.######.#',
+		'########.#',
+		'####.###.#',
+		'########.#',
+		'##.#####.#',
+		'########.#',
+		'######.#.#',
+		'########.#',
+		'#.######.#',
+		'########.#',
+		'####.###.#',
+	],
+	'holeRiddled': [
+		'#.#.#.#.#.',
+		'.#.#.#.#.#',
+		'##..##..##',
+		'#.#.#.#.#.',
+		'.#.#.#.#.#',
+		'#..##..##.',
+		'.#.#.#.#.#',
+		'#.#.#.#.#.',
+		'##.##.##.#',
+		'#.#.#.#.#.',
+	],
+}
+
+
+# Play numGames seeded games (seeds firstSeed, firstSeed + 1, ...) at the
+# given depth and return (lines per game, pieces per second)
+def benchmarkDepth(weights, depth, numGames, maxPieces, firstSeed=0, topK=engine.LOOKAHEADTOPK):
+	lines = 0
+	pieces = 0
+	start = time.time()
+	for seed in range(firstSeed, firstSeed + numGames):
+		sequence = sequences.generateSequence(random.Random(seed), engine.PIECES, maxPieces + 1)
+		score, gamePieces = engine.playGame(weights, sequence, maxPieces, depth=depth, topK=topK)
+		lines += score
+		pieces += gamePieces
+	elapsed = time.time() - start
+	return float(lines) / numGames, pieces / elapsed if elapsed else 0.0
+
+
+def benchmarkLookahead(weights=WEIGHTS, numGames=5, maxPieces=1000, firstSeed=0, topK=engine.LOOKAHEADTOPK):
+	print('Depth  Lines/game  Pieces/sec')
+	results = {}
+	for depth in (1, 2):
+		results[depth] = benchmarkDepth(weights, depth, numGames, maxPieces, firstSeed, topK)
+		print('%5d  %10.1f  %10.0f' % ((depth,) + results[depth]))
+	if results[2][1]:
+		print('Depth 2 plays at %.1fx the cost of depth 1 (top %d placements searched)' % (
+			results[1][1] / results[2][1], topK))
+	return results
+
+
+def makeBoard(lines):
+	board = engine.getBlankBoard()
+	for i, line in enumerate(lines):
+		y = engine.BOARDHEIGHT - len(lines) + i
+		for x, cell in enumerate(line):
+			if cell == '#':
+				board.setCell(x, y, 0)
+	return board
+
+
+# Best throughput of `repeat` runs of run(), which does `ops` operations.
+# setup() is called before every run, untimed.
+def timeOps(run, ops, repeat, setup=None):
+	best = None
+	for i in range(repeat):
+		if setup is not None:
+			setup()
+		start = time.time()
+		run()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return ops / best if best else float('inf')
+
+
+def benchmarkGetAllMoves(board, iterations, repeat):
+	pieces = [{'shape': shape, 'rotation': 0} for shape in sorted(engine.PIECES)]
+	def run():
+		for i in range(iterations):
+			for piece in pieces:
+				engine.getAllMoves(board, piece)
+	return timeOps(run, iterations * len(pieces), repeat)
+
+
+def benchmarkEvaluatePlacement(board, iterations, repeat):
+	# every drop of every piece scored as findBestMove scores it, working
+	# out the features of the board it leaves; the landing rows are found
+	# untimed
+	drops = []
+	for shape in sorted(engine.PIECES):
+		placements = engine.PLACEMENTS[shape]
+		for rotation in engine.ORIENTATIONS[shape]:
+			placement = placements[rotation]
+			for x in placement[2]:
+				y = bitboard.getLandingRow(board.heights, placement, x)
+				if y + placement[4] >= 0:
+					drops.append((placement, x, y))
+	a, b, c, d = WEIGHTS
+	def run():
+		for i in range(iterations):
+			for placement, x, y in drops:
+				aggHeight, completeLines, holes, bumpiness = board.getPlacementFeatures(placement, x, y)
+				a * aggHeight + b * completeLines + c * holes + d * bumpiness
+	return timeOps(run, iterations * len(drops), repeat)
+
+
+def benchmarkRemoveCompleteLines(board, iterations, repeat):
+	# clearing the fixture with its bottom row completed, on copies made
+	# before every run so only the clear is timed
+	full = board.copy()
+	for x in range(engine.BOARDWIDTH):
+		full.setCell(x, engine.BOARDHEIGHT - 1, 0)
+	copies = []
+	def setup():
+		copies[:] = [full.copy() for i in range(iterations)]
+	def run():
+		for copy in copies:
+			engine.removeCompleteLines(copy)
+	return timeOps(run, iterations, repeat, setup)
+
+
+def benchmarkGames(weights, numGames, maxPieces, repeat):
+	# pieces per second over full games at seeds 0 to numGames - 1
+	return max(benchmarkDepth(weights, 1, numGames, maxPieces)[1] for i in range(repeat))
+
+
+def benchmarkGeneration(popSize, numGames, maxPieces, repeat):
+	# Individuals evaluated per second over one GA generation (evaluating
+	# the initial population, breeding and evaluating the offspring), played
+	# in this process. The population is the same in every run.
+	import trainer # imported here so the other benchmarks don't need DEAP
+	from deap import algorithms
+	seeds = tuple(range(numGames))
+	evaluated = []
+	def run():
+		pop = trainer.toolbox.population(n=popSize)
+		offspring = algorithms.varOr(pop, trainer.toolbox, popSize, 0.5, 0.2)
+		invalid = [ind for ind in pop + offspring if not ind.fitness.valid]
+		for ind in invalid:
+			ind.fitness.values = trainer.evaluate(ind, seeds)
+		trainer.toolbox.select(offspring + pop, k=popSize)
+		evaluated.append(len(invalid))
+
+	state = random.getstate()
+	savedMaxPieces = trainer.MAXPIECES
+	trainer.MAXPIECES = maxPieces
+	try:
+		best = 0.0
+		for i in range(repeat):
+			random.seed(0)
+			best = max(best, timeOps(run, 1, 1) * evaluated[-1])
+	finally:
+		trainer.MAXPIECES = savedMaxPieces
+		random.setstate(state)
+	return best
+
+
+# Run every benchmark of the suite, printing each result as it comes, and
+# return {benchmark name: operations per second}. quick cuts the work down
+# for a fast check.
+def runSuite(quick=False, repeat=3):
+	scale = 1 if quick else 10
+	results = {}
+	def report(name, unit, throughput):
+		results[name] = throughput
+		print('%-32s %12.0f %s/s' % (name, throughput, unit))
+
+	for name in sorted(FIXTURES):
+		board = makeBoard(FIXTURES[name])
+		report('getAllMoves/' + name, 'calls', benchmarkGetAllMoves(board, 20 * scale, repeat))
+		report('evaluatePlacement/' + name, 'placements', benchmarkEvaluatePlacement(board, 20 * scale, repeat))
+		report('removeCompleteLines/' + name, 'clears', benchmarkRemoveCompleteLines(board, 500 * scale, repeat))
+	report('runGame', 'pieces', benchmarkGames(WEIGHTS, 3, 100 * scale, repeat))
+	try:
+		throughput = benchmarkGeneration(10 if quick else 20, 2, 50 * scale, repeat)
+	except ImportError as e:
+		print('%-32s skipped (%s)' % ('gaGeneration', e))
+	else:
+		report('gaGeneration', 'individuals', throughput)
+	return results
+
+
+def saveResults(path, results):
+	with open(path, 'w') as f:
+		json.dump({'python': platform.python_version(), 'results': results}, f, indent=1, sort_keys=True)
+
+
+def loadResults(path):
+	with open(path) as f:
+		return json.load(f)['results']
+
+
+# Print every benchmark's change against the baseline and return the names
+# of the ones slower than it by more than tolerance (a fraction)
+def compareResults(results, baseline, tolerance=0.1):
+	regressions = []
+	print('%-32s %12s %12s %8s' % ('Benchmark', 'Baseline', 'Now', 'Change'))
+	for name in sorted(set(results) | set(baseline)):
+		if name not in results or name not in baseline:
+			print('%-32s %s' % (name, 'only in the baseline' if name in baseline else 'not in the baseline'))
+			continue
+		change = results[name] / baseline[name] - 1 if baseline[name] else 0.0
+		flag = ''
+		if change < -tolerance:
+			flag = '  REGRESSION'
+			regressions.append(name)
+		print('%-32s %12.0f %12.0f %+7.1f%%%s' % (name, baseline[name], results[name], change * 100, flag))
+	return regressions
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the Tetris engine')
+	parser.add_argument('benchmark', choices=['lookahead', 'suite'], help='benchmark to run')
+	parser.add_argument('--games', type=int, default=5, help='games played per configuration')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+	parser.add_argument('--max-pieces', type=int, default=1000, help='piece cap per game')
+	parser.add_argument('--top-k', type=int, default=engine.LOOKAHEADTOPK, help='placements the depth-2 search looks past')
+	parser.add_argument('--weights', type=float, nargs=4, default=list(WEIGHTS),
+						metavar=('HEIGHT', 'LINES', 'HOLES', 'BUMPINESS'), help='weight vector to play with')
+	parser.add_argument('--quick', action='store_true', help='suite: do less work per benchmark, for a fast check')
+	parser.add_argument('--repeat', type=int, default=3, help='suite: runs per benchmark, the fastest counts')
+	parser.add_argument('--save', default=None, help='suite: write the results to this JSON file')
+	parser.add_argument('--baseline', default=None, help='suite: compare against results saved with --save')
+	parser.add_argument('--tolerance', type=float, default=0.1, help='suite: slowdown flagged as a regression (0.1 = 10%%)')
+	args = parser.parse_args()
+	if args.benchmark == 'lookahead':
+		benchmarkLookahead(args.weights, args.games, args.max_pieces, args.seed, args.top_k)
+	elif args.benchmark == 'suite':
+		results = runSuite(args.quick, args.repeat)
+		if args.save is not None:
+			saveResults(args.save, results)
+		if args.baseline is not None:
+			print('')
+			if compareResults(results, loadResults(args.baseline), args.tolerance):
+				sys.exit(1)
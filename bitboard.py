@@ -0,0 +1,388 @@
+# Compact bitboard representation of the Tetris board.
+#
+# Each row is stored as a BOARDWIDTH-bit integer (bit x set means column x is
+# filled) and row 0 is the top of the board, the same orientation as the
+# board[x][y] lists used by tetris.py and trainer.py. Collision, placement,
+# line clearing and the evaluation features are all done with bitwise
+# operations on whole rows instead of walking the 200 cells one at a time.
+
+BOARDWIDTH = 10
+BOARDHEIGHT = 20
+BLANK = '.'
+
+FULLROW = (1 << BOARDWIDTH) - 1
+FILLED = 0 # color reported for filled cells on boards that don't track colors
+
+# number of set bits in every possible row
+POPCOUNT = [bin(i).count('1') for i in range(1 << BOARDWIDTH)]
+
+
+def buildPieceMasks(pieces):
+	# Convert piece templates (indexed as template[y][x]) into, for every
+	# shape and rotation, a tuple of (rows, minX, maxX) where rows is a tuple
+	# of (templateY, rowMask) pairs for the occupied template rows and
+	# minX/maxX are the leftmost and rightmost occupied template columns.
+	masks = {}
+	for shape in pieces:
+		masks[shape] = []
+		for template in pieces[shape]:
+			rows = []
+			allColumns = 0
+			for y in range(len(template)):
+				mask = 0
+				for x in range(len(template[y])):
+					if template[y][x] != BLANK:
+						mask |= 1 << x
+				if mask:
+					rows.append((y, mask))
+					allColumns |= mask
+			minX = (allColumns & -allColumns).bit_length() - 1
+			maxX = allColumns.bit_length() - 1
+			masks[shape].append((tuple(rows), minX, maxX))
+	return masks
+
+
+def buildPlacementTable(pieceMasks):
+	# For every shape and rotation precompute what move generation needs:
+	#   mask    - the (rows, minX, maxX) piece mask used for collision/placement
+	#   cells   - the occupied (templateX, templateY) offsets
+	#   columns - every distinct legal piece x, from left to right
+	#   profile - (templateX, lowest occupied templateY, highest occupied
+	#             templateY) for each occupied column
+	#   top     - the highest occupied templateY
+	table = {}
+	for shape in pieceMasks:
+		table[shape] = []
+		for mask in pieceMasks[shape]:
+			rows, minX, maxX = mask
+			cells = []
+			for ty, rowMask in rows:
+				for tx in range(minX, maxX + 1):
+					if rowMask >> tx & 1:
+						cells.append((tx, ty))
+			profile = []
+			for tx in range(minX, maxX + 1):
+				columnYs = [ty for cx, ty in cells if cx == tx]
+				profile.append((tx, max(columnYs), min(columnYs)))
+			columns = range(-minX, BOARDWIDTH - maxX)
+			table[shape].append((mask, tuple(cells), tuple(columns), tuple(profile), rows[0][0]))
+	return table
+
+
+def getCanonicalCells(placement):
+	# the cells of a placement table entry relative to its bounding box, in
+	# sorted order, so equal orientations compare equal whatever their
+	# offset in the template
+	cells = placement[1]
+	minX = min(tx for tx, ty in cells)
+	minY = min(ty for tx, ty in cells)
+	return tuple(sorted((tx - minX, ty - minY) for tx, ty in cells))
+
+
+def buildOrientationTable(placementTable):
+	# For every shape, the rotations of its distinct orientations in the
+	# fixed order moves are searched in. A rotation whose canonical cells
+	# repeat an earlier rotation's would only produce the same boards again,
+	# so it is left out.
+	table = {}
+	for shape in placementTable:
+		seen = set()
+		rotations = []
+		for rotation, placement in enumerate(placementTable[shape]):
+			cells = getCanonicalCells(placement)
+			if cells not in seen:
+				seen.add(cells)
+				rotations.append(rotation)
+		table[shape] = tuple(rotations)
+	return table
+
+
+def getLandingRow(heights, placement, px):
+	# Return the y a piece lands at when hard dropped in column px, worked
+	# out from the column heights instead of probing one row at a time
+	py = BOARDHEIGHT
+	for tx, bottomY, topY in placement[3]:
+		y = BOARDHEIGHT - 1 - heights[px + tx] - bottomY
+		if y < py:
+			py = y
+	return py
+
+
+def compactRows(values, cleared, top):
+	# values (one per row) without the cleared rows, the runs of rows between
+	# them moved down in one slice each, under the new top rows
+	start = 0
+	for y in cleared:
+		top += values[start:y]
+		start = y + 1
+	top += values[start:]
+	return top
+
+
+class Board(object):
+	# rows holds one integer per board row, colors is either None or a list of
+	# rows of per-cell colors (only the pygame renderer needs those).
+	#
+	# Alongside the rows the board keeps the state the heuristics need, and
+	# keeps it up to date as pieces are placed and lines are cleared:
+	#   heights, holes  - height and number of holes of every column
+	#   rowCounts       - number of filled cells in every row
+	#   aggHeight, numHoles, bumpiness, completeLines - the feature totals
+	__slots__ = ('rows', 'colors', 'heights', 'holes', 'rowCounts',
+				 'aggHeight', 'numHoles', 'bumpiness', 'completeLines')
+
+	def __init__(self, rows=None, colors=None):
+		if rows is None:
+			rows = [0] * BOARDHEIGHT
+		self.rows = rows
+		self.colors = colors
+		self.recount()
+
+	def copy(self):
+		board = Board.__new__(Board)
+		board.rows = self.rows[:]
+		board.colors = None
+		if self.colors is not None:
+			board.colors = [row[:] for row in self.colors]
+		board.heights = self.heights[:]
+		board.holes = self.holes[:]
+		board.rowCounts = self.rowCounts[:]
+		board.aggHeight = self.aggHeight
+		board.numHoles = self.numHoles
+		board.bumpiness = self.bumpiness
+		board.completeLines = self.completeLines
+		return board
+
+	def recount(self):
+		# rebuild all of the tracked state from the rows
+		self.heights = [0] * BOARDWIDTH
+		self.holes = [0] * BOARDWIDTH
+		for x in range(BOARDWIDTH):
+			self._recountColumn(x)
+		self.rowCounts = [POPCOUNT[row] for row in self.rows]
+		self.completeLines = self.rowCounts.count(BOARDWIDTH)
+		self._updateTotals()
+
+	def _recountColumn(self, x):
+		bit = 1 << x
+		rows = self.rows
+		y = 0
+		while y < BOARDHEIGHT and not rows[y] & bit:
+			y += 1
+		self.heights[x] = BOARDHEIGHT - y
+		holes = 0
+		while y < BOARDHEIGHT:
+			if not rows[y] & bit:
+				holes += 1
+			y += 1
+		self.holes[x] = holes
+
+	def _updateTotals(self):
+		heights = self.heights
+		self.aggHeight = sum(heights)
+		self.numHoles = sum(self.holes)
+		bumpiness = 0
+		for i in range(1, BOARDWIDTH):
+			bumpiness += abs(heights[i] - heights[i-1])
+		self.bumpiness = bumpiness
+
+	# board[x][y] adapter so code written for the list-of-lists board
+	# (drawBoard, printBoard, ...) keeps working unchanged
+	def __getitem__(self, x):
+		return Column(self, x)
+
+	def __len__(self):
+		return BOARDWIDTH
+
+	def getCell(self, x, y):
+		if y < 0:
+			y += BOARDHEIGHT
+		if not self.rows[y] >> x & 1:
+			return BLANK
+		if self.colors is None:
+			return FILLED
+		return self.colors[y][x]
+
+	def setCell(self, x, y, color):
+		if y < 0:
+			y += BOARDHEIGHT
+		if color == BLANK:
+			self.rows[y] &= ~(1 << x)
+		else:
+			self.rows[y] |= 1 << x
+		if self.colors is not None:
+			self.colors[y][x] = color
+		self.rowCounts[y] = POPCOUNT[self.rows[y]]
+		self.completeLines = self.rowCounts.count(BOARDWIDTH)
+		self._recountColumn(x)
+		self._updateTotals()
+
+	def isValidPosition(self, pieceMask, px, py):
+		# Return True if the piece is within the board and not colliding
+		rows, minX, maxX = pieceMask
+		if px + minX < 0 or px + maxX >= BOARDWIDTH:
+			return False
+		boardRows = self.rows
+		for ty, mask in rows:
+			y = py + ty
+			if y < 0:
+				continue
+			if y >= BOARDHEIGHT:
+				return False
+			if boardRows[y] & (mask << px if px >= 0 else mask >> -px):
+				return False
+		return True
+
+	def place(self, pieceMask, px, py, color=FILLED):
+		# Add the piece to the board. Returns False (leaving the board
+		# untouched) if any part of the piece would be above the board.
+		rows, minX, maxX = pieceMask
+		if py + rows[0][0] < 0:
+			return False
+		boardRows = self.rows
+		rowCounts = self.rowCounts
+		for ty, mask in rows:
+			y = py + ty
+			shifted = mask << px if px >= 0 else mask >> -px
+			boardRows[y] |= shifted
+			rowCounts[y] = POPCOUNT[boardRows[y]]
+			if rowCounts[y] == BOARDWIDTH:
+				self.completeLines += 1
+			if self.colors is not None:
+				colorRow = self.colors[y]
+				while shifted:
+					low = shifted & -shifted
+					colorRow[low.bit_length() - 1] = color
+					shifted ^= low
+
+		# only the columns the piece covers can have changed
+		for x in range(px + minX, px + maxX + 1):
+			self._recountColumn(x)
+		self._updateTotals()
+		return True
+
+	def removeCompleteLines(self):
+		# Drop every full row and shift the rows above them down; returns the
+		# number of lines removed
+		return len(self.clearLines())
+
+	def clearLines(self):
+		# removeCompleteLines, returning the indices of the rows removed (top
+		# to bottom, counted before the rows above them moved down)
+		numLinesRemoved = self.completeLines
+		if not numLinesRemoved:
+			return ()
+
+		# A full row has a block in every column, so the full rows are all at
+		# or below the top of the lowest column, and there are completeLines
+		# of them: the scan starts there and stops at the last one.
+		rows = self.rows
+		cleared = []
+		y = BOARDHEIGHT - min(self.heights)
+		while len(cleared) < numLinesRemoved:
+			if rows[y] == FULLROW:
+				cleared.append(y)
+			y += 1
+
+		self.rows = compactRows(rows, cleared, [0] * numLinesRemoved)
+		self.rowCounts = compactRows(self.rowCounts, cleared, [0] * numLinesRemoved)
+		self.completeLines = 0
+		if self.colors is not None:
+			self.colors = compactRows(self.colors, cleared, [[BLANK] * BOARDWIDTH for y in cleared])
+
+		# A full row has a block in every column and no holes, so clearing it
+		# lowers every column by one and leaves the hole counts alone, unless
+		# the top block of a column was in a cleared row (it can only be the
+		# first one). That column is now empty above row firstCleared +
+		# numLinesRemoved, and the holes between there and its next block
+		# are opened up.
+		heights = self.heights
+		holes = self.holes
+		rows = self.rows
+		firstCleared = cleared[0]
+		below = firstCleared + numLinesRemoved
+		for x in range(BOARDWIDTH):
+			if BOARDHEIGHT - heights[x] == firstCleared:
+				bit = 1 << x
+				y = below
+				while y < BOARDHEIGHT and not rows[y] & bit:
+					y += 1
+				heights[x] = BOARDHEIGHT - y
+				holes[x] -= y - below
+			else:
+				heights[x] -= numLinesRemoved
+		self._updateTotals()
+		return tuple(cleared)
+
+	def getColumnHeights(self):
+		return self.heights[:]
+
+	def getCompleteLines(self):
+		return self.completeLines
+
+	def getNumHoles(self):
+		# a hole is an empty cell with a block somewhere above it
+		return self.numHoles
+
+	def getFeatures(self):
+		# (aggregate height, complete lines, holes, bumpiness) of the board
+		return self.aggHeight, self.completeLines, self.numHoles, self.bumpiness
+
+	def getPlacementFeatures(self, placement, px, py):
+		# Return getFeatures() of the board as it would be after dropping the
+		# piece described by the placement table entry at (px, py), without
+		# changing the board. py must be the landing row from getLandingRow,
+		# so the piece rests on top of every column it covers: each of those
+		# columns grows to the top of the piece and gains a hole for every
+		# empty cell between the piece and the old top of the column.
+		pieceMask = placement[0]
+		rows, minX, maxX = pieceMask
+		heights = self.heights
+		aggHeight = self.aggHeight
+		holes = self.numHoles
+
+		# heights of the covered columns and their neighbours
+		left = px + minX
+		if left > 0:
+			left -= 1
+		right = px + maxX + 1
+		if right == BOARDWIDTH:
+			right -= 1
+		newHeights = heights[left:right + 1]
+		for tx, bottomY, topY in placement[3]:
+			x = px + tx
+			height = BOARDHEIGHT - py - topY
+			aggHeight += height - heights[x]
+			holes += BOARDHEIGHT - heights[x] - py - bottomY - 1
+			newHeights[x - left] = height
+
+		bumpiness = self.bumpiness
+		for i in range(1, len(newHeights)):
+			x = left + i
+			bumpiness += abs(newHeights[i] - newHeights[i-1]) - abs(heights[x] - heights[x-1])
+
+		completeLines = self.completeLines
+		rowCounts = self.rowCounts
+		for ty, mask in rows:
+			if rowCounts[py + ty] + POPCOUNT[mask] == BOARDWIDTH:
+				completeLines += 1
+
+		return aggHeight, completeLines, holes, bumpiness
+
+
+class Column(object):
+	# a single board column, indexed by y like the old board[x] lists
+	__slots__ = ('board', 'x')
+
+	def __init__(self, board, x):
+		self.board = board
+		self.x = x
+
+	def __getitem__(self, y):
+		return self.board.getCell(self.x, y)
+
+	def __setitem__(self, y, color):
+		self.board.setCell(self.x, y, color)
+
+	def __len__(self):
+		return BOARDHEIGHT
@@ -0,0 +1,193 @@
+# Cap-aware evaluation for the trainer.
+#
+# Strong individuals survive most games up to MAXPIECES, so their games take
+# up most of a generation while their truncated scores no longer tell them
+# apart. A surviving game clears lines at a steady rate: every piece adds 4
+# cells and every line takes 10 away, so lines per piece settles just under
+# 0.4. playCappedGame plays a game in blocks of pieces and stops it at a
+# piece cap, or earlier once the rate of its blocks has converged.
+#
+# A converged rate doesn't mean the game would have survived, so getEstimate
+# extrapolates a stopped game with the rate times the pieces it is expected
+# to live on for. Games are lost at a roughly constant hazard (the pieces
+# are random), and the hazard is estimated from the deaths of all of the
+# individual's games over all the pieces they played. The estimate comes
+# with the half-width of a confidence interval from how much the games
+# differ and how uncertain every extrapolation is, instead of a truncated
+# score. Games that end before they are stopped count exactly.
+#
+# CapSchedule grows the cap over the generations, so the early generations
+# of weak individuals are played short. The population is evaluated again
+# whenever the cap grows, so selection only compares fitnesses extrapolated
+# from the same cap. CappedEvaluator keeps the estimate and interval of every
+# individual it played until they are collected with resetReports, which the
+# trainer's metrics do every generation.
+
+import math
+import engine
+
+BLOCK = 250 # pieces per block of a capped game
+
+
+# Play the piece codes of sequence with weights like engine.playGame
+# (playArgs are passed on to it), for at most maxPieces pieces, stopping
+# after cap pieces, or after minBlocks blocks once z standard errors of the
+# rate are within tolerance of it. Returns (lines, pieces played, variance
+# of the lines per piece, whether the game was stopped before it ended).
+def playCappedGame(weights, sequence, cap, maxPieces=engine.MAXPIECES, block=BLOCK, tolerance=0.05, z=2.0,
+				   minBlocks=4, **playArgs):
+	length = min(maxPieces, len(sequence))
+	cap = min(cap, length)
+	board = engine.getBlankBoard()
+	score = 0
+	pieces = 0
+	rates = []
+	while pieces < cap:
+		numPieces = min(block, cap - pieces)
+		lines, played = engine.playGame(weights, sequence[pieces:], numPieces, board=board, **playArgs)
+		score += lines
+		pieces += played
+		if played < numPieces:
+			return score, pieces, 0.0, False # game over
+		rates.append(float(lines) / played)
+		if len(rates) >= minBlocks and pieces < cap:
+			variance = getRateVariance(rates)
+			if z * math.sqrt(variance) <= tolerance * score / pieces:
+				break
+
+	if pieces == length:
+		return score, pieces, 0.0, False # played to the end
+	return score, pieces, getRateVariance(rates), True
+
+
+def getRateVariance(rates):
+	# variance of the mean of the block rates, as uncertain as the rate
+	# itself with a single block
+	mean = sum(rates) / len(rates)
+	if len(rates) < 2:
+		return mean ** 2
+	return sum((r - mean) ** 2 for r in rates) / (len(rates) - 1) / len(rates)
+
+
+# Mean and variance of min(T, remaining) for a lifetime T lost at hazard
+# (per piece): the pieces a stopped game is expected to go on for
+def getSurvival(hazard, remaining):
+	if hazard <= 0:
+		return float(remaining), 0.0
+	survives = math.exp(-hazard * remaining)
+	mean = (1 - survives) / hazard
+	square = 2 * (1 - survives * (1 + hazard * remaining)) / hazard ** 2
+	return mean, max(0.0, square - mean ** 2)
+
+
+# The fitness of an individual from its games (as returned by
+# playCappedGame) extrapolated to maxPieces pieces each, and the half-width
+# of its z confidence interval
+def getEstimate(games, maxPieces=engine.MAXPIECES, z=2.0):
+	deaths = sum(1 for score, pieces, variance, stopped in games if not stopped and pieces < maxPieces)
+	exposure = max(1, sum(pieces for score, pieces, variance, stopped in games))
+	hazard = float(deaths) / exposure
+	estimates, variances = extrapolate(games, hazard, maxPieces)
+
+	n = len(estimates)
+	mean = float(sum(estimates)) / n
+	spread = sum((e - mean) ** 2 for e in estimates) / (n - 1) if n > 1 else 0.0
+	# the hazard comes from a handful of deaths (or none), so its standard
+	# error (at least one death's worth) widens the interval too
+	shifted = sum(extrapolate(games, hazard + math.sqrt(max(1, deaths)) / exposure, maxPieces)[0]) / n
+	return mean, z * math.sqrt(spread / n + sum(variances) / n ** 2 + (mean - shifted) ** 2)
+
+
+def extrapolate(games, hazard, maxPieces):
+	# the estimated lines of every game over maxPieces pieces and their
+	# variances, with stopped games lost at hazard
+	estimates = []
+	variances = []
+	for score, pieces, variance, stopped in games:
+		if not stopped:
+			estimates.append(score)
+			variances.append(0.0)
+			continue
+		rate = float(score) / pieces
+		lifetime, lifetimeVariance = getSurvival(hazard, maxPieces - pieces)
+		estimates.append(score + rate * lifetime)
+		variances.append(rate ** 2 * lifetimeVariance + lifetime ** 2 * variance)
+	return estimates, variances
+
+
+class CapSchedule(object):
+
+	# The cap starts at start pieces and is multiplied by growth every
+	# `every` generations until it reaches final
+	def __init__(self, start=500, final=engine.MAXPIECES, growth=2.0, every=5):
+		self.start = start
+		self.final = final
+		self.growth = growth
+		self.every = every
+
+	def getCap(self, generation):
+		return int(min(self.final, self.start * self.growth ** (generation // self.every)))
+
+
+class CappedEvaluator(object):
+
+	# playGames(gameArgs) plays one game per (individual, seed, cap) tuple and
+	# returns what playCappedGame does for each, like
+	# ParallelEvaluator.playGames with a game function wrapping it. Fitnesses
+	# are looked up in and saved to cache (a FitnessCache) under the cap if
+	# one is given.
+	def __init__(self, playGames, seeds, schedule, cache=None, z=2.0):
+		self.playGames = playGames
+		self.seeds = tuple(seeds)
+		self.schedule = schedule
+		self.cache = cache
+		self.z = z
+		self.cap = schedule.getCap(0)
+		self.reports = []
+
+	def setGeneration(self, generation):
+		# Use the cap of the given generation. Returns whether it changed, in
+		# which case the population has to be evaluated again.
+		cap = self.schedule.getCap(generation)
+		changed = cap != self.cap
+		self.cap = cap
+		return changed
+
+	def getKey(self):
+		# the cache's maxPieces: fitnesses depend on the cap they were
+		# extrapolated from as well as the game length
+		return ('capped', self.cap, self.schedule.final)
+
+	def evaluate(self, individuals):
+		# Return the fitness tuple of every individual. A report of every
+		# individual played is added to self.reports, with its weights, the
+		# cap, its estimate and the half-width of its interval.
+		if self.cache is not None:
+			return self.cache.evaluate(individuals, self.evaluateGames, self.seeds, self.getKey())
+		return self.evaluateGames(individuals)
+
+	def evaluateGames(self, individuals):
+		results = self.playGames([(list(individual), seed, self.cap) for individual in individuals
+								  for seed in self.seeds])
+		numGames = len(self.seeds)
+		fitnesses = []
+		for i, individual in enumerate(individuals):
+			mean, halfWidth = getEstimate(results[i * numGames:(i + 1) * numGames], self.schedule.final, self.z)
+			self.reports.append({'weights': list(individual), 'cap': self.cap, 'fitness': mean, 'halfWidth': halfWidth})
+			fitnesses.append((mean,))
+		return fitnesses
+
+	def resetReports(self):
+		# Return the reports added since the last reset and start over
+		reports = self.reports
+		self.reports = []
+		return reports
+
+	def getSummary(self):
+		# one line describing the games played since the last reset
+		if not self.reports:
+			return 'Capped at %d pieces: nothing played' % self.cap
+		best = max(self.reports, key=lambda report: report['fitness'])
+		return 'Capped at %d pieces: best estimate %.1f +- %.1f lines (%.0f%% interval), widest +- %.1f' % (
+			self.cap, best['fitness'], best['halfWidth'], 100 * math.erf(self.z / math.sqrt(2)),
+			max(report['halfWidth'] for report in self.reports))
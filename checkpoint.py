@@ -0,0 +1,101 @@
+# Checkpoints of a trainer run.
+#
+# A run is 40 generations of evaluations kept only in memory, so a crash or a
+# reboot used to lose all of them. A Checkpointer saves what the run needs to
+# carry on after a generation: its number, every individual's weights and
+# fitness, the fitness cache and the state of the random number generator
+# the GA draws from, so a resumed run makes the same choices the
+# uninterrupted one would have (racing, for one, plays cached individuals
+# differently).
+#
+# A checkpoint is a zlib-compressed pickle. It is written to a temporary file
+# that then replaces the old checkpoint, so a crash mid-write leaves the
+# previous checkpoint intact, and the writing happens on a background thread
+# so the next generation's games start right away.
+
+import os, pickle, random, threading, zlib
+
+VERSION = 2 # bumped whenever the checkpoint contents change
+
+
+def writeAtomically(path, data):
+	tmpPath = path + '.tmp'
+	with open(tmpPath, 'wb') as f:
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+	getattr(os, 'replace', os.rename)(tmpPath, path)
+
+
+class Checkpointer(object):
+
+	# config is anything a checkpoint is only valid for (such as the feature
+	# set and the number of games), checked when it is loaded. A checkpoint is
+	# written every `every` generations; rng is the generator the GA draws
+	# from. The entries of cache (a FitnessCache) are saved too if one is
+	# given, and put back in it on loading.
+	def __init__(self, path, config=None, every=1, rng=random, cache=None):
+		self.path = path
+		self.config = config
+		self.every = every
+		self.rng = rng
+		self.cache = cache
+		self.writer = None
+		self.error = None
+
+	def exists(self):
+		return os.path.exists(self.path)
+
+	def save(self, generation, population, force=False):
+		# Save the population (individuals with valid fitnesses) as it is
+		# after the given generation. Only every `every`th generation is
+		# saved, unless force is set.
+		if not force and generation % self.every:
+			return
+		state = {
+			'version': VERSION,
+			'config': self.config,
+			'generation': generation,
+			'population': [(list(ind), tuple(ind.fitness.values)) for ind in population],
+			'rngState': self.rng.getstate(),
+			'cache': list(self.cache.entries.items()) if self.cache is not None else None,
+		}
+		# the snapshot is taken now, only the compression and the disk write
+		# are left to the background thread
+		data = pickle.dumps(state, 2)
+		self.wait()
+		self.writer = threading.Thread(target=self._write, args=(data,))
+		self.writer.daemon = True
+		self.writer.start()
+
+	def _write(self, data):
+		try:
+			writeAtomically(self.path, zlib.compress(data))
+		except (IOError, OSError) as e:
+			self.error = e
+
+	def wait(self):
+		# Block until the last checkpoint is on disk. Raises the error of a
+		# failed write.
+		if self.writer is not None:
+			self.writer.join()
+			self.writer = None
+		if self.error is not None:
+			error, self.error = self.error, None
+			raise error
+
+	def load(self):
+		# Return (generation, [(weights, fitness values), ...]) of the saved
+		# checkpoint and restore the generator state saved with it. Raises
+		# ValueError if it was written for another configuration.
+		with open(self.path, 'rb') as f:
+			state = pickle.loads(zlib.decompress(f.read()))
+		if state.get('version') != VERSION:
+			raise ValueError('%s is a checkpoint of another version' % self.path)
+		if state['config'] != self.config:
+			raise ValueError('%s was saved by a run with different settings: %r' % (self.path, state['config']))
+		self.rng.setstate(state['rngState'])
+		if self.cache is not None and state['cache'] is not None:
+			for key, fitness in state['cache']:
+				self.cache.put(key, fitness)
+		return state['generation'], state['population']
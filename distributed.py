@@ -0,0 +1,390 @@
+# Distributed fitness evaluation.
+#
+# A Coordinator plays games on worker processes that connect to it over TCP
+# or a Unix socket, from any number of machines, instead of a pool on this
+# one. Like parallel.ParallelEvaluator it is a parallel.Evaluator (playGames,
+# evaluate, resetStats, and start and close as a context manager), so the
+# trainer can use either. Every game is one task, handed to the next worker
+# that asks for one.
+#
+# Workers send heartbeats while they play. A worker that goes silent for
+# longer than the timeout or drops its connection is given up on and its
+# game is queued again. A game that raises is retried up to maxRetries
+# times before playGames fails. Once nothing is left to hand out, an idle
+# worker is given a second copy of any game that has been running for
+# stragglerFactor times as long as the games finished so far (at least a
+# second) take on median, and whichever copy finishes first counts.
+#
+# Game functions and the initializer are sent as (module, name) and looked
+# up by the workers, so every worker host needs this repository on its path.
+# Workers are started with
+#
+#     python distributed.py HOST:PORT --processes N --authkey KEY
+#
+# (or a socket path instead of HOST:PORT), or by the coordinator itself on
+# this machine with localWorkers.
+#
+# Messages are pickles and workers call the functions they are sent, so
+# whoever knows the key can run code on the coordinator and the workers.
+# There is no default key: it is given to both sides (or put in the
+# TETRIS_AUTHKEY environment variable), or the coordinator makes up a random
+# one, which it only does for a Unix socket or a loopback address.
+
+import argparse, binascii, collections, multiprocessing, os, socket, sys, threading, time, traceback
+from multiprocessing.connection import Listener, Client
+import parallel
+
+AUTHKEYVARIABLE = 'TETRIS_AUTHKEY'
+
+
+def getAuthkey(authkey=None):
+	# the key given, else the one in the environment, else None
+	if authkey is not None:
+		return authkey
+	return os.environ.get(AUTHKEYVARIABLE)
+
+
+def isLoopback(address):
+	# whether only this machine can connect to address
+	if not isinstance(address, tuple):
+		return True # a Unix socket
+	host = address[0]
+	return host == 'localhost' or host == '::1' or host.startswith('127.')
+
+
+def parseAddress(text):
+	# HOST:PORT is a TCP address, anything else the path of a Unix socket
+	host, sep, port = text.rpartition(':')
+	if sep and port.isdigit():
+		return host or 'localhost', int(port)
+	return text
+
+
+def getReference(function):
+	# (module, name) of a module level function; functions of the script
+	# being run are looked up in it as a module
+	module = function.__module__
+	if module == '__main__':
+		module = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+	return module, function.__name__
+
+
+def resolveReference(reference):
+	module, name = reference
+	__import__(module)
+	return getattr(sys.modules[module], name)
+
+
+# Connect to the coordinator at address and play the games it hands out
+# until it stops this worker or goes away. The coordinator may start after
+# the worker: connecting is retried for connectTimeout seconds.
+def runWorker(address, authkey, heartbeat=5.0, connectTimeout=60.0):
+	deadline = time.time() + connectTimeout
+	while True:
+		try:
+			conn = Client(address, authkey=authkey.encode())
+			break
+		except (IOError, OSError):
+			if time.time() > deadline:
+				raise
+			time.sleep(0.5)
+
+	sendLock = threading.Lock()
+	def send(message):
+		with sendLock:
+			conn.send(message)
+
+	def beat(stop):
+		while not stop.wait(heartbeat):
+			send(('heartbeat',))
+
+	send(('hello', '%s:%d' % (socket.gethostname(), os.getpid())))
+	try:
+		while True:
+			try:
+				message = conn.recv()
+			except EOFError:
+				return
+			if message[0] == 'stop':
+				return
+			elif message[0] == 'init':
+				initializer, initargs = message[1:]
+				if initializer is not None:
+					resolveReference(initializer)(*initargs)
+			elif message[0] == 'task':
+				taskId, playGame, args = message[1:]
+				stop = threading.Event()
+				beater = threading.Thread(target=beat, args=(stop,))
+				beater.daemon = True
+				beater.start()
+				start = time.time()
+				try:
+					score, counters = resolveReference(playGame)(*args)
+					reply = ('result', taskId, score, counters, time.time() - start)
+				except Exception:
+					reply = ('error', taskId, traceback.format_exc())
+				stop.set()
+				beater.join()
+				send(reply)
+	finally:
+		conn.close()
+
+
+def runWorkers(address, processes, authkey, heartbeat=5.0):
+	# run processes workers on this machine until they all exit
+	workers = [multiprocessing.Process(target=runWorker, args=(address, authkey, heartbeat)) for i in range(processes)]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+
+
+class Coordinator(parallel.Evaluator):
+
+	# playGame must be a module level function that plays one game and
+	# returns its score and a dict of counters, as for ParallelEvaluator.
+	# initializer(*initargs) is run once by every worker when it connects.
+	# address is a (host, port) tuple or a socket path. localWorkers worker
+	# processes are started on this machine along with the coordinator.
+	# Without an authkey (or TETRIS_AUTHKEY) a random one is made up, see
+	# above. Workers are given up on after timeout seconds without a
+	# heartbeat, and playGames fails once no worker has been connected for
+	# workerWait seconds.
+	def __init__(self, playGame, address, initializer=None, initargs=(), localWorkers=0, authkey=None,
+				 timeout=30.0, maxRetries=3, stragglerFactor=3.0, heartbeat=5.0, workerWait=120.0):
+		parallel.Evaluator.__init__(self)
+		self.playGame = playGame
+		self.address = address
+		self.initializer = initializer
+		self.initargs = initargs
+		self.localWorkers = localWorkers
+		self.authkey = getAuthkey(authkey)
+		self.generatedKey = self.authkey is None
+		if self.generatedKey:
+			self.authkey = binascii.hexlify(os.urandom(16)).decode()
+		self.workerWait = workerWait
+		self.timeout = timeout
+		self.maxRetries = maxRetries
+		self.stragglerFactor = stragglerFactor
+		self.heartbeat = heartbeat
+		self.listener = None
+		self.processes = []
+		self.condition = threading.Condition()
+		self.closing = False
+		self.workers = set() # names of the connected workers
+		self.nextId = 0
+		self.startBatch({})
+
+	def startBatch(self, tasks):
+		# the games of one playGames call, by task id
+		self.tasks = tasks
+		self.pending = collections.deque(sorted(tasks))
+		self.running = {} # task id: [start time, copies running]
+		self.results = {}
+		self.attempts = {}
+		self.durations = []
+		self.failure = None
+
+	def start(self):
+		if self.listener is not None:
+			return self
+		if self.generatedKey and not isLoopback(self.address):
+			raise ValueError('listening on %s:%d needs a key, from --authkey or %s' % (self.address + (AUTHKEYVARIABLE,)))
+		if not isinstance(self.address, tuple) and os.path.exists(self.address):
+			os.remove(self.address) # a stale socket of an earlier run
+		self.closing = False
+		self.listener = Listener(self.address, authkey=self.authkey.encode())
+		self.address = self.listener.address
+		acceptor = threading.Thread(target=self.accept)
+		acceptor.daemon = True
+		acceptor.start()
+		self.processes = [multiprocessing.Process(target=runWorker, args=(self.address, self.authkey, self.heartbeat))
+						  for i in range(self.localWorkers)]
+		for process in self.processes:
+			process.daemon = True
+			process.start()
+		return self
+
+	def close(self):
+		# stop the workers once they finish their games and stop listening
+		with self.condition:
+			self.closing = True
+			self.condition.notify_all()
+		if self.listener is not None:
+			self.listener.close()
+			self.listener = None
+		for process in self.processes:
+			process.join(self.timeout)
+			if process.is_alive():
+				process.terminate()
+		self.processes = []
+
+	def terminate(self):
+		for process in self.processes:
+			process.terminate()
+		self.close()
+
+	def accept(self):
+		# run on a thread: serve every worker that connects on a thread of its own
+		while True:
+			try:
+				conn = self.listener.accept()
+			except Exception:
+				if self.closing:
+					return
+				continue # a failed handshake
+			server = threading.Thread(target=self.serve, args=(conn,))
+			server.daemon = True
+			server.start()
+
+	def serve(self, conn):
+		# hand out games to one worker until it is lost or the coordinator closes
+		name = None
+		taskId = None
+		try:
+			if not conn.poll(self.timeout):
+				return
+			name = conn.recv()[1]
+			with self.condition:
+				self.workers.add(name)
+			conn.send(('init', getReference(self.initializer) if self.initializer is not None else None, self.initargs))
+			playGame = getReference(self.playGame)
+			while True:
+				taskId, args = self.takeTask()
+				if taskId is None:
+					conn.send(('stop',))
+					return
+				conn.send(('task', taskId, playGame, args))
+				while True:
+					if not conn.poll(self.timeout):
+						raise IOError('no heartbeat for %.0f seconds' % self.timeout)
+					message = conn.recv()
+					if message[0] == 'result':
+						self.finishTask(name, *message[1:])
+						break
+					elif message[0] == 'error':
+						self.failTask(message[1], 'game %r failed on %s:\n%s' % (args, name, message[2]))
+						break
+				taskId = None
+		except (EOFError, IOError, OSError) as e:
+			reason = str(e) or type(e).__name__
+			if not self.closing:
+				sys.stderr.write('Lost worker %s: %s\n' % (name, reason))
+			if taskId is not None:
+				self.failTask(taskId, 'lost worker %s: %s' % (name, reason))
+		finally:
+			conn.close()
+			with self.condition:
+				self.workers.discard(name)
+
+	def takeTask(self):
+		# Block until there is a game for a worker to play and return its
+		# (task id, args), or (None, None) once the coordinator closes
+		with self.condition:
+			while not self.closing:
+				while self.pending:
+					taskId = self.pending.popleft()
+					if taskId in self.results:
+						continue
+					entry = self.running.setdefault(taskId, [time.time(), 0])
+					entry[1] += 1
+					return taskId, self.tasks[taskId]
+				taskId = self.findStraggler()
+				if taskId is not None:
+					self.running[taskId][1] += 1
+					self.counters['redispatched'] = self.counters.get('redispatched', 0) + 1
+					return taskId, self.tasks[taskId]
+				self.condition.wait(1.0)
+			return None, None
+
+	def findStraggler(self):
+		# a game running with one copy for stragglerFactor times the median
+		# time of the finished ones, if there is one
+		if not self.durations:
+			return None
+		durations = sorted(self.durations)
+		limit = max(1.0, self.stragglerFactor * durations[len(durations) // 2])
+		now = time.time()
+		for taskId, (start, copies) in self.running.items():
+			if copies == 1 and now - start > limit:
+				return taskId
+		return None
+
+	def finishTask(self, name, taskId, score, counters, seconds):
+		with self.condition:
+			if taskId in self.tasks and taskId not in self.results:
+				self.results[taskId] = score, counters
+				self.running.pop(taskId, None)
+				self.durations.append(seconds)
+				self.condition.notify_all()
+			self.busy[name] = self.busy.get(name, 0.0) + seconds
+
+	def failTask(self, taskId, error):
+		# play a game again after its worker failed it, unless it has
+		# failed too often or another copy is still running
+		with self.condition:
+			if taskId not in self.tasks or taskId in self.results:
+				return
+			self.attempts[taskId] = self.attempts.get(taskId, 0) + 1
+			entry = self.running.get(taskId)
+			if entry is not None:
+				entry[1] -= 1
+				if entry[1] > 0:
+					return
+				del self.running[taskId]
+			if self.attempts[taskId] > self.maxRetries:
+				self.failure = error
+			else:
+				self.counters['retries'] = self.counters.get('retries', 0) + 1
+				self.pending.appendleft(taskId)
+			self.condition.notify_all()
+
+	def resetStats(self):
+		# busy is keyed by worker name (host:pid) and counters also has the
+		# games retried and re-dispatched as stragglers
+		with self.condition:
+			return parallel.Evaluator.resetStats(self)
+
+	def playGames(self, gameArgs):
+		# Play one game per argument tuple on the workers, returning the
+		# scores in order. Raises RuntimeError if a game keeps failing or
+		# there are no workers to play them.
+		with self.condition:
+			ids = range(self.nextId, self.nextId + len(gameArgs))
+			self.nextId += len(gameArgs)
+			self.startBatch(dict(zip(ids, gameArgs)))
+			self.condition.notify_all()
+			alone = None # when the last worker was lost
+			while len(self.results) < len(ids) and self.failure is None:
+				if self.workers:
+					alone = None
+				elif alone is None:
+					alone = time.time()
+				elif time.time() - alone > self.workerWait:
+					self.failure = 'no worker connected for %.0f seconds' % self.workerWait
+					break
+				self.condition.wait(1.0)
+			failure = self.failure
+			results = [self.results.get(taskId) for taskId in ids]
+			self.startBatch({})
+			if failure is not None:
+				raise RuntimeError(failure)
+
+			scores = []
+			for score, gameCounters in results:
+				scores.append(score)
+				self.addCounters(gameCounters)
+		return scores
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run worker processes for a distributed trainer run')
+	parser.add_argument('address', help='HOST:PORT or Unix socket path the trainer\'s coordinator listens on')
+	parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='worker processes to run')
+	parser.add_argument('--authkey', default=None, help='key shared with the coordinator (default: $%s)' % AUTHKEYVARIABLE)
+	parser.add_argument('--heartbeat', type=float, default=5.0, help='seconds between heartbeats while playing')
+	args = parser.parse_args()
+	authkey = getAuthkey(args.authkey)
+	if authkey is None:
+		parser.error('the coordinator\'s key is needed, from --authkey or $%s' % AUTHKEYVARIABLE)
+	runWorkers(parseAddress(args.address), args.processes, authkey, args.heartbeat)
@@ -0,0 +1,591 @@
+# Tetromino (a Tetris clone)
+# By Al Sweigart al@inventwithpython.com
+# http://inventwithpython.com/pygame
+# Released under a "Simplified BSD" license
+
+# Headless Tetris engine shared by tetris.py and trainer.py.
+#
+# The piece templates, the board helpers, the move search and the game loop
+# all live here, so the GUI and the trainer play exactly the same games and
+# every speedup only has to be made once. Nothing in here imports pygame or
+# DEAP, and NumPy (batcheval) is only imported when a vectorized game is
+# played, so worker processes start quickly. Pieces come from piece code
+# sequences (see sequences.py).
+
+import random, time
+import bitboard, sequences, features, transposition, movegen
+
+BOARDWIDTH = bitboard.BOARDWIDTH
+BOARDHEIGHT = bitboard.BOARDHEIGHT
+BLANK = bitboard.BLANK
+MAXPIECES = 5000
+LOOKAHEADTOPK = 5 # placements of the falling piece the depth-2 search looks past
+NUMCOLORS = 4 # pieces are colored 0 to NUMCOLORS - 1, see tetris.COLORS
+
+TEMPLATEWIDTH = 5
+TEMPLATEHEIGHT = 5
+SPAWNX = int(BOARDWIDTH / 2) - int(TEMPLATEWIDTH / 2)
+SPAWNY = -2 # start pieces above the board (i.e. less than 0)
+
+S_SHAPE_TEMPLATE = [['.....',
+					 '.....',
+					 '..OO.',
+					 '.OO..',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '..OO.',
+					 '...O.',
+					 '.....']]
+
+Z_SHAPE_TEMPLATE = [['.....',
+					 '.....',
+					 '.OO..',
+					 '..OO.',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '.OO..',
+					 '.O...',
+					 '.....']]
+
+I_SHAPE_TEMPLATE = [['..O..',
+					 '..O..',
+					 '..O..',
+					 '..O..',
+					 '.....'],
+					['.....',
+					 '.....',
+					 'OOOO.',
+					 '.....',
+					 '.....']]
+
+O_SHAPE_TEMPLATE = [['.....',
+					 '.....',
+					 '.OO..',
+					 '.OO..',
+					 '.....']]
+
+J_SHAPE_TEMPLATE = [['.....',
+					 '.O...',
+					 '.OOO.',
+					 '.....',
+					 '.....'],
+					['.....',
+					 '..OO.',
+					 '..O..',
+					 '..O..',
+					 '.....'],
+					['.....',
+					 '.....',
+					 '.OOO.',
+					 '...O.',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '..O..',
+					 '.OO..',
+					 '.....']]
+
+L_SHAPE_TEMPLATE = [['.....',
+					 '...O.',
+					 '.OOO.',
+					 '.....',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '..O..',
+					 '..OO.',
+					 '.....'],
+					['.....',
+					 '.....',
+					 '.OOO.',
+					 '.O...',
+					 '.....'],
+					['.....',
+					 '.OO..',
+					 '..O..',
+					 '..O..',
+					 '.....']]
+
+T_SHAPE_TEMPLATE = [['.....',
+					 '..O..',
+					 '.OOO.',
+					 '.....',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '..OO.',
+					 '..O..',
+					 '.....'],
+					['.....',
+					 '.....',
+					 '.OOO.',
+					 '..O..',
+					 '.....'],
+					['.....',
+					 '..O..',
+					 '.OO..',
+					 '..O..',
+					 '.....']]
+
+PIECES = {'S': S_SHAPE_TEMPLATE,
+		  'Z': Z_SHAPE_TEMPLATE,
+		  'J': J_SHAPE_TEMPLATE,
+		  'L': L_SHAPE_TEMPLATE,
+		  'I': I_SHAPE_TEMPLATE,
+		  'O': O_SHAPE_TEMPLATE,
+		  'T': T_SHAPE_TEMPLATE}
+
+PIECEMASKS = bitboard.buildPieceMasks(PIECES)
+PLACEMENTS = bitboard.buildPlacementTable(PIECEMASKS)
+ORIENTATIONS = bitboard.buildOrientationTable(PLACEMENTS)
+REACHABLE = movegen.ReachabilityCache(PIECEMASKS, ORIENTATIONS, SPAWNX, SPAWNY) # placements reachable under overhangs
+PIECECODES = sequences.buildPieceCodes(PIECES)
+# column drops the search tries for every shape, which it scores unless they stick out of the board
+NUMDROPS = dict((shape, sum(len(PLACEMENTS[shape][rotation][2]) for rotation in ORIENTATIONS[shape])) for shape in PIECES)
+
+
+# Find the best placement of a piece without copying the board: the features
+# of each candidate are worked out from the board's tracked column state and
+# only the winning placement is applied by the caller. Every distinct
+# placement is tried once, in the fixed order of ORIENTATIONS and then x from
+# left to right, and ties keep the first. Returns the (rotation, x, y) of the
+# best placement, or None if the piece can't be placed. The candidates scored
+# are added to phaseStats (a phases.PhaseStats) if it is given.
+def findBestMove(board, shape, a, b, c, d, phaseStats=None):
+	heights = board.heights
+
+	bestMove = None
+	maxVal = -float("inf")
+	skipped = 0
+
+	placements = PLACEMENTS[shape]
+
+	for rotation in ORIENTATIONS[shape]:
+		placement = placements[rotation]
+
+		for x in placement[2]:
+			y = bitboard.getLandingRow(heights, placement, x)
+			if y + placement[4] < 0:
+				skipped += 1
+				continue # would stick out of the top of the board
+			aggHeight, completeLines, holes, bumpiness = board.getPlacementFeatures(placement, x, y)
+			val = a * aggHeight + b * completeLines + c * holes + d * bumpiness
+			if val > maxVal:
+				maxVal = val
+				bestMove = (rotation, x, y)
+
+	if phaseStats is not None:
+		phaseStats.addCandidates(NUMDROPS[shape] - skipped)
+	return bestMove
+
+
+# findBestMove for weights over any feature set (see features.py) rather than
+# the four original features. The row and column transitions of the board
+# are counted once here and only updated for each candidate.
+def findBestFeatureMove(board, shape, weights, featureSet, phaseStats=None):
+	heights = board.heights
+	transitions = features.getTransitions(board.rows)
+
+	bestMove = None
+	maxVal = -float("inf")
+	skipped = 0
+
+	placements = PLACEMENTS[shape]
+
+	for rotation in ORIENTATIONS[shape]:
+		placement = placements[rotation]
+
+		for x in placement[2]:
+			y = bitboard.getLandingRow(heights, placement, x)
+			if y + placement[4] < 0:
+				skipped += 1
+				continue # would stick out of the top of the board
+			val = 0
+			for weight, value in zip(weights, featureSet.getPlacementFeatures(board, placement, x, y, transitions)):
+				val += weight * value
+			if val > maxVal:
+				maxVal = val
+				bestMove = (rotation, x, y)
+
+	if phaseStats is not None:
+		phaseStats.addCandidates(NUMDROPS[shape] - skipped)
+	return bestMove
+
+
+# Return every candidate placement of the piece as a (score, (rotation, x, y))
+# pair, in the order findBestMove tries them. featureSet is None for the
+# original four features. Scores are looked up in and saved to table (a
+# transposition.TranspositionTable for these weights) if one is given. If
+# spawnRotation (the rotation the piece spawned in) is given and the board
+# has overhangs, the candidates are every placement the piece can reach,
+# tucks and slides included (see movegen.py), instead of the column drops.
+# The candidates are added to phaseStats if it is given.
+def getScoredMoves(board, shape, weights, featureSet=None, table=None, spawnRotation=None, phaseStats=None):
+	heights = board.heights
+	if featureSet is None:
+		a, b, c, d = weights[0], weights[1], weights[2], weights[3]
+	else:
+		transitions = features.getTransitions(board.rows)
+	if table is not None:
+		rows = board.rows
+		boardHash = transposition.hashRows(rows)
+		# the landing height isn't part of the board, so it goes in the key
+		hashLanding = featureSet is not None and 'landingHeight' in featureSet.names
+
+	placements = PLACEMENTS[shape]
+
+	if spawnRotation is not None and board.numHoles:
+		moves = REACHABLE.getPlacements(board, shape, spawnRotation)
+	else:
+		moves = []
+		for rotation in ORIENTATIONS[shape]:
+			placement = placements[rotation]
+			for x in placement[2]:
+				y = bitboard.getLandingRow(heights, placement, x)
+				if y + placement[4] >= 0: # otherwise it would stick out of the top of the board
+					moves.append((rotation, x, y))
+
+	scoredMoves = []
+
+	for move in moves:
+		rotation, x, y = move
+		placement = placements[rotation]
+		val = None
+		if table is not None:
+			key = transposition.getPlacementHash(boardHash, rows, placement[0], x, y)
+			if hashLanding:
+				key ^= transposition.LANDINGKEYS[(y + placement[4]) * BOARDHEIGHT + y + placement[0][0][-1][0]]
+			val = table.get(key)
+		if val is None:
+			# the fast feature updates only hold for pieces resting on top of
+			# the columns they cover, not for tucks under an overhang
+			landed = y == bitboard.getLandingRow(heights, placement, x)
+			if featureSet is None:
+				if landed:
+					aggHeight, completeLines, holes, bumpiness = board.getPlacementFeatures(placement, x, y)
+				else:
+					placed = board.copy()
+					placed.place(placement[0], x, y)
+					aggHeight, completeLines, holes, bumpiness = placed.getFeatures()
+				val = a * aggHeight + b * completeLines + c * holes + d * bumpiness
+			else:
+				if landed:
+					values = featureSet.getPlacementFeatures(board, placement, x, y, transitions)
+				else:
+					values = featureSet.getPlacedFeatures(board, placement, x, y)
+				val = 0
+				for weight, value in zip(weights, values):
+					val += weight * value
+			if table is not None:
+				table.put(key, val)
+		scoredMoves.append((val, move))
+
+	if phaseStats is not None:
+		phaseStats.addCandidates(len(moves))
+	return scoredMoves
+
+
+# The first of the best scoring moves of getScoredMoves, the move
+# findBestMove would pick, or None if there are none
+def getBestScoredMove(scoredMoves):
+	bestMove = None
+	maxVal = -float("inf")
+	for val, move in scoredMoves:
+		if val > maxVal:
+			maxVal = val
+			bestMove = move
+	return bestMove
+
+
+# Score of the best placement of a new piece, -inf if it doesn't fit on the
+# board (game over). tucks searches every reachable placement on boards with
+# overhangs, see getScoredMoves.
+def getBestScore(board, shape, rotation, weights, featureSet=None, table=None, tucks=False, phaseStats=None):
+	if not board.isValidPosition(PIECEMASKS[shape][rotation], SPAWNX, SPAWNY):
+		return -float("inf")
+	scoredMoves = getScoredMoves(board, shape, weights, featureSet, table, rotation if tucks else None, phaseStats)
+	return max([val for val, move in scoredMoves] or [-float("inf")])
+
+
+# Depth-2 search: every placement of the falling piece is scored by the best
+# placement of the next piece (a (shape, rotation) pair) on the board it
+# leaves, with the lines the falling piece clears added back in. Only the
+# topK placements with the best one-ply scores are searched further. The
+# best score of the next piece on every board is kept, so placements leaving
+# the same board are only searched once: in table (a
+# transposition.TranspositionTable for these weights, which also keeps the
+# scores of every board evaluated) if one is given, otherwise in a dict used
+# for this call only. Without a next piece, or if every searched placement
+# ends the game, this picks the same move as findBestMove. Given the falling
+# piece's spawnRotation, both pieces are searched with tucks and slides on
+# boards with overhangs (see getScoredMoves). The candidates of both pieces
+# are added to phaseStats if it is given.
+def findBestLookaheadMove(board, shape, nextPiece, weights, featureSet=None, topK=LOOKAHEADTOPK, table=None,
+						  spawnRotation=None, phaseStats=None):
+	scoredMoves = getScoredMoves(board, shape, weights, featureSet, table, spawnRotation, phaseStats)
+	if not scoredMoves:
+		return None
+	# sorted is stable, so ties keep the order findBestMove tries them in
+	ranked = sorted(scoredMoves, key=lambda scoredMove: -scoredMove[0])
+	if nextPiece is None:
+		return ranked[0][1]
+
+	if featureSet is None:
+		linesWeight = weights[1]
+	elif 'completeLines' in featureSet.names:
+		linesWeight = weights[featureSet.names.index('completeLines')]
+	else:
+		linesWeight = 0
+	cache = {} if table is None else table
+	pieceKey = transposition.PIECEKEYS[nextPiece]
+
+	bestMove = ranked[0][1]
+	maxVal = -float("inf")
+	for val, move in ranked[:topK]:
+		child = board.copy()
+		child.place(PIECEMASKS[shape][move[0]], move[1], move[2])
+		cleared = child.removeCompleteLines()
+		key = transposition.hashRows(child.rows) ^ pieceKey
+		childVal = cache.get(key)
+		if childVal is None:
+			childVal = getBestScore(child, nextPiece[0], nextPiece[1], weights, featureSet, table, spawnRotation is not None,
+									phaseStats)
+			if table is None:
+				cache[key] = childVal
+			else:
+				table.put(key, childVal)
+		val = childVal + linesWeight * cleared
+		if val > maxVal:
+			maxVal = val
+			bestMove = move
+
+	return bestMove
+
+
+# Find the best placement of piece, see findBestMove. Returns the
+# (rotation, x, y) of the best placement, or None if the piece can't be placed.
+# Given the next piece, the depth-2 findBestLookaheadMove is used instead.
+# tucks also searches placements under overhangs, see getScoredMoves. Board
+# scores are kept in table (a transposition.TranspositionTable) if one is
+# given, as in playGame. The candidates scored are added to phaseStats if it
+# is given.
+def getBestMove(board, piece, a, b, c, d, nextPiece=None, tucks=False, phaseStats=None, table=None):
+	spawnRotation = piece['rotation'] if tucks else None
+	if table is not None:
+		table.setWeights((a, b, c, d), None, tucks)
+	if nextPiece is not None:
+		return findBestLookaheadMove(board, piece['shape'], (nextPiece['shape'], nextPiece['rotation']), (a, b, c, d),
+									 table=table, spawnRotation=spawnRotation, phaseStats=phaseStats)
+	if table is not None or (tucks and board.numHoles):
+		return getBestScoredMove(getScoredMoves(board, piece['shape'], (a, b, c, d), table=table,
+												spawnRotation=spawnRotation, phaseStats=phaseStats))
+	return findBestMove(board, piece['shape'], a, b, c, d, phaseStats)
+
+
+# Play one game with the weight vector, replaying the piece codes of sequence
+# until a new piece doesn't fit or maxPieces pieces have been placed. Returns
+# (lines cleared, pieces placed). If timings is a list, the time taken by
+# every piece is appended to it. vectorized=True scores the candidates with
+# the NumPy batch evaluator (batcheval) instead, which picks the same moves.
+# featureSet (a features.FeatureSet) gives the features the weights are for,
+# the original four by default. depth=2 looks one piece ahead with
+# findBestLookaheadMove, searching past the topK best placements. Board
+# scores are kept in table (a transposition.TranspositionTable) if one is
+# given; it is cleared first if it holds scores for other weights. tucks
+# also searches the placements only reachable by tucking or sliding the
+# piece, on boards with overhangs (see movegen.py). If phaseStats (a
+# phases.PhaseStats) is given, the time of every phase of a piece's turn is
+# added to it. The game starts on board (which is played on) if one is
+# given, a blank board otherwise.
+def playGame(weights, sequence, maxPieces=MAXPIECES, timings=None, vectorized=False, featureSet=None,
+			 depth=1, topK=LOOKAHEADTOPK, table=None, tucks=False, phaseStats=None, board=None):
+	if featureSet is not None and featureSet.isDefault:
+		featureSet = None # the original four have their own faster search
+	numFeatures = len(features.DEFAULTFEATURES) if featureSet is None else len(featureSet)
+	if len(weights) != numFeatures:
+		raise ValueError('%d weights given for %d features' % (len(weights), numFeatures))
+	if depth not in (1, 2):
+		raise ValueError('search depth must be 1 or 2, not %r' % (depth,))
+	if vectorized:
+		if featureSet is not None or depth != 1 or tucks:
+			raise ValueError('the vectorized evaluator only supports column drops with the default features at depth 1')
+		import batcheval # imported here so plain games never load NumPy
+	if table is not None:
+		table.setWeights(weights, featureSet, tucks)
+	if featureSet is None:
+		a, b, c, d = weights[0], weights[1], weights[2], weights[3]
+	if board is None:
+		board = bitboard.Board()
+	score = 0
+	pieces = 0
+
+	for i, code in enumerate(sequence[:maxPieces]):
+		if timings is not None:
+			start = time.time()
+		if phaseStats is not None:
+			phaseStats.start()
+
+		shape, rotation = PIECECODES[code]
+		if not board.isValidPosition(PIECEMASKS[shape][rotation], SPAWNX, SPAWNY):
+			break # can't fit a new piece on the board, so game over
+		if phaseStats is not None:
+			phaseStats.lap('spawn')
+
+		if vectorized:
+			bestMove = batcheval.getBestMove(board, {'shape': shape, 'rotation': rotation}, weights, PLACEMENTS, ORIENTATIONS,
+											 phaseStats)
+		elif depth == 2:
+			nextPiece = PIECECODES[sequence[i + 1]] if i + 1 < len(sequence) else None
+			bestMove = findBestLookaheadMove(board, shape, nextPiece, weights, featureSet, topK, table,
+											 rotation if tucks else None, phaseStats)
+		elif table is not None or (tucks and board.numHoles):
+			bestMove = getBestScoredMove(getScoredMoves(board, shape, weights, featureSet, table, rotation if tucks else None,
+														phaseStats))
+		elif featureSet is not None:
+			bestMove = findBestFeatureMove(board, shape, weights, featureSet, phaseStats)
+		else:
+			bestMove = findBestMove(board, shape, a, b, c, d, phaseStats)
+		if phaseStats is not None:
+			phaseStats.lap('search')
+
+		if bestMove is not None:
+			rotation, x, y = bestMove
+			board.place(PIECEMASKS[shape][rotation], x, y)
+		if phaseStats is not None:
+			phaseStats.lap('place')
+
+		score += board.removeCompleteLines()
+		pieces += 1
+		if phaseStats is not None:
+			phaseStats.lap('lineClear')
+			phaseStats.addPiece()
+
+		if timings is not None:
+			timings.append(time.time() - start)
+
+	return score, pieces
+
+
+def getPercentile(sortedValues, percent):
+	# nearest-rank percentile of an already sorted list
+	if not sortedValues:
+		return 0.0
+	return sortedValues[int(round(percent / 100.0 * (len(sortedValues) - 1)))]
+
+
+def evaluateBoard(board, a, b, c, d):
+	aggHeight, completeLines, holes, bumpiness = board.getFeatures()
+
+	return a * aggHeight + b * completeLines + c * holes + d * bumpiness
+
+
+def getAggregateHeight(board):
+	heights = board.getColumnHeights()
+
+	return sum(heights), heights
+
+
+def getNumHoles(board):
+	return board.getNumHoles()
+
+
+def getBumpiness(heights):
+	bumpiness = 0
+
+	for i in range(1, BOARDWIDTH):
+		bumpiness += abs(heights[i] - heights[i-1])
+
+	return bumpiness
+
+
+def getCompleteLines(board):
+	return board.getCompleteLines()
+
+
+def calculateLevelAndFallFreq(score):
+	# Based on the score, return the level the player is on and
+	# how many seconds pass until a falling piece falls one space.
+	level = int(score / 10) + 1
+	fallFreq = 0.27 - (level * 0.02)
+	return level, fallFreq
+
+
+def getNewPiece(rng=random):
+	# return a random new piece in a random rotation and color
+	shape = rng.choice(list(PIECES.keys()))
+	newPiece = {'shape': shape,
+				'rotation': rng.randint(0, len(PIECES[shape]) - 1),
+				'x': SPAWNX,
+				'y': SPAWNY,
+				'color': rng.randint(0, NUMCOLORS - 1)}
+	return newPiece
+
+
+def addToBoard(board, piece):
+	# fill in the board based on piece's location, shape, and rotation
+	return board.place(PIECEMASKS[piece['shape']][piece['rotation']], piece['x'], piece['y'], piece['color'])
+
+
+def getBlankBoard(colored=False):
+	# create and return a new blank board data structure. A colored board
+	# also remembers the color of every box, which only drawing needs.
+	if colored:
+		return bitboard.Board(colors=[[BLANK] * BOARDWIDTH for i in range(BOARDHEIGHT)])
+	return bitboard.Board()
+
+
+def isOnBoard(x, y):
+	return x >= 0 and x < BOARDWIDTH and y < BOARDHEIGHT
+
+
+def isValidPosition(board, piece, adjX=0, adjY=0):
+	# Return True if the piece is within the board and not colliding
+	return board.isValidPosition(PIECEMASKS[piece['shape']][piece['rotation']], piece['x'] + adjX, piece['y'] + adjY)
+
+
+def isInRange(piece, adjX=0, adjY=0):
+	# Return True if the piece is within the board, disregards collisions
+	rows, minX, maxX = PIECEMASKS[piece['shape']][piece['rotation']]
+	x = piece['x'] + adjX
+	return x + minX >= 0 and x + maxX < BOARDWIDTH and piece['y'] + adjY + rows[-1][0] < BOARDHEIGHT
+
+
+# Every board the piece can leave. By default pieces are only hard dropped,
+# which misses the placements under overhangs; tucks finds those too (see
+# movegen.py).
+def getAllMoves(board, piece, tucks=False):
+	boardList = []
+	color = piece.get('color', bitboard.FILLED)
+
+	if tucks and board.numHoles:
+		for rotation, x, y in REACHABLE.getPlacements(board, piece['shape'], piece['rotation']):
+			currBoard = board.copy()
+			currBoard.place(PIECEMASKS[piece['shape']][rotation], x, y, color)
+			boardList.append(currBoard)
+		return boardList
+
+	# every candidate's landing row comes straight from the column heights
+	heights = board.getColumnHeights()
+
+	for rotation in ORIENTATIONS[piece['shape']]:
+		placement = PLACEMENTS[piece['shape']][rotation]
+
+		for x in placement[2]:
+			y = bitboard.getLandingRow(heights, placement, x)
+			currBoard = board.copy()
+			if currBoard.place(placement[0], x, y, color):
+				boardList.append(currBoard)
+
+	return boardList
+
+
+def isCompleteLine(board, y):
+	# Return True if the line filled with boxes with no gaps.
+	return board.rows[y] == bitboard.FULLROW
+
+
+def removeCompleteLines(board):
+	# Remove any completed lines on the board, move everything above them down, and return the number of complete lines.
+	return board.removeCompleteLines()
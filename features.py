@@ -0,0 +1,180 @@
+# Pluggable evaluation features.
+#
+# The original evaluation is a weighted sum of four features (aggregate
+# height, complete lines, holes and bumpiness). FEATURES registers every
+# feature the engine knows by name, and a FeatureSet picks the ones a weight
+# vector is made of, so the length of a GA individual follows the chosen set.
+#
+# The built-in features are all worked out by one fused kernel instead of one
+# scan of the board per feature: the original four come from the board's
+# tracked state (see bitboard.Board.getPlacementFeatures), row and column
+# transitions from a single pass over the rows made once per piece, after
+# which a candidate only looks at the rows the piece covers and the rows next
+# to them, and wells and max height from the column heights. Features added
+# with registerFeature are computed by their own kernel on a copy of the
+# board with the piece placed, which is slower but needs no changes here.
+
+from collections import OrderedDict
+
+from bitboard import BOARDWIDTH, BOARDHEIGHT, FULLROW, POPCOUNT
+
+BUILTINS = ('aggHeight', 'completeLines', 'holes', 'bumpiness',
+			'rowTransitions', 'columnTransitions', 'wells', 'maxHeight', 'landingHeight')
+DEFAULTFEATURES = BUILTINS[:4] # the original four, weighted by ALPHA..DELTA
+
+# feature name -> kernel(board) for registered features, None for built-ins
+FEATURES = OrderedDict((name, None) for name in BUILTINS)
+
+
+def buildRowTransitions():
+	# filled/empty changes walking along every possible row, with the walls
+	# on both sides counting as filled
+	transitions = []
+	changes = (1 << (BOARDWIDTH + 1)) - 1
+	for row in range(1 << BOARDWIDTH):
+		walled = 1 | row << 1 | 1 << (BOARDWIDTH + 1)
+		transitions.append(bin((walled ^ walled >> 1) & changes).count('1'))
+	return transitions
+
+ROWTRANSITIONS = buildRowTransitions()
+
+
+def registerFeature(name, kernel):
+	# kernel(board) returns the feature value of a board, the piece already
+	# placed (before complete lines are removed)
+	if name in FEATURES:
+		raise ValueError('feature %r is already registered' % name)
+	FEATURES[name] = kernel
+
+
+def getTransitions(rows):
+	# (row transitions, column transitions) of the board in one pass over the
+	# rows. Column transitions count filled/empty changes between vertically
+	# neighbouring cells, with the floor counting as filled.
+	rowTransitions = 0
+	columnTransitions = 0
+	above = rows[0]
+	for row in rows:
+		rowTransitions += ROWTRANSITIONS[row]
+		columnTransitions += POPCOUNT[row ^ above]
+		above = row
+	return rowTransitions, columnTransitions + POPCOUNT[above ^ FULLROW]
+
+
+def getWells(heights):
+	# sum over the columns lower than both neighbours (the walls count as
+	# full columns) of 1 + 2 + ... + depth, so deep wells weigh more
+	wells = 0
+	for x in range(BOARDWIDTH):
+		left = heights[x - 1] if x > 0 else BOARDHEIGHT
+		right = heights[x + 1] if x < BOARDWIDTH - 1 else BOARDHEIGHT
+		depth = min(left, right) - heights[x]
+		if depth > 0:
+			wells += depth * (depth + 1) // 2
+	return wells
+
+
+def getLandingHeight(placement, py):
+	# height of the middle of the piece above the floor
+	pieceRows = placement[0][0]
+	first = py + pieceRows[0][0]
+	last = py + pieceRows[-1][0]
+	return BOARDHEIGHT - 1 - last + (last - first) / 2.0
+
+
+def getBoardValues(board):
+	# every built-in feature of the board as it is; there is no piece, so the
+	# landing height is 0
+	rowTransitions, columnTransitions = getTransitions(board.rows)
+	aggHeight, completeLines, holes, bumpiness = board.getFeatures()
+	return (aggHeight, completeLines, holes, bumpiness, rowTransitions, columnTransitions,
+			getWells(board.heights), max(board.heights), 0)
+
+
+def getPlacementValues(board, placement, px, py, transitions):
+	# Every built-in feature of the board after dropping the piece described
+	# by the placement table entry at its landing row (px, py), without
+	# changing the board. transitions is getTransitions(board.rows).
+	aggHeight, completeLines, holes, bumpiness = board.getPlacementFeatures(placement, px, py)
+	rowTransitions, columnTransitions = transitions
+
+	# only the rows the piece covers change (piece rows are contiguous), so
+	# only they and the column transitions to the rows above and below them
+	# have to be looked at again
+	rows = board.rows
+	pieceRows = placement[0][0]
+	first = py + pieceRows[0][0]
+	last = py + pieceRows[-1][0]
+	oldAbove = newAbove = rows[first - 1] if first > 0 else None # nothing above the top row
+	for ty, mask in pieceRows:
+		old = rows[py + ty]
+		row = old | (mask << px if px >= 0 else mask >> -px)
+		rowTransitions += ROWTRANSITIONS[row] - ROWTRANSITIONS[old]
+		if oldAbove is not None:
+			columnTransitions += POPCOUNT[row ^ newAbove] - POPCOUNT[old ^ oldAbove]
+		oldAbove = old
+		newAbove = row
+	below = rows[last + 1] if last + 1 < BOARDHEIGHT else FULLROW
+	columnTransitions += POPCOUNT[newAbove ^ below] - POPCOUNT[oldAbove ^ below]
+
+	heights = board.heights[:]
+	for tx, bottomY, topY in placement[3]:
+		heights[px + tx] = BOARDHEIGHT - py - topY
+
+	return (aggHeight, completeLines, holes, bumpiness, rowTransitions, columnTransitions,
+			getWells(heights), max(heights), getLandingHeight(placement, py))
+
+
+def getPlacedValues(board, placement, px, py):
+	# getPlacementValues for a piece resting anywhere, such as tucked under
+	# an overhang (see movegen.py), not just at its landing row. Slower, as
+	# the board is copied and the piece placed.
+	placed = board.copy()
+	placed.place(placement[0], px, py)
+	return getBoardValues(placed)[:-1] + (getLandingHeight(placement, py),)
+
+
+class FeatureSet(object):
+
+	# names picks the features, in the order of the weights they are scored
+	# with. Raises ValueError for names that aren't registered.
+	def __init__(self, names=DEFAULTFEATURES):
+		unknown = [name for name in names if name not in FEATURES]
+		if unknown:
+			raise ValueError('unknown features %s (known features: %s)' % (', '.join(unknown), ', '.join(FEATURES)))
+		self.names = tuple(names)
+		self.isDefault = self.names == DEFAULTFEATURES
+		self.kernels = [FEATURES[name] for name in self.names if FEATURES[name] is not None]
+		# position of every feature in the built-in values followed by the
+		# values of the registered kernels
+		self.indices = []
+		numKernels = 0
+		for name in self.names:
+			if FEATURES[name] is None:
+				self.indices.append(BUILTINS.index(name))
+			else:
+				self.indices.append(len(BUILTINS) + numKernels)
+				numKernels += 1
+
+	def __len__(self):
+		return len(self.names)
+
+	def getPlacementFeatures(self, board, placement, px, py, transitions):
+		# the features of the board after dropping the piece at (px, py), see
+		# getPlacementValues
+		values = getPlacementValues(board, placement, px, py, transitions)
+		if self.kernels:
+			placed = board.copy()
+			placed.place(placement[0], px, py)
+			values += tuple(kernel(placed) for kernel in self.kernels)
+		return tuple(values[i] for i in self.indices)
+
+	def getPlacedFeatures(self, board, placement, px, py):
+		# the features of the board after placing the piece at any resting
+		# position (px, py), see getPlacedValues
+		values = getPlacedValues(board, placement, px, py)
+		if self.kernels:
+			placed = board.copy()
+			placed.place(placement[0], px, py)
+			values += tuple(kernel(placed) for kernel in self.kernels)
+		return tuple(values[i] for i in self.indices)
@@ -0,0 +1,86 @@
+# Fitness cache for the trainer.
+#
+# With seeded games an individual's fitness only depends on its weights, the
+# seeds of the games it plays and the piece cap, so survivors kept in the
+# population and clones made by varOr never need to be played again.
+# FitnessCache remembers fitnesses under (rounded weights, seeds, maxPieces),
+# evicts the least recently used entries once it is full and can be saved to
+# disk so later runs start with everything earlier runs evaluated.
+
+import os, pickle
+from collections import OrderedDict
+from checkpoint import writeAtomically
+from hitcount import HitCounter
+
+
+class FitnessCache(HitCounter):
+
+	# context is anything else fitnesses depend on (such as the feature set
+	# the weights are for) and is made part of every key
+	def __init__(self, maxSize=100000, path=None, precision=8, context=None):
+		self.maxSize = maxSize
+		self.context = context
+		self.path = path
+		self.precision = precision
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		if path is not None and os.path.exists(path):
+			self.load()
+
+	def __len__(self):
+		return len(self.entries)
+
+	def key(self, individual, seeds, maxPieces):
+		key = (tuple([round(w, self.precision) for w in individual]), tuple(seeds), maxPieces)
+		if self.context is not None:
+			key += (self.context,)
+		return key
+
+	def get(self, key):
+		# Return the cached fitness, or None if it isn't known
+		fitness = self.entries.pop(key, None)
+		if fitness is None:
+			self.misses += 1
+			return None
+		self.entries[key] = fitness # most recently used entries live at the end
+		self.hits += 1
+		return fitness
+
+	def put(self, key, fitness):
+		self.entries.pop(key, None)
+		self.entries[key] = fitness
+		while len(self.entries) > self.maxSize:
+			self.entries.popitem(last=False)
+
+	def evaluate(self, individuals, evaluatePopulation, seeds, maxPieces):
+		# Return the fitness of every individual, calling
+		# evaluatePopulation(individuals) only for the distinct weight vectors
+		# that aren't cached yet
+		keys = [self.key(individual, seeds, maxPieces) for individual in individuals]
+		fitnesses = [self.get(key) for key in keys]
+
+		missing = OrderedDict()
+		for individual, key, fitness in zip(individuals, keys, fitnesses):
+			if fitness is None and key not in missing:
+				missing[key] = individual
+
+		if missing:
+			for key, fitness in zip(missing, evaluatePopulation(list(missing.values()))):
+				self.put(key, fitness)
+				missing[key] = fitness
+			fitnesses = [missing[key] if fitness is None else fitness for key, fitness in zip(keys, fitnesses)]
+
+		return fitnesses
+
+	def load(self):
+		with open(self.path, 'rb') as f:
+			entries = pickle.load(f)
+		for key in entries:
+			self.put(key, entries[key])
+
+	def save(self):
+		# written like a checkpoint, so a crash never leaves a truncated cache
+		if self.path is None:
+			return
+		writeAtomically(self.path, pickle.dumps(self.entries, 2))
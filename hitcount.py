@@ -0,0 +1,17 @@
+# Hit counting for the caches and tables that skip repeated work
+# (FitnessCache, TranspositionTable, ReachabilityCache) and the metrics
+# reported from their counts.
+
+
+# hits / lookups, or empty if nothing was looked up
+def getHitRate(hits, misses, empty=0.0):
+	if not hits + misses:
+		return empty
+	return float(hits) / (hits + misses)
+
+
+class HitCounter(object):
+
+	# subclasses count their lookups in self.hits and self.misses
+	def getHitRate(self):
+		return getHitRate(self.hits, self.misses)
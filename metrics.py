@@ -0,0 +1,164 @@
+# Per-generation metrics of a trainer run.
+#
+# A slow generation can mean better individuals playing longer games or a
+# performance regression, and the fitness printout alone can't tell them
+# apart. MetricsWriter writes one record per generation, with the fitness
+# statistics next to the wall time, the games and pieces played, pieces per
+# second, how busy every worker process was and the hit rates of the caches
+# in use, and with phase timing on the time spent in every phase of the game
+# loop (see phases.py), with racing the games every individual played and
+# why it stopped (see racing.py), and with capped evaluation the estimate and
+# confidence interval of every individual played (see capping.py). Records
+# are JSON lines, or CSV if the file name ends in .csv. GenerationRecorder
+# builds the records from what the evaluator, the fitness cache, the racer
+# and the capped evaluator counted during the generation.
+
+import csv, json, math, time
+import phases
+from hitcount import getHitRate
+
+FIELDS = ('generation', 'individuals', 'evaluated', 'minFitness', 'maxFitness', 'avgFitness', 'stdFitness',
+		  'seconds', 'games', 'pieces', 'piecesPerSecond', 'workerUtilisation',
+		  'fitnessCacheHitRate', 'tableHitRate', 'reachabilityHitRate',
+		  'spawnSeconds', 'searchSeconds', 'placeSeconds', 'lineClearSeconds', 'candidatesPerPiece',
+		  'sharedPieces', 'searchesSaved', 'stoppedGames', 'piecesSkipped', 'racing', 'capping')
+
+
+def getFitnessStats(fits):
+	# (min, max, mean, standard deviation) of the fitnesses
+	mean = float(sum(fits)) / len(fits)
+	variance = sum((fit - mean) ** 2 for fit in fits) / len(fits)
+	return min(fits), max(fits), mean, math.sqrt(variance)
+
+
+def formatRecord(record):
+	# one line summing up a record for the console
+	line = 'Generation %d: min %.2f  max %.2f  avg %.2f  std %.2f  %.1fs' % (
+		record['generation'], record['minFitness'], record['maxFitness'], record['avgFitness'],
+		record['stdFitness'], record['seconds'])
+	if record.get('piecesPerSecond') is not None:
+		line += '  %.0f pieces/s' % record['piecesPerSecond']
+	if record.get('searchesSaved') is not None and record.get('pieces'):
+		line += '  %.1f%% of searches saved by shared prefixes' % (100.0 * record['searchesSaved'] / record['pieces'])
+	if record.get('stoppedGames'):
+		line += '  %d games stopped early, %d pieces skipped' % (record['stoppedGames'], record['piecesSkipped'])
+	return line
+
+
+class GenerationRecorder(object):
+
+	# evaluator is the parallel.Evaluator games are played with,
+	# cache the fitness cache, racer the racing.RacingEvaluator and capper
+	# the capping.CappedEvaluator, any can be None. Records are written to
+	# writer (a MetricsWriter) if one is given. phaseStats holds the phase
+	# timings of the last generation, if the games were timed.
+	def __init__(self, writer=None, evaluator=None, cache=None, racer=None, capper=None):
+		self.writer = writer
+		self.evaluator = evaluator
+		self.cache = cache
+		self.racer = racer
+		self.capper = capper
+		self.phaseStats = None
+		self.start()
+
+	def start(self):
+		# start measuring a generation
+		self.startTime = time.time()
+		if self.evaluator is not None:
+			self.evaluator.resetStats()
+		if self.cache is not None:
+			self.cacheCounts = (self.cache.hits, self.cache.misses)
+		if self.capper is not None:
+			self.capper.resetReports()
+
+	def finish(self, generation, population, evaluated):
+		# Return the record of the generation measured since start (with
+		# evaluated individuals played or looked up), writing it if there is
+		# a writer, and start measuring the next one
+		seconds = time.time() - self.startTime
+		fits = [ind.fitness.values[0] for ind in population]
+		minFitness, maxFitness, avgFitness, stdFitness = getFitnessStats(fits)
+		record = {'generation': generation, 'individuals': len(population), 'evaluated': evaluated,
+				  'minFitness': minFitness, 'maxFitness': maxFitness, 'avgFitness': avgFitness,
+				  'stdFitness': stdFitness, 'seconds': seconds}
+
+		if self.evaluator is not None:
+			counters, busy = self.evaluator.resetStats()
+			record['games'] = counters['games']
+			if 'pieces' in counters:
+				record['pieces'] = counters['pieces']
+				record['piecesPerSecond'] = counters['pieces'] / seconds if seconds else None
+			# share of the generation every worker spent playing games
+			record['workerUtilisation'] = [busy[pid] / seconds if seconds else None for pid in sorted(busy)]
+			record['tableHitRate'] = getHitRate(counters.get('tableHits', 0), counters.get('tableMisses', 0), None)
+			record['reachabilityHitRate'] = getHitRate(counters.get('reachabilityHits', 0),
+													   counters.get('reachabilityMisses', 0), None)
+			# pieces decided for a whole group of individuals sharing a board,
+			# and the searches that saved (see sharedprefix.py)
+			if 'groupSearches' in counters:
+				record['sharedPieces'] = counters['sharedPieces']
+				record['searchesSaved'] = counters['sharedPieces'] - counters['groupSearches']
+			# games of capped evaluation stopped before they ended and the
+			# pieces they would have gone on for (see capping.py)
+			if 'pieces' in counters:
+				record['stoppedGames'] = counters.get('stoppedGames', 0)
+				record['piecesSkipped'] = counters.get('piecesSkipped', 0)
+			self.phaseStats = phases.PhaseStats.fromCounters(counters)
+			if self.phaseStats is not None:
+				for phase in ('spawn', 'search', 'place', 'lineClear'):
+					record[phase + 'Seconds'] = self.phaseStats.seconds[phase]
+				record['candidatesPerPiece'] = self.phaseStats.getCandidatesPerPiece()
+		if self.cache is not None:
+			hits, misses = self.cacheCounts
+			record['fitnessCacheHitRate'] = getHitRate(self.cache.hits - hits, self.cache.misses - misses, None)
+		if self.racer is not None:
+			# every individual raced this generation: its weights, games,
+			# fitness and why it stopped
+			record['racing'] = self.racer.reports
+		if self.capper is not None:
+			# every individual played with a piece cap this generation: its
+			# weights, the cap, its estimate and the half-width of its interval
+			record['capping'] = self.capper.resetReports()
+
+		if self.writer is not None:
+			self.writer.write(record)
+		self.start()
+		return record
+
+
+class MetricsWriter(object):
+
+	# Records are appended to path, so a resumed run continues its file
+	def __init__(self, path):
+		self.path = path
+		self.csv = path.endswith('.csv')
+		self.file = open(path, 'a')
+		self.writer = None
+		if self.csv:
+			self.writer = csv.DictWriter(self.file, FIELDS, extrasaction='ignore')
+			if not self.file.tell():
+				self.writer.writeheader()
+
+	def write(self, record):
+		# Write one record (a dict keyed by FIELDS; missing fields are left
+		# empty) and flush it, so the file is current while the run goes on
+		if self.csv:
+			row = dict(record)
+			if isinstance(row.get('workerUtilisation'), list):
+				row['workerUtilisation'] = ' '.join('%.3f' % u for u in row['workerUtilisation'])
+			for name in ('racing', 'capping'):
+				if row.get(name) is not None:
+					row[name] = json.dumps(row[name])
+			self.writer.writerow(row)
+		else:
+			self.file.write(json.dumps(dict((name, record.get(name)) for name in FIELDS)) + '\n')
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
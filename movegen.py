@@ -0,0 +1,120 @@
+# Reachability move generation for boards with overhangs.
+#
+# The column-drop search only finds placements a piece can be hard dropped
+# into from the top. Under an overhang a piece can also be tucked or slid
+# sideways into a spot no drop reaches. findReachablePlacements finds every
+# resting position a piece can get to from its spawn position with a breadth
+# first search over (rotation, x, y) states, moving left, right and down and
+# rotating either way (without wall kicks).
+#
+# The search only depends on the empty cells a piece can get to, the ones
+# connected to the top of the board. getSurfaceProfile fills in everything
+# else (sealed holes and everything below the open part of the board), so
+# boards that only differ where no piece can go share one profile, and
+# ReachabilityCache remembers the placements found for every
+# (profile, shape, rotation) so a repeated profile costs nothing.
+
+from collections import OrderedDict
+
+import bitboard
+from bitboard import BOARDHEIGHT, FULLROW
+from hitcount import HitCounter
+
+
+def getOpenCells(rows):
+	# For every row, the mask of its empty cells connected to the top of the
+	# board. Open cells spread sideways within a row and up and down between
+	# rows, so passes are made down and back up until nothing changes.
+	empty = [FULLROW & ~row for row in rows]
+	reach = [0] * BOARDHEIGHT
+	passes = list(range(BOARDHEIGHT)) + list(range(BOARDHEIGHT - 2, -1, -1))
+	changed = True
+	while changed:
+		changed = False
+		for y in passes:
+			seed = reach[y] | (empty[0] if y == 0 else reach[y - 1])
+			if y + 1 < BOARDHEIGHT:
+				seed |= reach[y + 1]
+			seed &= empty[y]
+			while True:
+				spread = (seed | seed << 1 | seed >> 1) & empty[y]
+				if spread == seed:
+					break
+				seed = spread
+			if seed != reach[y]:
+				reach[y] = seed
+				changed = True
+	return reach
+
+
+def getSurfaceProfile(rows):
+	# the rows with every cell a piece can't get to filled in
+	return tuple([FULLROW & ~openCells for openCells in getOpenCells(rows)])
+
+
+def findReachablePlacements(profile, pieceMasks, orientations, rotation, spawnX, spawnY):
+	# Every resting (rotation, x, y) a piece spawning at (spawnX, spawnY) in
+	# the given rotation can reach on a board with the profile's rows, in the
+	# fixed search order: by orientation, then x, then y. pieceMasks are the
+	# shape's masks by rotation and orientations its distinct rotations (see
+	# bitboard.buildOrientationTable). Placements sticking out of the top of
+	# the board are left out.
+	board = bitboard.Board(list(profile))
+	numRotations = len(pieceMasks)
+	start = (rotation, spawnX, spawnY)
+	if not board.isValidPosition(pieceMasks[rotation], spawnX, spawnY):
+		return ()
+
+	seen = set([start])
+	queue = [start]
+	resting = []
+	for state in queue:
+		rotation, x, y = state
+		if not board.isValidPosition(pieceMasks[rotation], x, y + 1):
+			resting.append(state)
+		for nextState in ((rotation, x - 1, y), (rotation, x + 1, y), (rotation, x, y + 1),
+						  ((rotation + 1) % numRotations, x, y), ((rotation - 1) % numRotations, x, y)):
+			if nextState not in seen:
+				seen.add(nextState)
+				if board.isValidPosition(pieceMasks[nextState[0]], nextState[1], nextState[2]):
+					queue.append(nextState)
+
+	order = dict((rotation, i) for i, rotation in enumerate(orientations))
+	placements = [(order[rotation], x, y) for rotation, x, y in resting
+				  if rotation in order and y + pieceMasks[rotation][0][0][0] >= 0]
+	placements.sort()
+	return tuple([(orientations[i], x, y) for i, x, y in placements])
+
+
+class ReachabilityCache(HitCounter):
+
+	# Remembers the reachable placements of up to maxSize
+	# (profile, shape, rotation) keys, dropping the least recently used
+	def __init__(self, pieceMasks, orientations, spawnX, spawnY, maxSize=10000):
+		self.pieceMasks = pieceMasks
+		self.orientations = orientations
+		self.spawnX = spawnX
+		self.spawnY = spawnY
+		self.maxSize = maxSize
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def getPlacements(self, board, shape, rotation):
+		# the reachable placements of the piece on the board, see
+		# findReachablePlacements
+		key = (getSurfaceProfile(board.rows), shape, rotation)
+		placements = self.entries.pop(key, None)
+		if placements is None:
+			self.misses += 1
+			placements = findReachablePlacements(key[0], self.pieceMasks[shape], self.orientations[shape],
+												 rotation, self.spawnX, self.spawnY)
+			while len(self.entries) >= self.maxSize:
+				self.entries.popitem(last=False)
+		else:
+			self.hits += 1
+		self.entries[key] = placements
+		return placements
@@ -0,0 +1,162 @@
+# Parallel fitness evaluation.
+#
+# ParallelEvaluator plays games in a pool of worker processes. Work is split
+# per (individual, game) rather than per individual, so the 10 games of a
+# strong individual (which play far longer than a weak one's) are spread over
+# several cores instead of keeping one busy while the others sit idle. Tasks
+# are handed out in chunks to keep the inter-process overhead down.
+#
+# The pool is only created when the evaluator is started, never at import
+# time, so this works on spawn-based platforms and from importing code.
+#
+# Games report counters (pieces played, cache hits, ...) along with their
+# score. The evaluator sums them and the time every worker spent playing, so
+# the trainer can report throughput and worker utilisation, and it can run
+# cProfile in one worker (or in this process if there is no pool). Evaluator
+# has what it shares with distributed.Coordinator: the counters, evaluate
+# and the context manager.
+
+import multiprocessing, os, time, cProfile
+from multiprocessing import util
+
+
+def playTask(task):
+	# run in the workers: task is (playGame, args). Returns the game's score
+	# and counters, the worker's pid and the seconds the game took.
+	playGame, args = task
+	start = time.time()
+	score, counters = playGame(*args)
+	return score, counters, os.getpid(), time.time() - start
+
+
+def initWorker(initializer, initargs, profileClaimed, profilePath):
+	# run once in every worker: the first one to start profiles itself until
+	# it exits if a profile was asked for
+	if initializer is not None:
+		initializer(*initargs)
+	if profilePath is not None:
+		with profileClaimed.get_lock():
+			claimed = not profileClaimed.value
+			profileClaimed.value = 1
+		if claimed:
+			profiler = cProfile.Profile()
+			util.Finalize(profiler, profiler.dump_stats, (profilePath,), exitpriority=10)
+			profiler.enable()
+
+
+class Evaluator(object):
+
+	# Subclasses implement start, close, terminate and playGames, and add up
+	# the counters of every game they play with addCounters
+	def __init__(self):
+		self.counters = {'games': 0}
+		self.busy = {}
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, excType, excValue, traceback):
+		if excType is None:
+			self.close()
+		else:
+			self.terminate()
+
+	def resetStats(self):
+		# Return the counters and busy times gathered since the last reset
+		# and start over. counters sums the games' counters and has the
+		# number of games; busy has the seconds every worker spent playing.
+		stats = self.counters, self.busy
+		self.counters = {'games': 0}
+		self.busy = {}
+		return stats
+
+	def addCounters(self, gameCounters):
+		# add the counters of one task; a task is one game unless its
+		# counters say how many it played
+		counters = self.counters
+		for name in gameCounters:
+			counters[name] = counters.get(name, 0) + gameCounters[name]
+		if 'games' not in gameCounters:
+			counters['games'] += 1
+
+	def evaluate(self, individuals, seeds):
+		# Return the fitness tuple (average score over one game per seed) of
+		# every individual. playGame is called as playGame(individual, seed).
+		scores = self.playGames([(list(individual), seed) for individual in individuals for seed in seeds])
+
+		numGames = len(seeds)
+		fitnesses = []
+		for i in range(len(individuals)):
+			fitnesses.append((float(sum(scores[i * numGames:(i + 1) * numGames])) / numGames,))
+		return fitnesses
+
+
+class ParallelEvaluator(Evaluator):
+
+	# playGame must be a module level function (so it can be pickled) that
+	# plays one game and returns its score and a dict of counters. workers
+	# defaults to the number of cores; with a single worker games are played
+	# in this process. initializer(*initargs) is run once in every worker
+	# when it starts. With profilePath one worker's games are profiled with
+	# cProfile, and the stats written to profilePath when it exits.
+	def __init__(self, playGame, workers=None, chunksize=None, initializer=None, initargs=(), profilePath=None):
+		Evaluator.__init__(self)
+		self.playGame = playGame
+		self.workers = workers or multiprocessing.cpu_count()
+		self.chunksize = chunksize
+		self.initializer = initializer
+		self.initargs = initargs
+		self.profilePath = profilePath
+		self.profiler = None
+		self.pool = None
+
+	def start(self):
+		if self.pool is None and self.workers > 1:
+			self.pool = multiprocessing.Pool(self.workers, initWorker, (self.initializer, self.initargs,
+																		 multiprocessing.Value('b', 0), self.profilePath))
+		elif self.workers == 1 and self.profilePath is not None and self.profiler is None:
+			self.profiler = cProfile.Profile()
+		return self
+
+	def close(self):
+		# let the workers finish and shut them down
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+			self.pool = None
+		if self.profiler is not None:
+			self.profiler.dump_stats(self.profilePath)
+			self.profiler = None
+
+	def terminate(self):
+		# stop the workers straight away, dropping any outstanding games
+		if self.pool is not None:
+			self.pool.terminate()
+			self.pool.join()
+			self.pool = None
+
+	def playGames(self, gameArgs):
+		# Play one game per argument tuple, returning the scores in order
+		tasks = [(self.playGame, args) for args in gameArgs]
+		if self.pool is None:
+			if self.profiler is not None:
+				self.profiler.enable()
+			try:
+				results = [playTask(task) for task in tasks]
+			finally:
+				if self.profiler is not None:
+					self.profiler.disable()
+		else:
+			chunksize = self.chunksize
+			if chunksize is None:
+				# about four chunks per worker balances load against overhead
+				chunksize = max(1, len(tasks) // (self.workers * 4))
+			results = list(self.pool.imap(playTask, tasks, chunksize))
+
+		scores = []
+		busy = self.busy
+		for score, gameCounters, pid, seconds in results:
+			scores.append(score)
+			self.addCounters(gameCounters)
+			busy[pid] = busy.get(pid, 0.0) + seconds
+		return scores
@@ -0,0 +1,89 @@
+# Per-phase instrumentation of the game loop.
+#
+# PhaseStats adds up, for every phase of a piece's turn, how often it ran and
+# the time it took, along with the pieces played and the candidate placements
+# their searches scored (both pieces' of the depth-2 search, and the tucks and
+# slides with tucks on; candidates sticking out of the board aren't scored).
+# The searches add their candidates themselves. The phases are spawning the piece, searching for its
+# best placement (move generation and evaluation are one fused loop over the
+# placement table, and the board copies of the depth-2 and tuck searches
+# happen inside it), placing it, clearing lines and, in the game window,
+# drawing. The game loops only time phases when they are given a PhaseStats,
+# so with instrumentation off the cost is one `is not None` test per phase.
+#
+# getCounters turns the stats into a flat dict of numbers that can be summed
+# across worker processes (see parallel.ParallelEvaluator) and fromCounters
+# turns the sums back into stats, so the trainer gets one profile per
+# generation out of all of its workers.
+
+import time
+
+PHASES = ('spawn', 'search', 'place', 'lineClear', 'draw')
+
+
+class PhaseStats(object):
+
+	def __init__(self):
+		self.calls = dict((phase, 0) for phase in PHASES)
+		self.seconds = dict((phase, 0.0) for phase in PHASES)
+		self.pieces = 0
+		self.candidates = 0
+		self.last = None
+
+	def start(self):
+		# start timing the first phase of a piece
+		self.last = time.time()
+
+	def lap(self, phase):
+		# charge the time since the last start or lap to phase
+		now = time.time()
+		self.calls[phase] += 1
+		self.seconds[phase] += now - self.last
+		self.last = now
+
+	def addPiece(self):
+		self.pieces += 1
+
+	def addCandidates(self, candidates):
+		self.candidates += candidates
+
+	def getCounters(self):
+		counters = {'phase.pieces': self.pieces, 'phase.candidates': self.candidates}
+		for phase in PHASES:
+			if self.calls[phase]:
+				counters['phase.%s.calls' % phase] = self.calls[phase]
+				counters['phase.%s.seconds' % phase] = self.seconds[phase]
+		return counters
+
+	@classmethod
+	def fromCounters(cls, counters):
+		# the stats summed into counters (other counters are ignored), or None
+		# if there are none
+		if 'phase.pieces' not in counters:
+			return None
+		stats = cls()
+		stats.pieces = counters['phase.pieces']
+		stats.candidates = counters['phase.candidates']
+		for phase in PHASES:
+			stats.calls[phase] = counters.get('phase.%s.calls' % phase, 0)
+			stats.seconds[phase] = counters.get('phase.%s.seconds' % phase, 0.0)
+		return stats
+
+	def getCandidatesPerPiece(self):
+		if not self.pieces:
+			return 0.0
+		return float(self.candidates) / self.pieces
+
+	def format(self):
+		# a table of the phases that ran, with their share of the time
+		total = sum(self.seconds.values())
+		lines = ['Phase        Calls   Seconds  Share  us/call']
+		for phase in PHASES:
+			calls = self.calls[phase]
+			if not calls:
+				continue
+			seconds = self.seconds[phase]
+			lines.append('%-10s %7d %9.3f %5.1f%% %8.1f' % (phase, calls, seconds, seconds / total * 100 if total else 0.0,
+														  seconds / calls * 1e6))
+		lines.append('%d pieces, %.1f candidate placements scored per piece' % (self.pieces, self.getCandidatesPerPiece()))
+		return '\n'.join(lines)
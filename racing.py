@@ -0,0 +1,121 @@
+# Racing evaluation for the trainer.
+#
+# Most individuals of a generation are clearly worse than the ones that will
+# survive selection, yet each of them would play all of its games. A racing
+# evaluation plays the games in stages (2, then 5, then all 10 by default)
+# and after every stage drops the individuals whose upper confidence bound,
+# mean + t * standard error, is below the selection cutoff. t is the 97.5%
+# quantile of Student's t distribution for the games played, so a bound from
+# only a couple of games is as wide as it has to be. Dropped individuals get
+# the average of the games they played as their fitness.
+
+import math
+
+# one-sided 97.5% quantiles of Student's t by degrees of freedom (games
+# played - 1); more degrees of freedom than listed use the last entry below
+# them, which is a little wider than the true quantile
+TQUANTILES = [(1, 12.706), (2, 4.303), (3, 3.182), (4, 2.776), (5, 2.571), (6, 2.447), (7, 2.365), (8, 2.306),
+			  (9, 2.262), (10, 2.228), (15, 2.131), (20, 2.086), (30, 2.042), (60, 2.000), (120, 1.980)]
+
+
+def getTQuantile(degrees):
+	quantile = None
+	for tableDegrees, tableQuantile in TQUANTILES:
+		if tableDegrees > degrees:
+			break
+		quantile = tableQuantile
+	return quantile
+
+
+class RacingEvaluator(object):
+
+	# playGames(gameArgs) plays one game per (individual, seed) tuple and
+	# returns the scores, like ParallelEvaluator.playGames. stages are the
+	# cumulative number of games played at each stage. Fitnesses of
+	# individuals that played every game are looked up in and saved to cache
+	# (a FitnessCache) if one is given.
+	def __init__(self, playGames, seeds, stages=(2, 5), quantile=0.5, cache=None, maxPieces=None):
+		self.playGames = playGames
+		self.seeds = tuple(seeds)
+		self.stages = [n for n in stages if n < len(self.seeds)] + [len(self.seeds)]
+		self.quantile = quantile
+		self.cache = cache
+		self.maxPieces = maxPieces
+		self.cutoff = None
+		self.reports = []
+
+	def updateCutoff(self, population):
+		# Set the cutoff to the given quantile of the population's fitnesses.
+		# With the default 0.5 an individual has to be able to beat at least
+		# half of the current population to keep playing.
+		fits = sorted(ind.fitness.values[0] for ind in population)
+		self.cutoff = fits[min(len(fits) - 1, int(len(fits) * self.quantile))]
+
+	def getUpperBound(self, scores):
+		n = len(scores)
+		mean = float(sum(scores)) / n
+		if n < 2:
+			return float('inf')
+		variance = sum((s - mean) ** 2 for s in scores) / (n - 1)
+		return mean + getTQuantile(n - 1) * math.sqrt(variance / n)
+
+	def evaluate(self, individuals):
+		# Return the fitness tuple of every individual. self.reports is set to
+		# one dict per individual with its weights, the games it played, its
+		# fitness and why it stopped.
+		self.reports = [None] * len(individuals)
+		scores = [[] for individual in individuals]
+		racing = []
+		for i, individual in enumerate(individuals):
+			fitness = None
+			if self.cache is not None:
+				fitness = self.cache.get(self.cache.key(individual, self.seeds, self.maxPieces))
+			if fitness is None:
+				racing.append(i)
+			else:
+				self.reports[i] = {'weights': list(individual), 'games': 0, 'fitness': fitness[0], 'reason': 'cached'}
+
+		played = 0
+		for stage in self.stages:
+			if not racing:
+				break
+			gameArgs = [(list(individuals[i]), seed) for i in racing for seed in self.seeds[played:stage]]
+			results = self.playGames(gameArgs)
+			numGames = stage - played
+			for n, i in enumerate(racing):
+				scores[i].extend(results[n * numGames:(n + 1) * numGames])
+			played = stage
+
+			if stage == len(self.seeds) or self.cutoff is None:
+				continue
+			stillRacing = []
+			for i in racing:
+				upperBound = self.getUpperBound(scores[i])
+				if upperBound < self.cutoff:
+					self.reports[i] = {'weights': list(individuals[i]), 'games': played, 'fitness': float(sum(scores[i])) / played,
+									   'reason': 'cut: upper bound %.2f < cutoff %.2f' % (upperBound, self.cutoff)}
+				else:
+					stillRacing.append(i)
+			racing = stillRacing
+
+		for i in racing:
+			fitness = float(sum(scores[i])) / len(scores[i])
+			self.reports[i] = {'weights': list(individuals[i]), 'games': len(scores[i]), 'fitness': fitness,
+							   'reason': 'complete'}
+			if self.cache is not None:
+				self.cache.put(self.cache.key(individuals[i], self.seeds, self.maxPieces), (fitness,))
+
+		return [(report['fitness'],) for report in self.reports]
+
+	def getSummary(self):
+		# one line describing the last evaluate call, with how many
+		# individuals played every number of games (the reports of every
+		# individual go in the metrics records, see metrics.py)
+		cut = [report for report in self.reports if report['reason'].startswith('cut')]
+		games = sum(report['games'] for report in self.reports)
+		counts = {}
+		for report in self.reports:
+			counts[report['games']] = counts.get(report['games'], 0) + 1
+		return 'Racing: %d of %d individuals cut, %d of %d games played (games: individuals %s)' % (
+			len(cut), len(self.reports), games, len(self.reports) * len(self.seeds),
+			', '.join('%d: %d' % (n, counts[n]) for n in sorted(counts)))
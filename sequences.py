@@ -0,0 +1,95 @@
+# Pre-generated, seeded piece sequences.
+#
+# Every game of an evaluation replays a fixed piece sequence, so all
+# individuals are compared on exactly the same games (common random numbers)
+# and the game loop never has to draw random pieces. A sequence is a compact
+# byte string with one code per piece: shapeIndex * 4 + rotation, where the
+# shapes are numbered in sorted order of their names. PieceSequences holds
+# one sequence per seed back to back and can be saved to a file, which can
+# then be memory-mapped by every worker instead of regenerated.
+
+import mmap, random, struct
+
+MAGIC = b'TSEQ'
+HEADER = struct.Struct('<4sBII') # magic, number of shapes, length, number of seeds
+SEED = struct.Struct('<q')
+
+
+def buildPieceCodes(pieces):
+	# Return the list mapping every code to its (shape, rotation), with None
+	# for codes of rotations a shape doesn't have
+	pieceCodes = []
+	for shape in sorted(pieces):
+		for rotation in range(4):
+			if rotation < len(pieces[shape]):
+				pieceCodes.append((shape, rotation))
+			else:
+				pieceCodes.append(None)
+	return pieceCodes
+
+
+def generateSequence(rng, pieces, length):
+	# length random piece codes drawn from rng, uniform over shapes and then
+	# over the rotations of the shape, like getNewPiece
+	shapes = sorted(pieces)
+	rotations = [len(pieces[shape]) for shape in shapes]
+	sequence = bytearray(length)
+	for i in range(length):
+		shapeIndex = rng.randrange(len(shapes))
+		sequence[i] = shapeIndex * 4 + rng.randrange(rotations[shapeIndex])
+	return sequence
+
+
+class PieceSequences(object):
+
+	# data holds one sequence of length codes per seed, back to back. It is a
+	# bytearray for generated sequences or an mmap of a file written by save().
+	def __init__(self, shapes, seeds, length, data, offset=0):
+		self.shapes = shapes
+		self.seeds = list(seeds)
+		self.length = length
+		self.data = data
+		self.offset = offset
+		self.seedIndex = dict((seed, i) for i, seed in enumerate(self.seeds))
+
+	@classmethod
+	def generate(cls, pieces, seeds, length):
+		data = bytearray()
+		for seed in seeds:
+			data += generateSequence(random.Random(seed), pieces, length)
+		return cls(''.join(sorted(pieces)), seeds, length, data)
+
+	@classmethod
+	def load(cls, path, useMmap=True):
+		with open(path, 'rb') as f:
+			if useMmap:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			else:
+				data = bytearray(f.read())
+		magic, numShapes, length, numSeeds = HEADER.unpack_from(data, 0)
+		if magic != MAGIC:
+			raise ValueError('%s is not a piece sequence file' % path)
+		offset = HEADER.size
+		shapes = bytes(data[offset:offset + numShapes]).decode('ascii')
+		offset += numShapes
+		seeds = []
+		for i in range(numSeeds):
+			seeds.append(SEED.unpack_from(data, offset)[0])
+			offset += SEED.size
+		return cls(shapes, seeds, length, data, offset)
+
+	def save(self, path):
+		with open(path, 'wb') as f:
+			f.write(HEADER.pack(MAGIC, len(self.shapes), self.length, len(self.seeds)))
+			f.write(self.shapes.encode('ascii'))
+			for seed in self.seeds:
+				f.write(SEED.pack(seed))
+			f.write(self.data[self.offset:self.offset + len(self.seeds) * self.length])
+
+	def __contains__(self, seed):
+		return seed in self.seedIndex
+
+	def getSequence(self, seed):
+		# the codes of the game played with seed, as a bytearray
+		start = self.offset + self.seedIndex[seed] * self.length
+		return bytearray(self.data[start:start + self.length])
@@ -0,0 +1,79 @@
+# Shared-prefix evaluation of a whole population.
+#
+# Every individual plays the same seeded piece sequences, so at the start of
+# a game they all search the same first piece on the same empty board, and
+# individuals with similar weights keep making the same moves, and so keep
+# sharing the same board, for a while after that. playSharedGame plays one
+# sequence for the whole population at once, keeping the individuals in
+# groups that are still on the same board. The candidates of a group's piece
+# are built and their features computed once (see batcheval.py) and scored
+# for every member at once with batcheval.scoreFeatures. The group
+# then splits by the move each member picked. Once a group is smaller than
+# minGroup its members play the rest of the game on their own with
+# engine.playGame.
+#
+# Candidates are ranked in the same order and ties keep the first one, so
+# every individual plays exactly the game engine.playGame would.
+
+import numpy as np
+
+import engine, batcheval
+
+
+# Play the piece codes of sequence (see sequences.py) with every weight
+# vector, stopping after maxPieces pieces like engine.playGame. Returns the
+# lines every weight vector cleared and a dict of counters: the pieces
+# played, sharedPieces of them decided in a group of at least minGroup
+# individuals, and groupSearches, the searches done for those (one per
+# group and piece).
+def playSharedGame(weights, sequence, maxPieces=engine.MAXPIECES, minGroup=4):
+	weights = np.asarray(weights, dtype=float)
+	scores = [0] * len(weights)
+	counters = {'pieces': 0, 'sharedPieces': 0, 'groupSearches': 0}
+	length = min(maxPieces, len(sequence))
+
+	# every group is (board, members, lines cleared), with the members' indices
+	# in weights
+	groups = [(engine.getBlankBoard(), np.arange(len(weights)), 0)]
+	for i in range(length):
+		if not groups:
+			break
+		shape, rotation = engine.PIECECODES[sequence[i]]
+		piece = {'shape': shape, 'rotation': rotation}
+		nextGroups = []
+		for board, members, lines in groups:
+			if len(members) < minGroup:
+				for member in members:
+					score, pieces = engine.playGame(list(weights[member]), sequence[i:], length - i, board=board.copy())
+					scores[member] = lines + score
+					counters['pieces'] += pieces
+				continue
+			if not board.isValidPosition(engine.PIECEMASKS[shape][rotation], engine.SPAWNX, engine.SPAWNY):
+				for member in members:
+					scores[member] = lines # can't fit a new piece on the board, so game over
+				continue
+
+			counters['pieces'] += len(members)
+			counters['sharedPieces'] += len(members)
+			counters['groupSearches'] += 1
+			boards, moves = batcheval.getAllMoves(board, piece, engine.PLACEMENTS, engine.ORIENTATIONS)
+			if not moves:
+				# no legal move: the board stays as it is, like engine.playGame
+				nextGroups.append((board, members, lines))
+				continue
+			# argmax keeps the first of equal scores, like engine.findBestMove
+			best = batcheval.scoreFeatures(batcheval.getFeatures(boards), weights[members]).argmax(axis=1)
+			for move in np.unique(best):
+				moveRotation, x, y = moves[move]
+				child = board.copy()
+				child.place(engine.PIECEMASKS[shape][moveRotation], x, y)
+				cleared = child.removeCompleteLines()
+				nextGroups.append((child, members[best == move], lines + cleared))
+		groups = nextGroups
+
+	# games that reached the piece cap
+	for board, members, lines in groups:
+		for member in members:
+			scores[member] = lines
+	return scores, counters
+
@@ -0,0 +1,68 @@
+# The NumPy batch evaluator (batcheval), the lockstep batched simulation
+# (batchsim) and the shared-prefix games built on batcheval must pick the
+# same moves as the scalar search, so games played either way clear the same
+# lines. Some weights make exact ties between candidates, which both have to
+# break the same way. Run with python -m unittest test_batcheval.
+
+import random, unittest
+import engine, sequences, benchmark
+
+try:
+	import numpy
+	import batcheval, batchsim, sharedprefix
+except ImportError:
+	numpy = None
+
+WEIGHTS = [
+	[-.516, .76, -.356, -.1844],
+	[-.6, .5, -.8, -.2],
+	[.1, -.3, -.9, .4],
+]
+SEEDS = (0, 1, 2)
+MAXPIECES = 300
+
+
+def getSequence(seed):
+	return sequences.generateSequence(random.Random(seed), engine.PIECES, MAXPIECES + 1)
+
+
+@unittest.skipIf(numpy is None, 'needs NumPy')
+class BatchEvalTest(unittest.TestCase):
+
+	def testBestMoves(self):
+		# every piece on every fixture board, for one weight vector at a time
+		# and for all of them at once
+		for name in sorted(benchmark.FIXTURES):
+			board = benchmark.makeBoard(benchmark.FIXTURES[name])
+			for shape in sorted(engine.PIECES):
+				piece = {'shape': shape, 'rotation': 0}
+				expected = [engine.getBestMove(board, piece, *weights) for weights in WEIGHTS]
+				for weights, move in zip(WEIGHTS, expected):
+					self.assertEqual(batcheval.getBestMove(board, piece, weights, engine.PLACEMENTS, engine.ORIENTATIONS),
+									 move, (name, shape, weights))
+				self.assertEqual(batcheval.getBestMove(board, piece, WEIGHTS, engine.PLACEMENTS, engine.ORIENTATIONS),
+								 expected, (name, shape))
+
+	def testVectorizedGames(self):
+		for weights in WEIGHTS:
+			for seed in SEEDS:
+				sequence = getSequence(seed)
+				self.assertEqual(engine.playGame(weights, sequence, MAXPIECES, vectorized=True),
+								 engine.playGame(weights, sequence, MAXPIECES), (weights, seed))
+
+	def testBatchedGames(self):
+		gameSequences = [getSequence(seed) for seed in SEEDS]
+		scores, pieces = batchsim.runGames(WEIGHTS, gameSequences, engine.PIECECODES, engine.PLACEMENTS, engine.ORIENTATIONS,
+										   engine.SPAWNX, engine.SPAWNY, MAXPIECES)
+		expected = [[engine.playGame(weights, sequence, MAXPIECES) for sequence in gameSequences] for weights in WEIGHTS]
+		self.assertEqual([list(zip(gameScores, gamePieces)) for gameScores, gamePieces in zip(scores, pieces)], expected)
+
+	def testSharedPrefixGames(self):
+		for seed in SEEDS:
+			sequence = getSequence(seed)
+			scores, counters = sharedprefix.playSharedGame(WEIGHTS, sequence, MAXPIECES, minGroup=1)
+			self.assertEqual(scores, [engine.playGame(weights, sequence, MAXPIECES)[0] for weights in WEIGHTS], seed)
+
+
+if __name__ == '__main__':
+	unittest.main()
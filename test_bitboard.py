@@ -0,0 +1,195 @@
+# The state bitboard.Board tracks as pieces are placed (column heights and
+# holes, row counts and the feature totals) must always equal what a full
+# recount of its rows gives, and getPlacementFeatures must predict the
+# features of the board a drop leaves. Boards are built from random drops and
+# random resting positions, and the reference features are counted cell by
+# cell. Clearing lines must remove exactly the full rows, as removing them one
+# at a time would, and keep the tracked state and the colors right too. Run
+# with python -m unittest test_bitboard.
+
+import random, unittest
+import bitboard, engine
+from bitboard import BOARDWIDTH, BOARDHEIGHT
+
+SEEDS = range(20)
+WEIGHTS = (-.516, .76, -.356, -.1844)
+
+
+def getReferenceFeatures(rows):
+	# (aggregate height, complete lines, holes, bumpiness) counted cell by cell
+	heights = []
+	holes = 0
+	for x in range(BOARDWIDTH):
+		column = [rows[y] >> x & 1 for y in range(BOARDHEIGHT)]
+		top = column.index(1) if 1 in column else BOARDHEIGHT
+		heights.append(BOARDHEIGHT - top)
+		holes += column[top:].count(0)
+	completeLines = sum(1 for row in rows if row == bitboard.FULLROW)
+	bumpiness = sum(abs(heights[x] - heights[x - 1]) for x in range(1, BOARDWIDTH))
+	return sum(heights), completeLines, holes, bumpiness
+
+
+def getTrackedState(board):
+	return board.heights[:], board.holes[:], board.rowCounts[:], board.getFeatures()
+
+
+def getRandomDrop(board, rng):
+	# a random (shape, rotation, x, y) column drop that fits on the board, or
+	# None if the piece drawn doesn't fit anywhere
+	shape = rng.choice(sorted(engine.PIECES))
+	rotation = rng.randrange(len(engine.PLACEMENTS[shape]))
+	placement = engine.PLACEMENTS[shape][rotation]
+	drops = [(x, bitboard.getLandingRow(board.heights, placement, x)) for x in placement[2]]
+	drops = [(x, y) for x, y in drops if y + placement[4] >= 0]
+	if not drops:
+		return None
+	x, y = rng.choice(drops)
+	return shape, rotation, x, y
+
+
+class IncrementalStateTest(unittest.TestCase):
+
+	def assertRecounted(self, board, message):
+		# the tracked state matches a fresh board built from the same rows,
+		# and the features match the cell by cell count
+		recounted = bitboard.Board(board.rows[:])
+		self.assertEqual(getTrackedState(board), getTrackedState(recounted), message)
+		self.assertEqual(board.getFeatures(), getReferenceFeatures(board.rows), message)
+
+	def testDrops(self):
+		for seed in SEEDS:
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for i in range(60):
+				drop = getRandomDrop(board, rng)
+				if drop is None:
+					break
+				shape, rotation, x, y = drop
+				self.assertTrue(board.place(engine.PIECEMASKS[shape][rotation], x, y))
+				self.assertRecounted(board, (seed, i))
+
+	def testRestingAnywhere(self):
+		# pieces placed at any free position, under overhangs and floating,
+		# so columns gain holes anywhere below their tops
+		for seed in SEEDS:
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for i in range(40):
+				shape = rng.choice(sorted(engine.PIECES))
+				rotation = rng.randrange(len(engine.PIECEMASKS[shape]))
+				mask = engine.PIECEMASKS[shape][rotation]
+				x = rng.randrange(-mask[1], BOARDWIDTH - mask[2])
+				y = rng.randrange(-mask[0][0][0], BOARDHEIGHT - mask[0][-1][0])
+				if board.isValidPosition(mask, x, y):
+					board.place(mask, x, y)
+					self.assertRecounted(board, (seed, i))
+
+	def testSetCell(self):
+		rng = random.Random(0)
+		board = bitboard.Board()
+		for i in range(300):
+			x = rng.randrange(BOARDWIDTH)
+			y = rng.randrange(BOARDHEIGHT)
+			board.setCell(x, y, rng.choice([bitboard.BLANK, bitboard.FILLED]))
+			self.assertRecounted(board, i)
+
+	def testPlacementFeatures(self):
+		# the features predicted for every drop are those of the board after
+		# the drop, and predicting them leaves the board alone
+		for seed in SEEDS:
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for i in range(30):
+				state = getTrackedState(board)
+				for shape in sorted(engine.PIECES):
+					for rotation in engine.ORIENTATIONS[shape]:
+						placement = engine.PLACEMENTS[shape][rotation]
+						for x in placement[2]:
+							y = bitboard.getLandingRow(board.heights, placement, x)
+							if y + placement[4] < 0:
+								continue
+							placed = board.copy()
+							placed.place(placement[0], x, y)
+							self.assertEqual(board.getPlacementFeatures(placement, x, y), placed.getFeatures(),
+											 (seed, i, shape, rotation, x))
+				self.assertEqual(getTrackedState(board), state)
+				drop = getRandomDrop(board, rng)
+				if drop is None:
+					break
+				shape, rotation, x, y = drop
+				board.place(engine.PIECEMASKS[shape][rotation], x, y)
+
+	def testCopy(self):
+		rng = random.Random(0)
+		board = bitboard.Board()
+		for i in range(10):
+			shape, rotation, x, y = getRandomDrop(board, rng)
+			board.place(engine.PIECEMASKS[shape][rotation], x, y)
+		copy = board.copy()
+		state = getTrackedState(board)
+		rows = board.rows[:]
+		shape, rotation, x, y = getRandomDrop(copy, rng)
+		copy.place(engine.PIECEMASKS[shape][rotation], x, y)
+		self.assertEqual(board.rows, rows)
+		self.assertEqual(getTrackedState(board), state)
+
+
+def getRandomRows(rng):
+	# random rows under an empty top, some of them full, so cleared rows
+	# are next to each other, apart and at the top of columns
+	top = rng.randrange(BOARDHEIGHT)
+	rows = [0] * top
+	for y in range(top, BOARDHEIGHT):
+		if rng.random() < 0.3:
+			rows.append(bitboard.FULLROW)
+		else:
+			rows.append(rng.randrange(bitboard.FULLROW))
+	return rows
+
+
+class LineClearTest(unittest.TestCase):
+
+	def testRandomRows(self):
+		for seed in range(500):
+			rng = random.Random(seed)
+			rows = getRandomRows(rng)
+			colors = [[rng.randrange(4) if row >> x & 1 else bitboard.BLANK for x in range(BOARDWIDTH)] for row in rows]
+			board = bitboard.Board(rows[:], [row[:] for row in colors])
+			full = [y for y in range(BOARDHEIGHT) if rows[y] == bitboard.FULLROW]
+			kept = [y for y in range(BOARDHEIGHT) if y not in full]
+
+			self.assertEqual(board.clearLines(), tuple(full), seed)
+			self.assertEqual(board.rows, [0] * len(full) + [rows[y] for y in kept], seed)
+			self.assertEqual(board.colors, [[bitboard.BLANK] * BOARDWIDTH] * len(full) + [colors[y] for y in kept], seed)
+			self.assertEqual(getTrackedState(board), getTrackedState(bitboard.Board(board.rows[:])), seed)
+
+	def testNothingToClear(self):
+		rows = [0] * 10 + [bitboard.FULLROW - 1] * 10
+		board = bitboard.Board(rows[:])
+		self.assertEqual(board.clearLines(), ())
+		self.assertEqual(board.rows, rows)
+
+	def testGames(self):
+		# lines cleared during play, from state kept up to date by placing
+		# pieces rather than recounted; mostly the search's moves, which
+		# clear lines, and some random ones, which leave holes
+		for seed in SEEDS:
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for i in range(200):
+				drop = getRandomDrop(board, rng)
+				if drop is None:
+					break
+				shape, rotation, x, y = drop
+				if rng.random() < 0.8:
+					rotation, x, y = engine.findBestMove(board, shape, *WEIGHTS)
+				board.place(engine.PIECEMASKS[shape][rotation], x, y)
+				rows = board.rows[:]
+				full = [y for y in range(BOARDHEIGHT) if rows[y] == bitboard.FULLROW]
+				self.assertEqual(board.removeCompleteLines(), len(full))
+				self.assertEqual(board.rows, [0] * len(full) + [row for row in rows if row != bitboard.FULLROW])
+				self.assertEqual(getTrackedState(board), getTrackedState(bitboard.Board(board.rows[:])), (seed, i))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,135 @@
+# A capped game must play exactly the moves engine.playGame does, however it
+# is split into blocks, and only report itself stopped when it was cut short.
+# getEstimate must count finished games exactly and extrapolate stopped ones,
+# and CappedEvaluator must cache fitnesses under the cap they were estimated
+# at and keep a report of every individual it played until they are
+# collected. Run with python -m unittest test_capping.
+
+import math, random, unittest
+import capping, engine, fitnesscache, sequences
+
+GOOD = (-.516, .76, -.356, -.1844)
+BAD = (.5, -.5, .5, .5) # loses within a few dozen pieces
+MAXPIECES = 300
+
+
+def getSequence(seed):
+	return sequences.generateSequence(random.Random(seed), engine.PIECES, MAXPIECES + 1)
+
+
+class CappedGameTest(unittest.TestCase):
+
+	def testUncapped(self):
+		for weights in (GOOD, BAD):
+			for seed in range(3):
+				sequence = getSequence(seed)
+				score, pieces = engine.playGame(weights, sequence, MAXPIECES)
+				for block in (capping.BLOCK, 7):
+					self.assertEqual(capping.playCappedGame(weights, sequence, MAXPIECES, MAXPIECES, block),
+									 (score, pieces, 0.0, False), (weights, seed, block))
+
+	def testCapped(self):
+		sequence = getSequence(0)
+		score, pieces = engine.playGame(GOOD, sequence, 120)
+		self.assertEqual(pieces, 120)
+		lines, played, variance, stopped = capping.playCappedGame(GOOD, sequence, 120, MAXPIECES, 40, tolerance=0)
+		self.assertEqual((lines, played, stopped), (score, pieces, True))
+		self.assertTrue(variance > 0)
+
+	def testConverged(self):
+		# with a loose tolerance the game stops after minBlocks blocks
+		lines, played, variance, stopped = capping.playCappedGame(GOOD, getSequence(0), MAXPIECES, MAXPIECES, 30,
+																  tolerance=10, minBlocks=3)
+		self.assertEqual((lines, played, stopped), engine.playGame(GOOD, getSequence(0), 90) + (True,))
+
+
+class EstimateTest(unittest.TestCase):
+
+	def testFinishedGames(self):
+		games = [(100, 300, 0.0, False), (40, 120, 0.0, False), (130, 300, 0.0, False)]
+		mean, halfWidth = capping.getEstimate(games, 300)
+		self.assertAlmostEqual(mean, 90)
+		spread = (10 ** 2 + 50 ** 2 + 40 ** 2) / 2.0
+		self.assertAlmostEqual(halfWidth, 2 * math.sqrt(spread / 3))
+
+	def testStoppedGames(self):
+		# with no deaths a stopped game's rate carries on to maxPieces, but
+		# the interval still allows for a death
+		games = [(40, 100, 0.001, True), (36, 100, 0.001, True)]
+		mean, halfWidth = capping.getEstimate(games, 1000)
+		self.assertAlmostEqual(mean, 380)
+		self.assertTrue(halfWidth > 2 * math.sqrt(2 * 900 ** 2 * 0.001 / 4))
+
+	def testSurvival(self):
+		self.assertEqual(capping.getSurvival(0, 500), (500.0, 0.0))
+		# E[min(T, r)] and E[min(T, r) ** 2] integrated from the survival
+		# function exp(-hazard * t)
+		hazard = 0.01
+		for remaining in (50, 300, 100000):
+			step = remaining / 10000.0
+			times = [(i + 0.5) * step for i in range(10000)]
+			mean = sum(math.exp(-hazard * t) for t in times) * step
+			square = sum(2 * t * math.exp(-hazard * t) for t in times) * step
+			survival = capping.getSurvival(hazard, remaining)
+			self.assertAlmostEqual(survival[0], mean, delta=1e-3 * mean)
+			self.assertAlmostEqual(survival[1], square - mean ** 2, delta=1e-3 * square)
+
+	def testRateVariance(self):
+		self.assertAlmostEqual(capping.getRateVariance([0.4]), 0.16)
+		self.assertAlmostEqual(capping.getRateVariance([0.3, 0.5]), 0.02 / 2)
+
+
+class CapScheduleTest(unittest.TestCase):
+
+	def testGrowth(self):
+		schedule = capping.CapSchedule(500, 3000, 2, 5)
+		self.assertEqual([schedule.getCap(generation) for generation in (0, 4, 5, 9, 10, 15, 40)],
+						 [500, 500, 1000, 1000, 2000, 3000, 3000])
+
+
+class FakeGames(object):
+
+	# every game finishes with the first weight's lines
+	def __init__(self):
+		self.calls = []
+
+	def __call__(self, gameArgs):
+		self.calls.append(gameArgs)
+		return [(weights[0], cap, 0.0, False) for weights, seed, cap in gameArgs]
+
+
+class CappedEvaluatorTest(unittest.TestCase):
+
+	def testReports(self):
+		games = FakeGames()
+		capper = capping.CappedEvaluator(games, range(3), capping.CapSchedule(100, 400, 2, 1))
+		self.assertEqual(capper.evaluate([[10, 0], [20, 0]]), [(10,), (20,)])
+		self.assertEqual(games.calls, [[([10, 0], 0, 100), ([10, 0], 1, 100), ([10, 0], 2, 100),
+										([20, 0], 0, 100), ([20, 0], 1, 100), ([20, 0], 2, 100)]])
+		self.assertTrue(capper.setGeneration(1))
+		self.assertFalse(capper.setGeneration(1))
+		capper.evaluate([[30, 0]])
+		reports = capper.resetReports()
+		self.assertEqual([(report['weights'], report['cap'], report['fitness'], report['halfWidth']) for report in reports],
+						 [([10, 0], 100, 10, 0.0), ([20, 0], 100, 20, 0.0), ([30, 0], 200, 30, 0.0)])
+		self.assertEqual(capper.reports, [])
+
+	def testCache(self):
+		# a generation of cache hits plays nothing and reports nothing
+		games = FakeGames()
+		capper = capping.CappedEvaluator(games, range(3), capping.CapSchedule(100, 400, 2, 1), fitnesscache.FitnessCache())
+		capper.evaluate([[10, 0], [20, 0]])
+		capper.resetReports()
+		self.assertEqual(capper.evaluate([[20, 0], [10, 0]]), [(20,), (10,)])
+		self.assertEqual((len(games.calls), capper.reports), (1, []))
+		self.assertEqual(capper.getSummary(), 'Capped at 100 pieces: nothing played')
+
+		# fitnesses estimated at another cap don't count
+		capper.setGeneration(1)
+		capper.evaluate([[10, 0]])
+		self.assertEqual(len(games.calls), 2)
+		self.assertTrue(capper.getSummary().startswith('Capped at 200 pieces: best estimate 10.0 +- 0.0 lines'))
+
+
+if __name__ == '__main__':
+	unittest.main()
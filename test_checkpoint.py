@@ -0,0 +1,153 @@
+# A checkpoint must give back the generation, the population, the fitness
+# cache and the generator state it was saved with, refuse to load into a run
+# with other settings, and report a failed write. A run resumed from a
+# checkpoint must end exactly like the uninterrupted run, which is checked
+# with the trainer's GA and a made-up fitness (needs DEAP). Run with
+# python -m unittest test_checkpoint.
+
+import os, pickle, random, shutil, sys, tempfile, unittest, zlib
+import checkpoint, fitnesscache
+
+try:
+	import trainer
+except ImportError:
+	trainer = None
+
+
+class Fitness(object):
+
+	def __init__(self, values):
+		self.values = values
+
+
+class Individual(list):
+
+	def __init__(self, weights, fitness):
+		list.__init__(self, weights)
+		self.fitness = Fitness(fitness)
+
+
+def readFile(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+
+class Discard(object):
+
+	def write(self, text):
+		pass
+
+	def flush(self):
+		pass
+
+
+class TempDirTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'run.ckpt')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+
+class CheckpointerTest(TempDirTest):
+
+	def testRoundTrip(self):
+		rng = random.Random(1)
+		cache = fitnesscache.FitnessCache()
+		cache.put(((0.5, -1.0), (0, 1), 100), (12.5,))
+		population = [Individual([0.5, -1.0], (12.5,)), Individual([0.25, 2.0], (3.0,))]
+		checkpointer = checkpoint.Checkpointer(self.path, ('config', 1), rng=rng, cache=cache)
+		checkpointer.save(3, population)
+		checkpointer.wait()
+		expected = [rng.random() for i in range(5)]
+
+		rng = random.Random(2)
+		cache = fitnesscache.FitnessCache()
+		checkpointer = checkpoint.Checkpointer(self.path, ('config', 1), rng=rng, cache=cache)
+		self.assertTrue(checkpointer.exists())
+		self.assertEqual(checkpointer.load(), (3, [([0.5, -1.0], (12.5,)), ([0.25, 2.0], (3.0,))]))
+		self.assertEqual([rng.random() for i in range(5)], expected)
+		self.assertEqual(cache.get(((0.5, -1.0), (0, 1), 100)), (12.5,))
+
+	def testEvery(self):
+		checkpointer = checkpoint.Checkpointer(self.path, every=2)
+		checkpointer.save(1, [])
+		checkpointer.wait()
+		self.assertFalse(checkpointer.exists())
+		checkpointer.save(1, [], force=True)
+		checkpointer.save(2, [Individual([1.0], (2.0,))])
+		checkpointer.wait()
+		self.assertEqual(checkpointer.load(), (2, [([1.0], (2.0,))]))
+
+	def testOtherSettings(self):
+		checkpointer = checkpoint.Checkpointer(self.path, ('config', 1))
+		checkpointer.save(1, [])
+		checkpointer.wait()
+		self.assertRaises(ValueError, checkpoint.Checkpointer(self.path, ('config', 2)).load)
+
+		state = pickle.loads(zlib.decompress(readFile(self.path)))
+		state['version'] -= 1
+		checkpoint.writeAtomically(self.path, zlib.compress(pickle.dumps(state, 2)))
+		self.assertRaises(ValueError, checkpointer.load)
+
+	def testFailedWrite(self):
+		checkpointer = checkpoint.Checkpointer(os.path.join(self.dir, 'missing', 'run.ckpt'))
+		checkpointer.save(1, [])
+		self.assertRaises(EnvironmentError, checkpointer.wait)
+		checkpointer.wait() # the error is only raised once
+
+	def testWriteAtomically(self):
+		checkpoint.writeAtomically(self.path, b'old')
+		checkpoint.writeAtomically(self.path, b'new')
+		self.assertEqual(readFile(self.path), b'new')
+		self.assertEqual(os.listdir(self.dir), ['run.ckpt'])
+
+
+def getFitnesses(individuals):
+	# made up, but deterministic: closeness to (0.3, 0.3, 0.3, 0.3)
+	return [(-sum((w - 0.3) ** 2 for w in individual),) for individual in individuals]
+
+
+@unittest.skipIf(trainer is None, 'needs DEAP')
+class ResumeTest(TempDirTest):
+
+	def setUp(self):
+		TempDirTest.setUp(self)
+		self.stdout = sys.stdout
+		sys.stdout = Discard()
+
+	def tearDown(self):
+		sys.stdout = self.stdout
+		TempDirTest.tearDown(self)
+
+	def evolve(self, pop, start, generations, checkpointer):
+		cache = checkpointer.cache
+		trainer.toolbox.register("evaluatePopulation", cache.evaluate, evaluatePopulation=getFitnesses, seeds=(0,),
+								 maxPieces=100)
+		return trainer.evolve(pop, 0.5, 0.2, generations, checkpointer=checkpointer, start=start)
+
+	def getCheckpointer(self, path):
+		return checkpoint.Checkpointer(path, ('config',), cache=fitnesscache.FitnessCache())
+
+	def testResume(self):
+		random.seed(0)
+		uninterrupted = self.getCheckpointer(os.path.join(self.dir, 'uninterrupted.ckpt'))
+		expected = self.evolve(trainer.toolbox.population(), 0, 3, uninterrupted)
+
+		random.seed(0)
+		self.evolve(trainer.toolbox.population(), 0, 1, self.getCheckpointer(self.path))
+		random.seed(1)
+		resumed = self.getCheckpointer(self.path)
+		start, saved = resumed.load()
+		self.assertEqual(start, 1)
+		pop = self.evolve(trainer.restorePopulation(saved), start, 3, resumed)
+
+		self.assertEqual([(list(ind), ind.fitness.values) for ind in pop],
+						 [(list(ind), ind.fitness.values) for ind in expected])
+		self.assertEqual(list(resumed.cache.entries.items()), list(uninterrupted.cache.entries.items()))
+
+
+if __name__ == '__main__':
+	unittest.main()
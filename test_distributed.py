@@ -0,0 +1,129 @@
+# A Coordinator must return every game's score in order whatever happens to
+# the workers playing them: games that raise are retried up to maxRetries
+# times, games of a worker that dies are played again by another, a worker
+# that keeps sending heartbeats isn't given up on however long its game
+# takes, and a straggling game is handed out a second time. Workers are
+# local processes on a Unix socket, and the games are functions of this
+# module that misbehave the first time they are called for a marker file.
+# Run with python -m unittest test_distributed.
+
+import os, shutil, sys, tempfile, time, unittest
+import distributed
+
+FACTOR = 1 # set by the workers' initializer
+
+
+def isFirstTime(marker):
+	# whether this is the first call for marker, in any process
+	try:
+		os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+		return True
+	except OSError:
+		return False
+
+
+def setFactor(factor):
+	global FACTOR
+	FACTOR = factor
+
+
+def playScaled(weights, seed):
+	return weights[0] * FACTOR + seed, {'pieces': 10}
+
+
+def playFailingOnce(n, marker):
+	if isFirstTime(marker):
+		raise ValueError('first try of %d' % n)
+	return n, {}
+
+
+def playExitingOnce(n, marker):
+	if isFirstTime(marker):
+		os._exit(1)
+	return n, {}
+
+
+def playFailing(n):
+	raise ValueError('always fails')
+
+
+def playSlowOnce(n, marker, seconds):
+	if isFirstTime(marker):
+		time.sleep(seconds)
+	return n, {}
+
+
+class Discard(object):
+
+	def write(self, text):
+		pass
+
+	def flush(self):
+		pass
+
+
+class CoordinatorTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.stderr = sys.stderr
+		sys.stderr = Discard() # lost workers are reported there
+
+	def tearDown(self):
+		sys.stderr = self.stderr
+		shutil.rmtree(self.dir)
+
+	def getCoordinator(self, playGame, localWorkers=2, **options):
+		return distributed.Coordinator(playGame, os.path.join(self.dir, 'socket'), localWorkers=localWorkers,
+									   authkey='test', **options)
+
+	def getMarker(self, n):
+		return os.path.join(self.dir, 'marker%d' % n)
+
+	def testGames(self):
+		with self.getCoordinator(playScaled, initializer=setFactor, initargs=(3,)) as coordinator:
+			self.assertEqual(coordinator.playGames([([n], 0) for n in range(20)]), [n * 3 for n in range(20)])
+			self.assertEqual(coordinator.evaluate([[1], [2]], (0, 1)), [(3.5,), (6.5,)])
+			counters, busy = coordinator.resetStats()
+			self.assertEqual(counters, {'games': 24, 'pieces': 240})
+			self.assertTrue(1 <= len(busy) <= 2)
+
+	def testRetries(self):
+		with self.getCoordinator(playFailingOnce) as coordinator:
+			gameArgs = [(n, self.getMarker(n)) for n in range(6)]
+			self.assertEqual(coordinator.playGames(gameArgs), list(range(6)))
+			self.assertEqual(coordinator.resetStats()[0], {'games': 6, 'retries': 6})
+
+	def testKeepsFailing(self):
+		with self.getCoordinator(playFailing, maxRetries=2) as coordinator:
+			self.assertRaises(RuntimeError, coordinator.playGames, [(0,)])
+			self.assertEqual(coordinator.counters['retries'], 2)
+
+	def testLostWorker(self):
+		with self.getCoordinator(playExitingOnce) as coordinator:
+			self.assertEqual(coordinator.playGames([(n, self.getMarker(0)) for n in range(5)]), list(range(5)))
+			self.assertEqual(coordinator.resetStats()[0], {'games': 5, 'retries': 1})
+
+	def testHeartbeats(self):
+		with self.getCoordinator(playSlowOnce, 1, timeout=0.5, heartbeat=0.1) as coordinator:
+			self.assertEqual(coordinator.playGames([(7, self.getMarker(0), 1.5)]), [7])
+			self.assertEqual(coordinator.resetStats()[0], {'games': 1})
+
+	def testStraggler(self):
+		# the slow copy of game 0 loses to the one handed out again
+		isFirstTime(self.getMarker(1))
+		with self.getCoordinator(playSlowOnce) as coordinator:
+			start = time.time()
+			gameArgs = [(n, self.getMarker(min(n, 1)), 10) for n in range(4)]
+			self.assertEqual(coordinator.playGames(gameArgs), list(range(4)))
+			self.assertTrue(time.time() - start < 8)
+			self.assertEqual(coordinator.resetStats()[0], {'games': 4, 'redispatched': 1})
+			coordinator.terminate() # rather than wait for the slow copy
+
+	def testNoWorkers(self):
+		with self.getCoordinator(playScaled, 0, workerWait=0.5) as coordinator:
+			self.assertRaises(RuntimeError, coordinator.playGames, [([1], 0)])
+
+
+if __name__ == '__main__':
+	unittest.main()
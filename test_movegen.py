@@ -0,0 +1,177 @@
+# movegen.findReachablePlacements must find every resting position a piece
+# can get to from its spawn position, on the board itself and not only on its
+# surface profile, so it is compared with a plain breadth first search over
+# the cells of the real board. Without overhangs the placements are exactly
+# the column drops, under an overhang they include tucks no drop reaches, and
+# ReachabilityCache must share its entries between boards with one profile.
+# Run with python -m unittest test_movegen.
+
+import random, unittest
+import bitboard, engine, movegen
+from bitboard import BOARDWIDTH, BOARDHEIGHT
+
+SEEDS = range(20)
+
+
+def fits(rows, cells, x, y):
+	for tx, ty in cells:
+		cellX, cellY = x + tx, y + ty
+		if cellX < 0 or cellX >= BOARDWIDTH or cellY >= BOARDHEIGHT:
+			return False
+		if cellY >= 0 and rows[cellY] >> cellX & 1:
+			return False
+	return True
+
+
+def getReferencePlacements(rows, shape, rotation):
+	# the resting (rotation, x, y) positions reachable from the spawn
+	# position, searched cell by cell on the board's own rows
+	placements = engine.PLACEMENTS[shape]
+	start = (rotation, engine.SPAWNX, engine.SPAWNY)
+	if not fits(rows, placements[rotation][1], engine.SPAWNX, engine.SPAWNY):
+		return set()
+	seen = set([start])
+	queue = [start]
+	resting = set()
+	for rotation, x, y in queue:
+		if not fits(rows, placements[rotation][1], x, y + 1):
+			resting.add((rotation, x, y))
+		for nextState in ((rotation, x - 1, y), (rotation, x + 1, y), (rotation, x, y + 1),
+						  ((rotation + 1) % len(placements), x, y), ((rotation - 1) % len(placements), x, y)):
+			if nextState not in seen:
+				seen.add(nextState)
+				if fits(rows, placements[nextState[0]][1], nextState[1], nextState[2]):
+					queue.append(nextState)
+	return set((rotation, x, y) for rotation, x, y in resting
+			   if rotation in engine.ORIENTATIONS[shape] and y + placements[rotation][4] >= 0)
+
+
+def getDrops(board, shape):
+	drops = set()
+	for rotation in engine.ORIENTATIONS[shape]:
+		placement = engine.PLACEMENTS[shape][rotation]
+		for x in placement[2]:
+			y = bitboard.getLandingRow(board.heights, placement, x)
+			if y + placement[4] >= 0:
+				drops.add((rotation, x, y))
+	return drops
+
+
+def findPlacements(board, shape, rotation=0):
+	return movegen.findReachablePlacements(movegen.getSurfaceProfile(board.rows), engine.PIECEMASKS[shape],
+										   engine.ORIENTATIONS[shape], rotation, engine.SPAWNX, engine.SPAWNY)
+
+
+def getRandomBoard(rng):
+	# pieces resting anywhere in the bottom half, leaving overhangs, tucked
+	# spaces and sealed holes
+	board = bitboard.Board()
+	for i in range(rng.randrange(5, 25)):
+		shape = rng.choice(sorted(engine.PIECES))
+		mask = engine.PIECEMASKS[shape][rng.randrange(len(engine.PIECEMASKS[shape]))]
+		x = rng.randrange(-mask[1], BOARDWIDTH - mask[2])
+		y = rng.randrange(BOARDHEIGHT // 2 - mask[0][0][0], BOARDHEIGHT - mask[0][-1][0])
+		if board.isValidPosition(mask, x, y):
+			board.place(mask, x, y)
+	return board
+
+
+class ReachablePlacementTest(unittest.TestCase):
+
+	def testRandomBoards(self):
+		for seed in SEEDS:
+			board = getRandomBoard(random.Random(seed))
+			for shape in sorted(engine.PIECES):
+				for rotation in range(len(engine.PIECEMASKS[shape])):
+					placements = findPlacements(board, shape, rotation)
+					self.assertEqual(set(placements), getReferencePlacements(board.rows, shape, rotation),
+									 (seed, shape, rotation))
+					self.assertEqual(len(set(placements)), len(placements))
+					self.assertTrue(getDrops(board, shape) <= set(placements), (seed, shape, rotation))
+
+	def testSearchOrder(self):
+		board = getRandomBoard(random.Random(0))
+		for shape in sorted(engine.PIECES):
+			order = engine.ORIENTATIONS[shape]
+			placements = findPlacements(board, shape)
+			keys = [(order.index(rotation), x, y) for rotation, x, y in placements]
+			self.assertEqual(keys, sorted(keys), shape)
+
+	def testNoOverhangs(self):
+		# on columns without overhangs a piece can only come to rest where it
+		# lands when dropped
+		for seed in SEEDS:
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for x in range(BOARDWIDTH):
+				for y in range(BOARDHEIGHT - rng.randrange(BOARDHEIGHT // 2), BOARDHEIGHT):
+					board.setCell(x, y, bitboard.FILLED)
+			for shape in sorted(engine.PIECES):
+				self.assertEqual(set(findPlacements(board, shape)), getDrops(board, shape), (seed, shape))
+
+	def testTuck(self):
+		# a roof over the bottom left corner, which only a piece slid in under
+		# the roof can fill
+		board = bitboard.Board()
+		for x in range(2):
+			board.setCell(x, BOARDHEIGHT - 3, bitboard.FILLED)
+		for x in range(4, BOARDWIDTH):
+			board.setCell(x, BOARDHEIGHT - 2, bitboard.FILLED)
+			board.setCell(x, BOARDHEIGHT - 1, bitboard.FILLED)
+
+		def coversCorner(shape, rotation, x, y):
+			return (-x, BOARDHEIGHT - 1 - y) in engine.PLACEMENTS[shape][rotation][1]
+		for shape in sorted(engine.PIECES):
+			self.assertFalse([drop for drop in getDrops(board, shape) if coversCorner(shape, *drop)], shape)
+		self.assertTrue([placement for placement in findPlacements(board, 'O') if coversCorner('O', *placement)])
+
+	def testBlockedSpawn(self):
+		board = bitboard.Board([bitboard.FULLROW] * BOARDHEIGHT)
+		for shape in sorted(engine.PIECES):
+			self.assertEqual(findPlacements(board, shape), ())
+
+
+class ReachabilityCacheTest(unittest.TestCase):
+
+	def getCache(self, maxSize=10000):
+		return movegen.ReachabilityCache(engine.PIECEMASKS, engine.ORIENTATIONS, engine.SPAWNX, engine.SPAWNY, maxSize)
+
+	def testSharedProfile(self):
+		# sealed holes don't change the profile, so the second board is a hit
+		board = bitboard.Board()
+		for x in range(BOARDWIDTH - 1):
+			board.setCell(x, BOARDHEIGHT - 2, bitboard.FILLED)
+		board.setCell(BOARDWIDTH - 1, BOARDHEIGHT - 1, bitboard.FILLED)
+		sealed = board.copy()
+		sealed.setCell(3, BOARDHEIGHT - 1, bitboard.FILLED)
+		self.assertEqual(movegen.getSurfaceProfile(board.rows), movegen.getSurfaceProfile(sealed.rows))
+
+		cache = self.getCache()
+		placements = cache.getPlacements(board, 'T', 0)
+		self.assertEqual(placements, findPlacements(board, 'T'))
+		self.assertTrue(cache.getPlacements(sealed, 'T', 0) is placements)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		cache.getPlacements(board, 'T', 1)
+		cache.getPlacements(board, 'S', 0)
+		sealed.setCell(BOARDWIDTH - 1, BOARDHEIGHT - 2, bitboard.FILLED)
+		cache.getPlacements(sealed, 'T', 0)
+		self.assertEqual((cache.hits, cache.misses), (1, 4))
+		self.assertEqual(len(cache), 4)
+
+	def testEviction(self):
+		board = bitboard.Board()
+		cache = self.getCache(2)
+		cache.getPlacements(board, 'T', 0)
+		cache.getPlacements(board, 'S', 0)
+		cache.getPlacements(board, 'T', 0)
+		cache.getPlacements(board, 'Z', 0)
+		self.assertEqual(len(cache), 2)
+		cache.getPlacements(board, 'T', 0)
+		self.assertEqual((cache.hits, cache.misses), (2, 3))
+		cache.getPlacements(board, 'S', 0)
+		self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+
+if __name__ == '__main__':
+	unittest.main()
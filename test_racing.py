@@ -0,0 +1,101 @@
+# RacingEvaluator must only drop individuals whose upper confidence bound is
+# under the cutoff, give them the mean of the games they played, and play
+# every game of the rest, in stages, as ParallelEvaluator would. Games are
+# played by a fake playGames whose scores follow from the weights, so the
+# tests know which individuals have to be cut. Run with
+# python -m unittest test_racing.
+
+import math, unittest
+import fitnesscache, racing
+
+SEEDS = range(10)
+
+
+class Fitness(object):
+
+	def __init__(self, values=()):
+		self.values = values
+
+
+class Individual(list):
+
+	def __init__(self, weights, fitness=None):
+		list.__init__(self, weights)
+		self.fitness = Fitness(() if fitness is None else (fitness,))
+
+
+class FakeGames(object):
+
+	# scores the individual's first weight, plus its second weight times
+	# +1 or -1 by seed, so the second weight sets the spread
+	def __init__(self):
+		self.calls = []
+
+	def __call__(self, gameArgs):
+		self.calls.append(gameArgs)
+		return [weights[0] + weights[1] * (1 if seed % 2 else -1) for weights, seed in gameArgs]
+
+
+class QuantileTest(unittest.TestCase):
+
+	def testTable(self):
+		self.assertEqual(racing.getTQuantile(1), 12.706)
+		self.assertEqual(racing.getTQuantile(9), 2.262)
+		self.assertEqual(racing.getTQuantile(12), racing.getTQuantile(10))
+		self.assertEqual(racing.getTQuantile(1000), 1.980)
+		quantiles = [racing.getTQuantile(n) for n in range(1, 200)]
+		self.assertEqual(quantiles, sorted(quantiles, reverse=True))
+		self.assertTrue(quantiles[-1] > 1.96)
+
+	def testUpperBound(self):
+		racer = racing.RacingEvaluator(FakeGames(), SEEDS)
+		self.assertEqual(racer.getUpperBound([5]), float('inf'))
+		self.assertEqual(racer.getUpperBound([4, 4, 4]), 4)
+		self.assertAlmostEqual(racer.getUpperBound([1, 2, 3]), 2 + 4.303 / math.sqrt(3))
+
+
+class RacingTest(unittest.TestCase):
+
+	def testStages(self):
+		# without a cutoff nobody is cut, and the games are played in stages
+		games = FakeGames()
+		racer = racing.RacingEvaluator(games, SEEDS, stages=(2, 5, 20))
+		individuals = [Individual([10, 1]), Individual([20, 2])]
+		self.assertEqual(racer.evaluate(individuals), [(10,), (20,)])
+		self.assertEqual([len(call) for call in games.calls], [4, 6, 10])
+		self.assertEqual(sorted(call[0][1] for call in games.calls), [0, 2, 5])
+		self.assertEqual([(report['games'], report['reason']) for report in racer.reports], [(10, 'complete')] * 2)
+
+	def testCutoff(self):
+		games = FakeGames()
+		racer = racing.RacingEvaluator(games, SEEDS)
+		racer.updateCutoff([Individual([], fitness) for fitness in (5, 15, 25, 35)])
+		self.assertEqual(racer.cutoff, 25)
+		# sure to lose, a long shot with a wide spread, and a winner
+		individuals = [Individual([10, 0]), Individual([14, 10]), Individual([30, 1])]
+		self.assertEqual(racer.evaluate(individuals), [(10,), (14,), (30,)])
+		self.assertEqual([report['games'] for report in racer.reports], [2, 10, 10])
+		self.assertTrue(racer.reports[0]['reason'].startswith('cut'))
+		self.assertEqual([len(call) for call in games.calls], [6, 6, 10])
+		self.assertEqual(racer.getSummary(),
+						 'Racing: 1 of 3 individuals cut, 22 of 30 games played (games: individuals 2: 1, 10: 2)')
+
+	def testCache(self):
+		# only individuals that played every game are cached
+		cache = fitnesscache.FitnessCache()
+		games = FakeGames()
+		racer = racing.RacingEvaluator(games, SEEDS, cache=cache, maxPieces=100)
+		racer.updateCutoff([Individual([], fitness) for fitness in (5, 15, 25, 35)])
+		individuals = [Individual([10, 0]), Individual([30, 1])]
+		racer.evaluate(individuals)
+		del games.calls[:]
+
+		self.assertEqual(racer.evaluate(individuals), [(10,), (30,)])
+		self.assertTrue(racer.reports[0]['reason'].startswith('cut'))
+		self.assertEqual(racer.reports[1]['reason'], 'cached')
+		self.assertEqual(racer.reports[1]['games'], 0)
+		self.assertEqual([[weights for weights, seed in call] for call in games.calls], [[[10, 0]] * 2])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,109 @@
+# The hash getPlacementHash works out for a piece placed on a board must be
+# the hash of the board it leaves, and a TranspositionTable must only return
+# what was stored under the same key for the same weights. Games played with
+# a table, large or so small that slots are replaced all the time, must make
+# exactly the moves games without one make. Run with
+# python -m unittest test_transposition.
+
+import random, unittest
+import bitboard, engine, features, sequences, transposition
+from test_bitboard import getRandomDrop
+
+WEIGHTS = [
+	(-.516, .76, -.356, -.1844),
+	(-.6, .5, -.8, -.2),
+]
+SEEDS = (0, 1, 2)
+MAXPIECES = 100
+
+
+def getSequence(seed):
+	return sequences.generateSequence(random.Random(seed), engine.PIECES, MAXPIECES + 1)
+
+
+class PlacementHashTest(unittest.TestCase):
+
+	def testDrops(self):
+		for seed in range(10):
+			rng = random.Random(seed)
+			board = bitboard.Board()
+			for i in range(40):
+				boardHash = transposition.hashRows(board.rows)
+				for shape in sorted(engine.PIECES):
+					for rotation in engine.ORIENTATIONS[shape]:
+						placement = engine.PLACEMENTS[shape][rotation]
+						for x in placement[2]:
+							y = bitboard.getLandingRow(board.heights, placement, x)
+							if y + placement[4] < 0:
+								continue
+							placed = board.copy()
+							placed.place(placement[0], x, y)
+							self.assertEqual(transposition.getPlacementHash(boardHash, board.rows, placement[0], x, y),
+											 transposition.hashRows(placed.rows), (seed, i, shape, rotation, x))
+				drop = getRandomDrop(board, rng)
+				if drop is None:
+					break
+				shape, rotation, x, y = drop
+				board.place(engine.PIECEMASKS[shape][rotation], x, y)
+				board.removeCompleteLines()
+
+
+class TableTest(unittest.TestCase):
+
+	def testSlots(self):
+		table = transposition.TranspositionTable(4)
+		self.assertEqual(table.get(3), None)
+		table.put(3, 'a')
+		table.put(5, 'b')
+		self.assertEqual((table.get(3), table.get(5), len(table)), ('a', 'b', 2))
+		# 19 shares 3's slot and replaces it
+		table.put(19, 'c')
+		self.assertEqual((table.get(3), table.get(19), len(table)), (None, 'c', 2))
+		self.assertEqual((table.hits, table.misses), (3, 2))
+
+	def testSetWeights(self):
+		table = transposition.TranspositionTable(4)
+		table.setWeights(WEIGHTS[0])
+		table.put(1, 'a')
+		table.setWeights(list(WEIGHTS[0]))
+		self.assertEqual(table.get(1), 'a')
+		for weights, featureSet, tucks in ((WEIGHTS[1], None, False), (WEIGHTS[1], None, True),
+										   (WEIGHTS[1], features.FeatureSet(), True)):
+			table.put(1, 'a')
+			table.setWeights(weights, featureSet, tucks)
+			self.assertEqual((table.get(1), len(table)), (None, 0))
+
+
+class GameTest(unittest.TestCase):
+
+	def assertSameGames(self, depth, featureSet=None, weights=WEIGHTS, tucks=False):
+		for bits in (16, 4):
+			table = transposition.TranspositionTable(bits)
+			for vector in weights:
+				for seed in SEEDS:
+					sequence = getSequence(seed)
+					expected = engine.playGame(vector, sequence, MAXPIECES, featureSet=featureSet, depth=depth,
+											   tucks=tucks)
+					self.assertEqual(engine.playGame(vector, sequence, MAXPIECES, featureSet=featureSet, depth=depth,
+													 table=table, tucks=tucks), expected, (bits, seed, vector))
+			if depth == 2:
+				self.assertTrue(table.hits, bits) # the lookahead's boards come round again
+
+	def testDepth1(self):
+		self.assertSameGames(1)
+
+	def testDepth2(self):
+		self.assertSameGames(2)
+
+	def testTucks(self):
+		self.assertSameGames(2, tucks=True)
+
+	def testFeatureSet(self):
+		# landingHeight depends on where the last piece landed, not only on
+		# the board
+		featureSet = features.FeatureSet(('aggHeight', 'completeLines', 'holes', 'bumpiness', 'landingHeight'))
+		self.assertSameGames(2, featureSet, [vector + (-.3,) for vector in WEIGHTS])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -3,7 +3,10 @@
 # http://inventwithpython.com/pygame
 # Released under a "Simplified BSD" license
 
-import random, time, pygame, sys, copy
+import random, time, pygame, sys, argparse
+import engine, features, sequences, transposition, phases
+from engine import BOARDWIDTH, BOARDHEIGHT, BLANK, MAXPIECES, TEMPLATEWIDTH, TEMPLATEHEIGHT, PIECES
+from engine import getNewPiece, getBlankBoard, isValidPosition, addToBoard, getBestMove, removeCompleteLines, calculateLevelAndFallFreq
 from pygame.locals import *
 
 # WEIGHT VECTOR (only parameters that should change)
@@ -13,12 +16,13 @@ GAMMA = -.356
 DELTA = -.1844
 
 FPS = 1000
+DEPTH = 1 # search depth, 2 also looks at the next piece
+TUCKS = False # also search tucks and slides under overhangs (see movegen.py)
+TABLE = None # a transposition.TranspositionTable to keep board scores in, None to not keep them
+PHASESTATS = None # a phases.PhaseStats to time the game loop's phases in, None to not time them
 WINDOWWIDTH = 640
 WINDOWHEIGHT = 480
 BOXSIZE = 20
-BOARDWIDTH = 10
-BOARDHEIGHT = 20
-BLANK = '.'
 
 MOVESIDEWAYSFREQ = 0.15
 MOVEDOWNFREQ = 0.1
@@ -46,119 +50,7 @@ TEXTSHADOWCOLOR = GRAY
 COLORS = (BLUE, GREEN, RED, YELLOW)
 LIGHTCOLORS = (LIGHTBLUE, LIGHTGREEN, LIGHTRED, LIGHTYELLOW)
 assert len(COLORS) == len(LIGHTCOLORS) # each color must have light color
-
-TEMPLATEWIDTH = 5
-TEMPLATEHEIGHT = 5
-
-S_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', '.', '.', 'O', '.'],
-					['.', '.', '.', '.', '.']]]
-
-Z_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', 'O', '.', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-I_SHAPE_TEMPLATE = [[['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['O', 'O', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-O_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-J_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', 'O', '.', '.', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', '.', '.', 'O', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-L_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', '.', '.', 'O', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', 'O', '.', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-T_SHAPE_TEMPLATE = [[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', 'O', 'O', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', '.', '.', '.'],
-					['.', 'O', 'O', 'O', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']],
-					[['.', '.', '.', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', 'O', 'O', '.', '.'],
-					['.', '.', 'O', '.', '.'],
-					['.', '.', '.', '.', '.']]]
-
-PIECES = {'S': S_SHAPE_TEMPLATE,
-		  'Z': Z_SHAPE_TEMPLATE,
-		  'J': J_SHAPE_TEMPLATE,
-		  'L': L_SHAPE_TEMPLATE,
-		  'I': I_SHAPE_TEMPLATE,
-		  'O': O_SHAPE_TEMPLATE,
-		  'T': T_SHAPE_TEMPLATE}
+assert len(COLORS) == engine.NUMCOLORS # every piece color must be drawable
 
 
 def main():
@@ -173,9 +65,59 @@ def main():
 	showTextScreen('Tetromino')
 	while True: # game loop
 		runGame()
+		if PHASESTATS is not None:
+			print(PHASESTATS.format())
+		if TABLE is not None:
+			print('Transposition table: %d hits  %d misses  hit rate %.1f%%' % (TABLE.hits, TABLE.misses,
+																			   TABLE.getHitRate() * 100))
 		showTextScreen('Game Over')
 
 
+# Play numGames games with the weight vector at full speed, without opening a
+# window, and print lines cleared, pieces per second and per-piece timing
+# percentiles. Game i replays the piece sequence of seed firstSeed + i, the
+# same games the trainer evaluates individuals on. featureNames are the
+# features the weights are for and depth the search depth. With tableBits
+# board scores are kept in a transposition table of 2 ** tableBits entries.
+# tucks also searches the placements reached by tucks and slides. With
+# timePhases the time spent in every phase of the game loop is reported too.
+# Raises ValueError if numGames is less than 1.
+def runHeadless(weights, numGames=10, firstSeed=0, maxPieces=MAXPIECES, featureNames=features.DEFAULTFEATURES, depth=1,
+				tableBits=0, tucks=False, timePhases=False):
+	if numGames < 1:
+		raise ValueError('at least 1 game has to be played, not %d' % numGames)
+	featureSet = features.FeatureSet(featureNames)
+	table = transposition.TranspositionTable(tableBits) if tableBits else None
+	phaseStats = phases.PhaseStats() if timePhases else None
+	lines = []
+	pieces = 0
+	timings = []
+
+	start = time.time()
+	for seed in range(firstSeed, firstSeed + numGames):
+		sequence = sequences.generateSequence(random.Random(seed), PIECES, maxPieces + 1)
+		score, gamePieces = engine.playGame(weights, sequence, maxPieces, timings, featureSet=featureSet, depth=depth,
+											table=table, tucks=tucks, phaseStats=phaseStats)
+		lines.append(score)
+		pieces += gamePieces
+	elapsed = time.time() - start
+
+	timings.sort()
+	print('Games: %d  Pieces: %d  Time: %.2fs' % (numGames, pieces, elapsed))
+	print('Lines: avg %.1f  min %d  max %d' % (float(sum(lines)) / numGames, min(lines), max(lines)))
+	print('Pieces per second: %.0f' % (pieces / elapsed if elapsed else 0.0))
+	print('Time per piece (us): p50 %.1f  p90 %.1f  p99 %.1f  max %.1f' % tuple(
+		engine.getPercentile(timings, p) * 1e6 for p in (50, 90, 99, 100)))
+	if table is not None:
+		print('Transposition table: %d hits  %d misses  hit rate %.1f%%' % (table.hits, table.misses, table.getHitRate() * 100))
+	if tucks:
+		reachable = engine.REACHABLE
+		print('Reachability cache: %d hits  %d misses  hit rate %.1f%%' % (
+			reachable.hits, reachable.misses, reachable.getHitRate() * 100))
+	if phaseStats is not None:
+		print(phaseStats.format())
+
+
 # Helper method for debugging
 def printBoard(board):
 	for i in range(BOARDHEIGHT):
@@ -187,7 +129,7 @@ def printBoard(board):
 # Main game loop function
 def runGame():
     # setup variables for the start of the game
-    board = getBlankBoard()
+    board = getBlankBoard(colored=True)
 
     score = 0
     level, fallFreq = calculateLevelAndFallFreq(score)
@@ -195,7 +137,11 @@ def runGame():
     fallingPiece = getNewPiece()
     nextPiece = getNewPiece()
 
+    stats = PHASESTATS
+
     while True: # game loop
+        if stats is not None:
+            stats.start()
         if fallingPiece == None:
             # No falling piece in play, so start a new piece at the top
             fallingPiece = nextPiece
@@ -203,22 +149,25 @@ def runGame():
 
             if not isValidPosition(board, fallingPiece):
                 return # can't fit a new piece on the board, so game over
-
-        # Get all the moves available
-        possibleBoards = getAllMoves(board, fallingPiece)
+        if stats is not None:
+            stats.lap('spawn')
 
         # Find the best move by using evaluateBoard
-        bestBoard = None
-        maxVal = -float("inf")
-        for newBoard in possibleBoards:
-            val = evaluateBoard(newBoard, ALPHA, BETA, GAMMA, DELTA)
-            if val > maxVal:
-                maxVal =  val
-                bestBoard = newBoard
-
-        board = bestBoard
+        bestMove = getBestMove(board, fallingPiece, ALPHA, BETA, GAMMA, DELTA, nextPiece if DEPTH == 2 else None, TUCKS,
+                               stats, TABLE)
+        if stats is not None:
+            stats.lap('search')
+
+        if bestMove != None:
+            fallingPiece['rotation'], fallingPiece['x'], fallingPiece['y'] = bestMove
+            addToBoard(board, fallingPiece)
+        if stats is not None:
+            stats.lap('place')
         score += removeCompleteLines(board)
         level, fallFreq = calculateLevelAndFallFreq(score)
+        if stats is not None:
+            stats.lap('lineClear')
+            stats.addPiece()
         fallingPiece = None
 
         # drawing everything on the screen
@@ -230,74 +179,11 @@ def runGame():
             drawPiece(fallingPiece)
 
         pygame.display.update()
+        if stats is not None:
+            stats.lap('draw')
         time.sleep(1/FPS)
 
 
-# Returns a score for the board based on the 4 heuristics
-def evaluateBoard(board, a, b, c, d):
-    totHeight, heights = getTotalHeight(board)
-    completeLines = getCompleteLines(board)
-    holes = getNumHoles(board)
-    heightVar = getHeightVar(heights)
-
-    return a * totHeight + b * completeLines + c * holes + d * heightVar
-
-
-# Calculates the total height heuristic
-def getTotalHeight(board):
-    totalHeight = 0
-    heights = []
-
-    for i in range(BOARDWIDTH):
-        colHeight = 0
-
-        for j in range(BOARDHEIGHT):
-            if board[i][j] != BLANK:
-                colHeight = BOARDHEIGHT - j
-                break
-
-        heights.append(colHeight)
-        totalHeight += colHeight
-
-    return totalHeight, heights
-
-
-# Calculates the total number of holes heuristic
-def getNumHoles(board):
-    holes = 0
-
-    for i in range(BOARDWIDTH):
-        foundBlock = False
-        for j in range(BOARDHEIGHT):
-            if board[i][j] != BLANK:
-                foundBlock = True
-            elif foundBlock == True:
-                holes += 1
-
-    return holes
-
-
-# Calculates the height variance heuristic
-def getHeightVar(heights):
-    heightVar = 0
-
-    for i in range(1, BOARDWIDTH):
-        heightVar += abs(heights[i] - heights[i-1])
-
-    return heightVar
-
-
-#Calculates the number of complete lines heuristic
-def getCompleteLines(board):
-    numCompleteLines = 0
-
-    for y in range(BOARDHEIGHT):
-        if isCompleteLine(board, y):
-            numCompleteLines += 1
-
-    return numCompleteLines
-
-
 def makeTextObjs(text, font, color):
 	surf = font.render(text, True, color)
 	return surf, surf.get_rect()
@@ -350,151 +236,6 @@ def checkForQuit():
 		pygame.event.post(event) # put the other KEYUP event objects back
 
 
-def calculateLevelAndFallFreq(score):
-	# Based on the score, return the level the player is on and
-	# how many seconds pass until a falling piece falls one space.
-	level = int(score / 10) + 1
-	fallFreq = 0.27 - (level * 0.02)
-	return level, fallFreq
-
-
-def getNewPiece():
-	# return a random new piece in a random rotation and color
-	shape = random.choice(list(PIECES.keys()))
-	newPiece = {'shape': shape,
-				'rotation': random.randint(0, len(PIECES[shape]) - 1),
-				'x': int(BOARDWIDTH / 2) - int(TEMPLATEWIDTH / 2),
-				'y': -2, # start it above the board (i.e. less than 0)
-				'color': random.randint(0, len(COLORS)-1)}
-	return newPiece
-
-
-def addToBoard(board, piece):
-	# fill in the board based on piece's location, shape, and rotation
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			if PIECES[piece['shape']][piece['rotation']][y][x] != BLANK:
-				board[x + piece['x']][y + piece['y']] = piece['color']
-				if x + piece['x'] < 0 or y + piece['y'] < 0:
-					return False
-	return True
-
-
-def getBlankBoard():
-	# create and return a new blank board data structure
-	board = []
-	for i in range(BOARDWIDTH):
-		board.append([BLANK] * BOARDHEIGHT)
-	return board
-
-
-def isOnBoard(x, y):
-	return x >= 0 and x < BOARDWIDTH and y < BOARDHEIGHT
-
-
-def isValidPosition(board, piece, adjX=0, adjY=0):
-	# Return True if the piece is within the board and not colliding
-	t = time.time()
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			isAboveBoard = y + piece['y'] + adjY < 0
-			if isAboveBoard or PIECES[piece['shape']][piece['rotation']][y][x] == BLANK:
-				continue
-			if not isOnBoard(x + piece['x'] + adjX, y + piece['y'] + adjY):
-				print 'a: ' + str(t-time.time())
-				return False
-			if board[x + piece['x'] + adjX][y + piece['y'] + adjY] != BLANK:
-				print 'b: ' + str(t-time.time())
-				return False
-	print 'c: ' + str(t-time.time())
-	return True
-
-def isInRange(piece, adjX=0, adjY=0):
-	# Return True if the piece is within the board, disregards collisions
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			isAboveBoard = y + piece['y'] + adjY < 0
-			if isAboveBoard or PIECES[piece['shape']][piece['rotation']][y][x] == BLANK:
-				continue
-			if not isOnBoard(x + piece['x'] + adjX, y + piece['y'] + adjY):
-				return False
-	return True
-
-# this method isn't perfect, as it fails with overhangs. The learners should not create these situations though
-def getAllMoves(board, piece):
-	def dropPiece(board, piece):
-		i = 1
-		while isValidPosition(board, piece, adjY=i):
-			i+=1
-		piece['y'] += i-1
-
-	boardList = []
-
-	numRotations = len(PIECES[piece['shape']])
-	for rot in range(numRotations):
-		piece['rotation'] = (piece['rotation'] + 1) % len(PIECES[piece['shape']])
-
-		xshift = 0
-		while True:
-			if not isInRange(piece, adjX = xshift) and xshift > 0:
-				break
-			currXShiftPiece = copy.deepcopy(piece)
-			currXShiftPiece['x'] += xshift
-			# t = time.time()
-			# print 'Rot#' + str(rot) + ': ' + str(time.time()-t)
-			if isValidPosition(board, currXShiftPiece):
-				# print 'xshift#' + str(xshift) + ': ' + str(time.time()-t)
-				dropPiece(board, currXShiftPiece)
-				# print 'xshift#' + str(xshift) + ': ' + str(time.time()-t)
-				currBoard = copy.deepcopy(board)
-				# print 'xshift#' + str(xshift) + ': ' + str(time.time()-t)
-				if addToBoard(currBoard, currXShiftPiece):
-					# print 'xshift#' + str(xshift) + ': ' + str(time.time()-t)
-					boardList.append(currBoard)
-					# print 'xshift#' + str(xshift) + ': ' + str(time.time()-t)
-			# left first
-			# print 'Rot#' + str(rot) + ': ' + str(time.time()-t)
-			if xshift <= 0:
-				xshift -= 1
-			else:
-				xshift += 1
-
-			if not isInRange(piece, adjX = xshift) and xshift <= 0:
-				xshift = 1
-
-	return boardList
-
-
-def isCompleteLine(board, y):
-	# Return True if the line filled with boxes with no gaps.
-	for x in range(BOARDWIDTH):
-		if board[x][y] == BLANK:
-			return False
-	return True
-
-
-def removeCompleteLines(board):
-	# Remove any completed lines on the board, move everything above them down, and return the number of complete lines.
-	numLinesRemoved = 0
-	y = BOARDHEIGHT - 1 # start y at the bottom of the board
-	while y >= 0:
-		if isCompleteLine(board, y):
-			# Remove the line and pull boxes down by one line.
-			for pullDownY in range(y, 0, -1):
-				for x in range(BOARDWIDTH):
-					board[x][pullDownY] = board[x][pullDownY-1]
-			# Set very top line to blank.
-			for x in range(BOARDWIDTH):
-				board[x][0] = BLANK
-			numLinesRemoved += 1
-			# Note on the next iteration of the loop, y is the same.
-			# This is so that if the line that was pulled down is also
-			# complete, it will be removed.
-		else:
-			y -= 1 # move on to check next row up
-	return numLinesRemoved
-
-
 def convertToPixelCoords(boxx, boxy):
 	# Convert the given xy coordinates of the board to xy
 	# coordinates of the location on the screen.
@@ -564,4 +305,36 @@ def drawNextPiece(piece):
 
 
 if __name__ == '__main__':
-	main()
+	parser = argparse.ArgumentParser(description='Tetromino played by a weight vector')
+	parser.add_argument('--headless', action='store_true', help='play games at full speed without a window and report statistics')
+	parser.add_argument('--games', type=int, default=10, help='games to play in headless mode')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the first headless game')
+	parser.add_argument('--max-pieces', type=int, default=MAXPIECES, help='piece cap for headless games')
+	parser.add_argument('--weights', type=float, nargs='+', default=[ALPHA, BETA, GAMMA, DELTA],
+						metavar='WEIGHT', help='weight vector to play with, one weight per feature')
+	parser.add_argument('--features', nargs='+', default=list(features.DEFAULTFEATURES), choices=list(features.FEATURES),
+						metavar='FEATURE', help='features the weights are for in headless mode (default: %s; known: %s)' % (
+							' '.join(features.DEFAULTFEATURES), ' '.join(features.FEATURES)))
+	parser.add_argument('--depth', type=int, default=DEPTH, choices=[1, 2], help='search depth, 2 looks one piece ahead')
+	parser.add_argument('--table-bits', type=int, default=0, help='keep board scores in a transposition table of 2**N entries')
+	parser.add_argument('--tucks', action='store_true', help='also search placements reached by tucking or sliding under overhangs')
+	parser.add_argument('--phases', action='store_true', help='time every phase of the game loop and report the totals (after every game in the window)')
+	args = parser.parse_args()
+	if len(args.weights) != len(args.features):
+		parser.error('%d weights given for %d features' % (len(args.weights), len(args.features)))
+	if args.games < 1:
+		parser.error('--games has to be at least 1')
+	if args.headless:
+		runHeadless(args.weights, args.games, args.seed, args.max_pieces, args.features, args.depth, args.table_bits,
+					args.tucks, args.phases)
+	elif tuple(args.features) != features.DEFAULTFEATURES:
+		parser.error('the game window only plays with the default features, use --headless')
+	else:
+		ALPHA, BETA, GAMMA, DELTA = args.weights
+		DEPTH = args.depth
+		TUCKS = args.tucks
+		if args.table_bits:
+			TABLE = transposition.TranspositionTable(args.table_bits)
+		if args.phases:
+			PHASESTATS = phases.PhaseStats()
+		main()
@@ -3,430 +3,438 @@
 # http://inventwithpython.com/pygame
 # Released under a "Simplified BSD" license
 
-import random, time, sys, copy, math
+import random, os, argparse
+import engine, features, parallel, distributed, fitnesscache, sequences, racing, transposition, checkpoint, metrics, phases, capping
 from deap import tools, base, creator, algorithms
-import multiprocessing
-
-pool = multiprocessing.Pool()
 
 creator.create("FitnessMax", base.Fitness, weights=(1.0,))
 creator.create("Individual", list, fitness=creator.FitnessMax)
 
-BOARDWIDTH = 10
-BOARDHEIGHT = 20
-BLANK = '.'
-MAXPIECES = 5000
-
-TEMPLATEWIDTH = 5
-TEMPLATEHEIGHT = 5
-
-S_SHAPE_TEMPLATE = [['.....',
-					 '.....',
-					 '..OO.',
-					 '.OO..',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '..OO.',
-					 '...O.',
-					 '.....']]
-
-Z_SHAPE_TEMPLATE = [['.....',
-					 '.....',
-					 '.OO..',
-					 '..OO.',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '.OO..',
-					 '.O...',
-					 '.....']]
-
-I_SHAPE_TEMPLATE = [['..O..',
-					 '..O..',
-					 '..O..',
-					 '..O..',
-					 '.....'],
-					['.....',
-					 '.....',
-					 'OOOO.',
-					 '.....',
-					 '.....']]
-
-O_SHAPE_TEMPLATE = [['.....',
-					 '.....',
-					 '.OO..',
-					 '.OO..',
-					 '.....']]
-
-J_SHAPE_TEMPLATE = [['.....',
-					 '.O...',
-					 '.OOO.',
-					 '.....',
-					 '.....'],
-					['.....',
-					 '..OO.',
-					 '..O..',
-					 '..O..',
-					 '.....'],
-					['.....',
-					 '.....',
-					 '.OOO.',
-					 '...O.',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '..O..',
-					 '.OO..',
-					 '.....']]
-
-L_SHAPE_TEMPLATE = [['.....',
-					 '...O.',
-					 '.OOO.',
-					 '.....',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '..O..',
-					 '..OO.',
-					 '.....'],
-					['.....',
-					 '.....',
-					 '.OOO.',
-					 '.O...',
-					 '.....'],
-					['.....',
-					 '.OO..',
-					 '..O..',
-					 '..O..',
-					 '.....']]
-
-T_SHAPE_TEMPLATE = [['.....',
-					 '..O..',
-					 '.OOO.',
-					 '.....',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '..OO.',
-					 '..O..',
-					 '.....'],
-					['.....',
-					 '.....',
-					 '.OOO.',
-					 '..O..',
-					 '.....'],
-					['.....',
-					 '..O..',
-					 '.OO..',
-					 '..O..',
-					 '.....']]
-
-PIECES = {'S': S_SHAPE_TEMPLATE,
-		  'Z': Z_SHAPE_TEMPLATE,
-		  'J': J_SHAPE_TEMPLATE,
-		  'L': L_SHAPE_TEMPLATE,
-		  'I': I_SHAPE_TEMPLATE,
-		  'O': O_SHAPE_TEMPLATE,
-		  'T': T_SHAPE_TEMPLATE}
-
-def evaluate(individual):
-    score = 0
-    for i in range(0, 10):
-        score += runGame(individual)
-
-    return float(score)/10,
+MAXPIECES = engine.MAXPIECES
+NGAMES = 10 # games played to evaluate each individual
+GAMESEEDS = tuple(range(NGAMES)) # every individual plays the same seeded games
 
-def runGame(individual):
-    # setup variables for the start of the game
-    board = getBlankBoard()
+SEQUENCES = None # piece sequences shared by every game, see loadSequences
+FEATURESET = features.FeatureSet() # features the individuals' weights are for, see setFeatures
+DEPTH = 1 # search depth of the games, 2 looks one piece ahead (see engine.playGame)
+TABLE = None # transposition table of board scores games use, see setTable
+TUCKS = False # whether games also search tucks and slides (see movegen.py)
+TIMEPHASES = False # whether games time the phases of the game loop (see phases.py)
 
+def evaluate(individual, seeds=GAMESEEDS):
     score = 0
-    level, fallFreq = calculateLevelAndFallFreq(score)
-
-    fallingPiece = getNewPiece()
-    nextPiece = getNewPiece()
-
-    pieces = 0
-
-    while True: # game loop
-        if fallingPiece == None:
-            # No falling piece in play, so start a new piece at the top
-            fallingPiece = nextPiece
-            nextPiece = getNewPiece()
-            pieces += 1
-
-            if not isValidPosition(board, fallingPiece) or pieces == MAXPIECES:
-                return score
-
-        possibleBoards = getAllMoves(board, fallingPiece)
-
-        bestBoard = None
-        maxVal = -float("inf")
-        for newBoard in possibleBoards:
-            val = evaluateBoard(newBoard, individual[0], individual[1], individual[2], individual[3])
-            if val > maxVal:
-                maxVal =  val
-                bestBoard = newBoard
-
-        if bestBoard != None:
-            board = bestBoard
-
-        score += removeCompleteLines(board)
-        level, fallFreq = calculateLevelAndFallFreq(score)
-        fallingPiece = None
+    for seed in seeds:
+        score += runGame(individual, seed)
+
+    return float(score)/len(seeds),
+
+# Evaluate a whole population with one task per seed, each playing that
+# seed's game for every individual at once and sharing the work of the
+# placements the individuals have in common (see sharedprefix.py, needs NumPy)
+def evaluateShared(individuals, evaluator, seeds=GAMESEEDS):
+    weights = [list(individual) for individual in individuals]
+    scores = evaluator.playGames([(weights, seed) for seed in seeds])
+
+    return [(float(sum(gameScores[i] for gameScores in scores))/len(seeds),) for i in range(len(individuals))]
+
+# Pre-generate the piece sequences of the given seeds once, or memory-map them
+# from path (writing the file first if it doesn't exist yet). Also used as
+# the worker initializer, so every worker replays the same sequences.
+def loadSequences(seeds=GAMESEEDS, path=None):
+    global SEQUENCES
+
+    if path is not None and os.path.exists(path):
+        SEQUENCES = sequences.PieceSequences.load(path)
+        if SEQUENCES.shapes != ''.join(sorted(engine.PIECES)) or SEQUENCES.length <= MAXPIECES:
+            raise ValueError('%s was generated for different pieces or a lower MAXPIECES' % path)
+    else:
+        SEQUENCES = sequences.PieceSequences.generate(engine.PIECES, seeds, MAXPIECES + 1)
+        if path is not None:
+            SEQUENCES.save(path)
+
+# Choose the features individuals are made of, one weight per feature
+# (see features.py). The individuals generated by the toolbox follow suit.
+def setFeatures(names=features.DEFAULTFEATURES):
+    global FEATURESET
+
+    FEATURESET = features.FeatureSet(names)
+    toolbox.register("individual", tools.initRepeat, creator.Individual, toolbox.attr_float, n=len(FEATURESET))
+
+# Keep board scores in a transposition table of 2 ** bits entries (none if
+# bits is 0). Every process has its own; it is cleared whenever a game is
+# played with other weights than the last one.
+def setTable(bits):
+    global TABLE
+
+    TABLE = transposition.TranspositionTable(bits) if bits else None
+
+# Run once in every worker process, so the workers play the same games with
+# the same features, search depth, table size, move generation and
+# instrumentation as the main process
+def initWorker(seeds, sequencePath, featureNames, depth, tableBits, tucks, timePhases):
+    global DEPTH, TUCKS, TIMEPHASES
+
+    loadSequences(seeds, sequencePath)
+    setFeatures(featureNames)
+    DEPTH = depth
+    setTable(tableBits)
+    TUCKS = tucks
+    TIMEPHASES = timePhases
+
+# Return the piece codes of the game played with seed. Seeds missing from
+# the shared sequences are generated on the spot (the result is the same),
+# and seed None plays random pieces.
+def getSequence(seed):
+    if seed is None:
+        return sequences.generateSequence(random, engine.PIECES, MAXPIECES + 1)
+    if SEQUENCES is not None and seed in SEQUENCES and SEQUENCES.length > MAXPIECES:
+        return SEQUENCES.getSequence(seed)
+    return sequences.generateSequence(random.Random(seed), engine.PIECES, MAXPIECES + 1)
+
+# seed picks the piece sequence played (see getSequence).
+# vectorized=True scores every candidate with the NumPy batch evaluator
+# (batcheval) instead of the scalar getBestMove; both pick the same moves
+def runGame(individual, seed=None, vectorized=False):
+    score, pieces = engine.playGame(individual, getSequence(seed), MAXPIECES, vectorized=vectorized, featureSet=FEATURESET,
+                                    depth=DEPTH, table=TABLE, tucks=TUCKS)
+
+    return score
+
+# The hits and misses the caches games use have counted so far, for
+# addCacheCounters
+def getCacheCounts():
+    tableCounts = (TABLE.hits, TABLE.misses) if TABLE is not None else None
+    return tableCounts, (engine.REACHABLE.hits, engine.REACHABLE.misses)
+
+# Add the hits and misses of the caches in use since getCacheCounts
+# returned counts to a game's counters
+def addCacheCounters(counters, counts):
+    tableCounts, reachableCounts = counts
+    if tableCounts is not None:
+        counters['tableHits'] = TABLE.hits - tableCounts[0]
+        counters['tableMisses'] = TABLE.misses - tableCounts[1]
+    if TUCKS:
+        counters['reachabilityHits'] = engine.REACHABLE.hits - reachableCounts[0]
+        counters['reachabilityMisses'] = engine.REACHABLE.misses - reachableCounts[1]
+
+# runGame for the parallel evaluator: also returns the game's counters, the
+# pieces played, the hits and misses of the caches in use and the phase
+# timings if they are on (see metrics.py)
+def runCountedGame(individual, seed=None):
+    counts = getCacheCounts()
+    phaseStats = phases.PhaseStats() if TIMEPHASES else None
+    score, pieces = engine.playGame(individual, getSequence(seed), MAXPIECES, featureSet=FEATURESET, depth=DEPTH,
+                                    table=TABLE, tucks=TUCKS, phaseStats=phaseStats)
+
+    counters = {'pieces': pieces}
+    if phaseStats is not None:
+        counters.update(phaseStats.getCounters())
+    addCacheCounters(counters, counts)
+    return score, counters
+
+# runCountedGame for capped evaluation: plays the game for at most cap
+# pieces and returns what capping.playCappedGame does, with the games
+# stopped before they ended and the pieces that saved in the counters
+def runCappedGame(individual, seed, cap):
+    counts = getCacheCounts()
+    phaseStats = phases.PhaseStats() if TIMEPHASES else None
+    game = capping.playCappedGame(individual, getSequence(seed), cap, MAXPIECES, featureSet=FEATURESET, depth=DEPTH,
+                                  table=TABLE, tucks=TUCKS, phaseStats=phaseStats)
+    score, pieces, variance, stopped = game
+
+    counters = {'pieces': pieces}
+    if phaseStats is not None:
+        counters.update(phaseStats.getCounters())
+    addCacheCounters(counters, counts)
+    if stopped:
+        counters['stoppedGames'] = 1
+        counters['piecesSkipped'] = MAXPIECES - pieces
+    return game, counters
+
+# The game of one seed for every weight vector, for evaluateShared. Its
+# counters count a game per weight vector.
+def runSharedGame(weights, seed):
+    import sharedprefix # imported here so other workers never load NumPy
+    scores, counters = sharedprefix.playSharedGame(weights, getSequence(seed), MAXPIECES)
+    counters['games'] = len(weights)
+    return scores, counters
 
 def randomInRange():
     return 2*random.random() - 1
 
 toolbox = base.Toolbox()
-toolbox.register("map", pool.map)
 toolbox.register("attr_float", randomInRange)
-toolbox.register("individual", tools.initRepeat, creator.Individual, toolbox.attr_float, n=4)
+toolbox.register("individual", tools.initRepeat, creator.Individual, toolbox.attr_float, n=len(FEATURESET))
 toolbox.register("population", tools.initRepeat, list, toolbox.individual, n=100)
 toolbox.register("evaluate", evaluate)
 toolbox.register("mate", tools.cxOnePoint)
 toolbox.register("mutate", tools.mutGaussian, mu = 0, sigma = 0.5, indpb = 0.2)
 toolbox.register("select", tools.selTournament, tournsize=10)
 
-def main():
+# batched plays all games in one lockstep batched simulation, otherwise the
+# games are spread over a pool of worker processes (all cores by default).
+# Fitnesses are cached for the run, and across runs if cachePath is given.
+# Every individual plays the same numGames piece sequences, memory-mapped from
+# sequencePath if it is given. race stops playing an individual's games once
+# it clearly can't make the selection cutoff (see racing.py). featureNames
+# picks the features the individuals are weights for and depth the search
+# depth games are played at. tableBits sizes the transposition table of board
+# scores (see setTable). tucks also searches tucks and slides under overhangs.
+# With checkpointPath the run is checkpointed every checkpointEvery
+# generations (see checkpoint.py), and resume continues the run saved there.
+# Per-generation metrics are written to metricsPath (see metrics.py), and
+# with profilePath one worker's games are profiled with cProfile. timePhases
+# times the phases of every game and reports them per generation.
+# sharedPrefix plays each seed's game for the whole population at once,
+# scoring the placements individuals share only once (see sharedprefix.py).
+# capStart caps games at that many pieces, doubling the cap every capEvery
+# generations, and stops them early once their rate of clearing lines has
+# converged; fitnesses are extrapolated to MAXPIECES (see capping.py).
+# With coordinator (a (host, port) tuple or a socket path) games are played
+# by worker processes on any machine that connect to it, localWorkers of
+# them started on this one, instead of a local pool (see distributed.py).
+def main(batched=False, workers=None, chunksize=None, cachePath=None, numGames=NGAMES, sequencePath=None, race=False,
+         featureNames=features.DEFAULTFEATURES, depth=1, tableBits=0, tucks=False, checkpointPath=None, resume=False,
+         checkpointEvery=1, metricsPath=None, profilePath=None, timePhases=False, sharedPrefix=False, capStart=None,
+         capEvery=5, coordinator=None, localWorkers=0, authkey=None):
+    global DEPTH, TUCKS, TIMEPHASES
+
+    # nothing is set up until the options are known to work together
+    checkOptions(batched=batched, workers=workers, chunksize=chunksize, race=race, featureNames=featureNames,
+                 depth=depth, tableBits=tableBits, tucks=tucks, checkpointPath=checkpointPath, resume=resume,
+                 checkpointEvery=checkpointEvery, profilePath=profilePath, timePhases=timePhases, sharedPrefix=sharedPrefix, capStart=capStart,
+                 capEvery=capEvery, coordinator=coordinator)
+    setFeatures(featureNames)
+    DEPTH = depth
+    setTable(tableBits)
+    TUCKS = tucks
+    TIMEPHASES = timePhases
+    schedule = capping.CapSchedule(capStart, MAXPIECES, 2, capEvery) if capStart is not None else None
 
     pop = toolbox.population()
 
     CXPB, MUTPB, NGEN = 0.5, 0.2, 40
 
-    print "Evaluating initial population"
-    # Evaluate the entire population
-    fitnesses = map(toolbox.evaluate, pop)
-    for ind, fit in zip(pop, fitnesses):
-        ind.fitness.values = fit
-
-    for g in range(NGEN):
-        print "Generation %i" % (g + 1)
-        print "Generating offspring..."
-        offspring = algorithms.varOr(pop, toolbox, 100, CXPB, MUTPB)
-
-        print "Evaluating offspring..."
-        fitnesses = map(toolbox.evaluate, offspring)
-        for ind, fit in zip(offspring, fitnesses):
-            ind.fitness.values = fit
-
-        pop = toolbox.select(offspring + pop, k = 100)
-        print pop
-
-        fits = [ind.fitness.values[0] for ind in pop]
-        print fits
-
-        length = len(pop)
-        mean = sum(fits) / length
-        sum2 = sum(x*x for x in fits)
-        std = abs(sum2 / length - mean**2)**0.5
-
-        print ""
-        print("Min %s" % min(fits))
-        print("Max %s" % max(fits))
-        print("Avg %s" % mean)
-        print("Std %s" % std)
-
+    seeds = tuple(range(numGames))
+    loadSequences(seeds, sequencePath)
+
+    # the same weights mean something else for another feature set, depth or
+    # move generation
+    context = None
+    if not FEATURESET.isDefault or DEPTH != 1 or TUCKS:
+        context = (FEATURESET.names, DEPTH, TUCKS) if TUCKS else (FEATURESET.names, DEPTH)
+    cache = fitnesscache.FitnessCache(path=cachePath, context=context)
+
+    # a checkpoint can only be resumed by a run that plays the same games
+    # and breeds the same way
+    checkpointer = None
+    start = 0
+    if checkpointPath is not None:
+        config = (FEATURESET.names, DEPTH, TUCKS, seeds, MAXPIECES, race, CXPB, MUTPB)
+        if schedule is not None:
+            config += ((schedule.start, schedule.growth, schedule.every),)
+        checkpointer = checkpoint.Checkpointer(checkpointPath, config, checkpointEvery, cache=cache)
+        if resume and checkpointer.exists():
+            start, saved = checkpointer.load()
+            pop = restorePopulation(saved)
+            print("Resuming from generation %d of %s" % (start, checkpointPath))
+
+    playGame = runCountedGame
+    if sharedPrefix:
+        playGame = runSharedGame
+    elif schedule is not None:
+        playGame = runCappedGame
+    # the batched simulation plays every game in this process, so it gets no
+    # worker pool
+    initargs = (seeds, sequencePath, FEATURESET.names, DEPTH, tableBits, TUCKS, TIMEPHASES)
+    if batched:
+        import batchsim # imported here so workers never load NumPy
+        evaluator = batchsim.BatchedEvaluator(getSequence, engine.PIECECODES, engine.PLACEMENTS, engine.ORIENTATIONS,
+                                              engine.SPAWNX, engine.SPAWNY, MAXPIECES)
+    elif coordinator is not None:
+        evaluator = distributed.Coordinator(playGame, coordinator, initWorker, initargs, localWorkers, authkey)
+        if evaluator.generatedKey:
+            print("Workers connect to the coordinator with --authkey %s" % evaluator.authkey)
+    else:
+        evaluator = parallel.ParallelEvaluator(playGame, workers, chunksize, initWorker, initargs, profilePath)
+    if sharedPrefix:
+        toolbox.register("evaluateGames", evaluateShared, evaluator=evaluator, seeds=seeds)
+    else:
+        toolbox.register("evaluateGames", evaluator.evaluate, seeds=seeds)
+
+    racer = None
+    capper = None
+    if race:
+        racer = racing.RacingEvaluator(evaluator.playGames, seeds, cache=cache, maxPieces=MAXPIECES)
+        toolbox.register("evaluatePopulation", racer.evaluate)
+    elif schedule is not None:
+        capper = capping.CappedEvaluator(evaluator.playGames, seeds, schedule, cache)
+        capper.setGeneration(start)
+        toolbox.register("evaluatePopulation", capper.evaluate)
+    else:
+        toolbox.register("evaluatePopulation", cache.evaluate, evaluatePopulation=toolbox.evaluateGames,
+                         seeds=seeds, maxPieces=MAXPIECES)
+
+    writer = metrics.MetricsWriter(metricsPath) if metricsPath is not None else None
+    recorder = metrics.GenerationRecorder(writer, evaluator, cache, racer, capper)
+    try:
+        with evaluator:
+            pop = evolve(pop, CXPB, MUTPB, NGEN, racer, checkpointer, start, recorder, capper)
+    finally:
+        if writer is not None:
+            writer.close()
+        # the fitnesses found so far hold even if the run failed
+        cache.save()
 
     return pop
 
+# Raise ValueError if main's options (the ones it takes, others are ignored)
+# can't be used together
+def checkOptions(batched=False, workers=None, chunksize=None, race=False, featureNames=features.DEFAULTFEATURES, depth=1,
+                 tableBits=0, tucks=False, checkpointPath=None, resume=False, checkpointEvery=1, profilePath=None,
+                 timePhases=False, sharedPrefix=False, capStart=None, capEvery=5, coordinator=None, **others):
+    defaultSearch = tuple(featureNames) == features.DEFAULTFEATURES and depth == 1 and not tucks
+    if resume and checkpointPath is None:
+        raise ValueError('resuming needs a checkpoint')
+    if checkpointEvery < 1:
+        raise ValueError('checkpoints can be written every 1 or more generations, not every %d' % checkpointEvery)
+    if batched and not defaultSearch:
+        raise ValueError('the batched simulation only supports column drops with the default features at depth 1')
+    if batched and race:
+        raise ValueError('racing plays its games on the workers, not in the batched simulation')
+    if batched and (workers is not None or chunksize is not None or profilePath is not None or timePhases):
+        raise ValueError('the batched simulation plays in this process, without workers, profiling or phase timing')
+    if sharedPrefix and (batched or race or not defaultSearch):
+        raise ValueError('shared-prefix evaluation only supports column drops with the default features at depth 1, '
+                         'without batching or racing')
+    if sharedPrefix and (timePhases or tableBits):
+        raise ValueError('shared-prefix games don\'t time their phases or use a transposition table')
+    if capStart is not None and (capStart < 1 or capEvery < 1):
+        raise ValueError('capped games need a cap of at least 1 piece, doubled every 1 or more generations')
+    if capStart is not None and (batched or race or sharedPrefix):
+        raise ValueError('capped evaluation can\'t be combined with batching, racing or shared prefixes')
+    if coordinator is not None and (batched or profilePath is not None):
+        raise ValueError('distributed evaluation can\'t be combined with batching or profiling')
+
+# Individuals from the (weights, fitness values) pairs of a checkpoint
+def restorePopulation(saved):
+    pop = []
+    for weights, fitness in saved:
+        ind = creator.Individual(weights)
+        ind.fitness.values = fitness
+        pop.append(ind)
+    return pop
 
-def evaluateBoard(board, a, b, c, d):
-    aggHeight, heights = getAggregateHeight(board)
-    completeLines = getCompleteLines(board)
-    holes = getNumHoles(board)
-    bumpiness = getBumpiness(heights)
-
-    return a * aggHeight + b * completeLines + c * holes + d * bumpiness
-
-
-def getAggregateHeight(board):
-    aggregateHeight = 0
-    heights = []
-
-    for i in range(BOARDWIDTH):
-        colHeight = 0
-
-        for j in range(BOARDHEIGHT):
-            if board[i][j] != BLANK:
-                colHeight = BOARDHEIGHT - j
-                break
-
-        heights.append(colHeight)
-        aggregateHeight += colHeight
-
-    return aggregateHeight, heights
-
-def getNumHoles(board):
-    holes = 0
-
-    for i in range(BOARDWIDTH):
-        foundBlock = False
-        for j in range(BOARDHEIGHT):
-            if board[i][j] != BLANK:
-                foundBlock = True
-            elif foundBlock == True:
-                holes += 1
-
-    return holes
-
-def getBumpiness(heights):
-    bumpiness = 0
-
-    for i in range(1, BOARDWIDTH):
-        bumpiness += abs(heights[i] - heights[i-1])
-
-    return bumpiness
-
-
-def getCompleteLines(board):
-    numCompleteLines = 0
-
-    for y in range(BOARDHEIGHT):
-        if isCompleteLine(board, y):
-            numCompleteLines += 1
-
-    return numCompleteLines
 
+# start is the number of generations already done, by the run a population
+# was checkpointed from. A population that has its fitnesses (one restored
+# from a checkpoint) isn't evaluated again.
+# recorder (a metrics.GenerationRecorder) measures every generation; its
+# records are also printed. With capper (a capping.CappedEvaluator) the
+# population is evaluated again whenever the piece cap grows.
+def evolve(pop, CXPB, MUTPB, NGEN, racer=None, checkpointer=None, start=0, recorder=None, capper=None):
+    if recorder is None:
+        recorder = metrics.GenerationRecorder()
+
+    if not all(ind.fitness.valid for ind in pop):
+        print("Evaluating initial population")
+        recorder.start()
+        # Evaluate the entire population
+        fitnesses = toolbox.evaluatePopulation(pop)
+        for ind, fit in zip(pop, fitnesses):
+            ind.fitness.values = fit
+        if capper is not None:
+            print(capper.getSummary())
+        print(metrics.formatRecord(recorder.finish(0, pop, len(pop))))
+        if recorder.phaseStats is not None:
+            print(recorder.phaseStats.format())
+        if checkpointer is not None:
+            checkpointer.save(0, pop)
+
+    for g in range(start, NGEN):
+        recorder.start()
+        if capper is not None and capper.setGeneration(g + 1):
+            # fitnesses extrapolated from a shorter cap aren't comparable
+            print("Piece cap raised to %d, evaluating the population again" % capper.cap)
+            fitnesses = toolbox.evaluatePopulation(pop)
+            for ind, fit in zip(pop, fitnesses):
+                ind.fitness.values = fit
+        offspring = algorithms.varOr(pop, toolbox, 100, CXPB, MUTPB)
 
-def calculateLevelAndFallFreq(score):
-	# Based on the score, return the level the player is on and
-	# how many seconds pass until a falling piece falls one space.
-	level = int(score / 10) + 1
-	fallFreq = 0.27 - (level * 0.02)
-	return level, fallFreq
+        if racer is not None:
+            racer.updateCutoff(pop)
+        # clones made by varOr keep their parent's fitness
+        invalid = [ind for ind in offspring if not ind.fitness.valid]
+        fitnesses = toolbox.evaluatePopulation(invalid)
+        for ind, fit in zip(invalid, fitnesses):
+            ind.fitness.values = fit
+        if racer is not None:
+            print(racer.getSummary())
+        if capper is not None:
+            print(capper.getSummary())
 
+        pop = toolbox.select(offspring + pop, k = 100)
+        print(metrics.formatRecord(recorder.finish(g + 1, pop, len(invalid))))
+        if recorder.phaseStats is not None:
+            print(recorder.phaseStats.format())
 
-def getNewPiece():
-	# return a random new piece in a random rotation
-	shape = random.choice(list(PIECES.keys()))
-	newPiece = {'shape': shape,
-				'rotation': random.randint(0, len(PIECES[shape]) - 1),
-				'x': int(BOARDWIDTH / 2) - int(TEMPLATEWIDTH / 2),
-				'y': -2, # start it above the board (i.e. less than 0)
-				'color': random.randint(0, 3)}
-	return newPiece
+        if checkpointer is not None:
+            checkpointer.save(g + 1, pop, force=g + 1 == NGEN)
 
+    if checkpointer is not None:
+        checkpointer.wait()
 
-def addToBoard(board, piece):
-	# fill in the board based on piece's location, shape, and rotation
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			if PIECES[piece['shape']][piece['rotation']][y][x] != BLANK:
-				board[x + piece['x']][y + piece['y']] = piece['color']
-				if x + piece['x'] < 0 or y + piece['y'] < 0:
-					return False
-	return True
-
-
-def getBlankBoard():
-	# create and return a new blank board data structure
-	board = []
-	for i in range(BOARDWIDTH):
-		board.append([BLANK] * BOARDHEIGHT)
-	return board
-
-
-def isOnBoard(x, y):
-	return x >= 0 and x < BOARDWIDTH and y < BOARDHEIGHT
-
-
-def isValidPosition(board, piece, adjX=0, adjY=0):
-	# Return True if the piece is within the board and not colliding
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			isAboveBoard = y + piece['y'] + adjY < 0
-			if isAboveBoard or PIECES[piece['shape']][piece['rotation']][y][x] == BLANK:
-				continue
-			if not isOnBoard(x + piece['x'] + adjX, y + piece['y'] + adjY):
-				return False
-			if board[x + piece['x'] + adjX][y + piece['y'] + adjY] != BLANK:
-				return False
-	return True
-
-
-def isInRange(piece, adjX=0, adjY=0):
-	# Return True if the piece is within the board, disregards collisions
-	for x in range(TEMPLATEWIDTH):
-		for y in range(TEMPLATEHEIGHT):
-			isAboveBoard = y + piece['y'] + adjY < 0
-			if isAboveBoard or PIECES[piece['shape']][piece['rotation']][y][x] == BLANK:
-				continue
-			if not isOnBoard(x + piece['x'] + adjX, y + piece['y'] + adjY):
-				return False
-	return True
-
-
-# this method isn't perfect, as it fails with overhangs. The learners should not create these situations though
-def getAllMoves(board, piece):
-	def dropPiece(board, piece):
-		i = 1
-		while isValidPosition(board, piece, adjY=i):
-			i+=1
-		piece['y'] += i-1
-
-	boardList = []
-
-	numRotations = len(PIECES[piece['shape']])
-	currRotPiece = copy.copy(piece)
-
-	for rot in range(numRotations):
-		currRotPiece['rotation'] = (currRotPiece['rotation'] + 1) % len(PIECES[currRotPiece['shape']])
-
-		xshift = 0
-		while True:
-			if not isInRange(currRotPiece, adjX = xshift) and xshift > 0:
-				break
-			currXShiftPiece = copy.deepcopy(currRotPiece)
-			currXShiftPiece['x'] += xshift
-			if isValidPosition(board, currXShiftPiece):
-				dropPiece(board, currXShiftPiece)
-
-				currBoard = copy.deepcopy(board)
-				if addToBoard(currBoard, currXShiftPiece):
-					boardList.append(currBoard)
-			# left first
-			if xshift <= 0:
-				xshift -= 1
-			else:
-				xshift += 1
-
-			if not isInRange(currRotPiece, adjX = xshift) and xshift <= 0:
-				xshift = 1
-
-	return boardList
-
-
-def isCompleteLine(board, y):
-	# Return True if the line filled with boxes with no gaps.
-	for x in range(BOARDWIDTH):
-		if board[x][y] == BLANK:
-			return False
-	return True
-
-
-def removeCompleteLines(board):
-	# Remove any completed lines on the board, move everything above them down, and return the number of complete lines.
-	numLinesRemoved = 0
-	y = BOARDHEIGHT - 1 # start y at the bottom of the board
-	while y >= 0:
-		if isCompleteLine(board, y):
-			# Remove the line and pull boxes down by one line.
-			for pullDownY in range(y, 0, -1):
-				for x in range(BOARDWIDTH):
-					board[x][pullDownY] = board[x][pullDownY-1]
-			# Set very top line to blank.
-			for x in range(BOARDWIDTH):
-				board[x][0] = BLANK
-			numLinesRemoved += 1
-			# Note on the next iteration of the loop, y is the same.
-			# This is so that if the line that was pulled down is also
-			# complete, it will be removed.
-		else:
-			y -= 1 # move on to check next row up
-	return numLinesRemoved
+    return pop
 
 
 if __name__ == '__main__':
-	main()
+	# every option is stored under the name of the main argument it is for
+	parser = argparse.ArgumentParser(description='Train Tetris weight vectors with a genetic algorithm')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes to play games in (default: all cores)')
+	parser.add_argument('--chunksize', type=int, default=None, help='games handed to a worker at a time')
+	parser.add_argument('--batched', action='store_true', help='play all games in one lockstep batched simulation (needs NumPy)')
+	parser.add_argument('--cache', dest='cachePath', default=None, help='file to keep the fitness cache in between runs')
+	parser.add_argument('--games', dest='numGames', type=int, default=NGAMES, help='games played to evaluate each individual')
+	parser.add_argument('--sequences', dest='sequencePath', default=None,
+						help='file to memory-map the piece sequences from (written if missing)')
+	parser.add_argument('--racing', dest='race', action='store_true',
+						help='stop evaluating individuals that clearly miss the selection cutoff')
+	parser.add_argument('--features', dest='featureNames', nargs='+', default=list(features.DEFAULTFEATURES),
+						choices=list(features.FEATURES), metavar='FEATURE',
+						help='features the weights are for (default: %s; known: %s)' % (
+							' '.join(features.DEFAULTFEATURES), ' '.join(features.FEATURES)))
+	parser.add_argument('--depth', type=int, default=1, choices=[1, 2], help='search depth, 2 looks one piece ahead')
+	parser.add_argument('--table-bits', dest='tableBits', type=int, default=0,
+						help='keep board scores in a transposition table of 2**N entries')
+	parser.add_argument('--tucks', action='store_true', help='also search placements reached by tucking or sliding under overhangs')
+	parser.add_argument('--checkpoint', dest='checkpointPath', default=None,
+						help='file to checkpoint the run to after every generation')
+	parser.add_argument('--checkpoint-every', dest='checkpointEvery', type=int, default=1, metavar='N',
+						help='only checkpoint every N generations')
+	parser.add_argument('--resume', action='store_true', help='continue the run saved in the --checkpoint file, if there is one')
+	parser.add_argument('--metrics', dest='metricsPath', default=None,
+						help='file to write per-generation metrics to (JSON lines, CSV if it ends in .csv)')
+	parser.add_argument('--profile', dest='profilePath', default=None,
+						help='profile one worker with cProfile and write the stats to this file')
+	parser.add_argument('--phases', dest='timePhases', action='store_true',
+						help='time the phases of every game and report them per generation')
+	parser.add_argument('--shared-prefix', dest='sharedPrefix', action='store_true',
+						help='play every seed for the whole population at once, scoring shared placements once (needs NumPy)')
+	parser.add_argument('--cap-start', dest='capStart', type=int, default=None, metavar='PIECES',
+						help='cap games at PIECES, doubling the cap up to the game length, stop converged games early '
+							 'and extrapolate their scores')
+	parser.add_argument('--cap-every', dest='capEvery', type=int, default=5, metavar='N',
+						help='double the --cap-start cap every N generations')
+	parser.add_argument('--coordinator', type=distributed.parseAddress, default=None, metavar='ADDRESS',
+						help='play the games on workers that connect to HOST:PORT or a Unix socket path (see distributed.py)')
+	parser.add_argument('--local-workers', dest='localWorkers', type=int, default=0, metavar='N',
+						help='with --coordinator, also start N workers on this machine')
+	parser.add_argument('--authkey', default=None,
+						help='with --coordinator, key shared with the workers (default: $%s, or a random one printed '
+							 'for a local address)' % distributed.AUTHKEYVARIABLE)
+	options = vars(parser.parse_args())
+	try:
+		checkOptions(**options)
+	except ValueError as e:
+		parser.error(e)
+	main(**options)
@@ -0,0 +1,89 @@
+# Transposition table of board evaluations.
+#
+# The same board is often scored more than once: the depth-2 search scores
+# every placement of the next piece on the boards the falling piece can
+# leave, and one move later the first level of the search scores those
+# same boards again. TranspositionTable remembers the scores of one weight
+# vector in a fixed number of slots, so it never grows however long the game.
+#
+# Boards are keyed by Zobrist hashing over whole rows: every (row, row
+# contents) pair has a random 64-bit key and a board's hash is the XOR of
+# the keys of its rows. The hash of a candidate board then follows from the
+# current board's hash by swapping the keys of the few rows the piece covers,
+# without building the board.
+
+import random
+
+from bitboard import BOARDWIDTH, BOARDHEIGHT
+from hitcount import HitCounter
+
+keyRng = random.Random(0) # fixed, so hashes are the same in every process
+ZOBRIST = [[keyRng.getrandbits(64) for i in range(1 << BOARDWIDTH)] for y in range(BOARDHEIGHT)]
+
+# keys mixed in for the parts of a search that aren't board rows: the piece
+# (of the seven tetrominoes) a stored value is for, and where the last piece
+# landed for feature sets that depend on it (landingHeight)
+PIECEKEYS = dict(((shape, rotation), keyRng.getrandbits(64)) for shape in 'IJLOSTZ' for rotation in range(4))
+LANDINGKEYS = [keyRng.getrandbits(64) for i in range(BOARDHEIGHT * BOARDHEIGHT)]
+del keyRng
+
+
+def hashRows(rows):
+	boardHash = 0
+	for y in range(BOARDHEIGHT):
+		boardHash ^= ZOBRIST[y][rows[y]]
+	return boardHash
+
+
+def getPlacementHash(boardHash, rows, pieceMask, px, py):
+	# hash of the board (with the given rows and hash) after placing the
+	# piece at (px, py)
+	for ty, mask in pieceMask[0]:
+		y = py + ty
+		row = rows[y]
+		keys = ZOBRIST[y]
+		boardHash ^= keys[row] ^ keys[row | (mask << px if px >= 0 else mask >> -px)]
+	return boardHash
+
+
+class TranspositionTable(HitCounter):
+
+	# 2 ** bits slots; a new entry replaces whatever was in its slot
+	def __init__(self, bits=16):
+		self.size = 1 << bits
+		self.mask = self.size - 1
+		self.keys = [None] * self.size
+		self.values = [None] * self.size
+		self.owner = None
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return self.size - self.keys.count(None)
+
+	def setWeights(self, weights, featureSet=None, tucks=False):
+		# Scores are only valid for the weights (and feature set, and whether
+		# tucks were searched) they were worked out with, so the table is
+		# cleared when those change
+		owner = (tuple(weights), None if featureSet is None else featureSet.names, tucks)
+		if owner != self.owner:
+			self.clear()
+			self.owner = owner
+
+	def clear(self):
+		self.keys = [None] * self.size
+		self.values = [None] * self.size
+
+	def get(self, key):
+		# Return the stored value, or None if it isn't known
+		i = key & self.mask
+		if self.keys[i] == key:
+			self.hits += 1
+			return self.values[i]
+		self.misses += 1
+		return None
+
+	def put(self, key, value):
+		i = key & self.mask
+		self.keys[i] = key
+		self.values[i] = value